@@ -0,0 +1,112 @@
+"""
+Compares the chunk delivery policies of TrignoSDKClient.add_chunk_callback.
+
+For each policy, prints the CPU time spent per second of acquired data and
+the delivery latency of the oldest sample of each block (the time it waited
+for its block to complete). Without `--addr`, a 16 channel EMG stream of
+27-sample frames is replayed from memory with the frame arrival times
+simulated, so only the cost of the policy itself is measured. With `--addr`,
+every policy is attached at once to a live session and latencies are
+measured against the drift-corrected production time of the samples.
+
+Use `-h` or `--help` for options.
+"""
+
+import argparse
+import statistics
+import time
+
+import numpy as np
+
+try:
+    import pytrigno
+except ImportError:
+    import sys
+    sys.path.insert(0, '..')
+    import pytrigno
+
+from pytrigno.chunking import ChunkPolicy, Rechunker
+from pytrigno.topology import FRAME_INTERVAL
+
+POLICIES = {
+    "device frames": {},
+    "batch 1": {"batch_samples": 1},
+    "batch 10": {"batch_samples": 10},
+    "batch 100": {"batch_samples": 100},
+    "batch 2000": {"batch_samples": 2000},
+    "latency 50 ms": {"latency": 0.05},
+    "latency 500 ms": {"latency": 0.5},
+}
+
+
+def offline(duration, n_channels=16, frame_samples=27):
+    rate = frame_samples / FRAME_INTERVAL
+    n_frames = int(duration / FRAME_INTERVAL)
+    raw = np.random.default_rng(0).normal(0, 1e-3, (n_frames, frame_samples, n_channels)).astype('<f4')
+    frames = [bytearray(frame.tobytes()) for frame in raw]
+    for name, policy in POLICIES.items():
+        latencies = []
+        arrival = [0.]
+
+        def _deliver(data, first_sample):
+            latencies.append(arrival[0] - first_sample / rate)
+
+        if policy:
+            batch = policy.get("batch_samples") or max(1, int(policy["latency"] / FRAME_INTERVAL)) * frame_samples
+            push = Rechunker(n_channels, batch, _deliver).push
+        else:
+            push = _deliver
+        cpu = time.process_time()
+        for k, packet in enumerate(frames):
+            arrival[0] = (k + 1) * FRAME_INTERVAL
+            # Same decoding as TrignoSDKClient.decode
+            data = np.frombuffer(packet, dtype='<f4').reshape((-1, n_channels)).T
+            push(data, k * frame_samples)
+        cpu = time.process_time() - cpu
+        report(name, cpu / (n_frames * FRAME_INTERVAL), latencies)
+
+
+def live(host, duration):
+    client = pytrigno.TrignoSDKClient(host=host)
+    latencies = {name: [] for name in POLICIES}
+    cpu = {name: 0. for name in POLICIES}
+
+    for name, policy in POLICIES.items():
+        def _consume(stream, data, first_sample, name=name):
+            latencies[name].append(time.monotonic() - float(client.get_host_time(stream, first_sample)))
+        # Wrap the policy to time it, callbacks run one after the other in the reader threads.
+        if policy:
+            consumer = ChunkPolicy(_consume, **policy).bind(client)
+        else:
+            consumer = _consume
+
+        def _timed(stream, data, first_sample, name=name, consumer=consumer):
+            t0 = time.thread_time()
+            consumer(stream, data, first_sample)
+            cpu[name] += time.thread_time() - t0
+        client.add_chunk_callback(_timed)
+    client.start_streaming()
+    time.sleep(duration)
+    client.disconnect()
+    for name in POLICIES:
+        report(name, cpu[name] / duration, latencies[name])
+
+
+def report(name, cpu_per_second, latencies):
+    print(f"{name:<16} {len(latencies):>8} blocks {cpu_per_second * 1e3:8.3f} ms cpu/s   "
+          f"latency mean {statistics.fmean(latencies) * 1e3:7.2f} ms  max {max(latencies) * 1e3:7.2f} ms")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('-a', '--addr', dest='host', default=None,
+                        help="IP address of the machine running TCU. Default is an offline replay.")
+    parser.add_argument('-d', '--duration', type=float, default=60.,
+                        help="Seconds of data per policy. Default is 60.")
+    args = parser.parse_args()
+
+    if args.host is None:
+        offline(args.duration)
+    else:
+        live(args.host, args.duration)
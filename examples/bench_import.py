@@ -0,0 +1,59 @@
+"""
+Measures the import time of pytrigno in fresh interpreters.
+
+``import pytrigno`` alone must stay cheap for short-lived helper scripts: it
+should not import numpy nor the socket based clients. The first access to a
+public class pays for the submodule it lives in.
+
+Use `-h` or `--help` for options.
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+try:
+    import pytrigno
+except ImportError:
+    sys.path.insert(0, '..')
+    import pytrigno
+
+CASES = {
+    "import pytrigno": "import pytrigno",
+    "pytrigno.EMGAvantiMode": "import pytrigno; pytrigno.EMGAvantiMode",
+    "pytrigno.TrignoSDKClient": "import pytrigno; pytrigno.TrignoSDKClient",
+    "pytrigno.TrignoEMG": "import pytrigno; pytrigno.TrignoEMG",
+}
+
+PACKAGE_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(pytrigno.__file__)))
+TIMER = ("import time; t0 = time.perf_counter(); {}; t1 = time.perf_counter(); "
+         "import sys; print(t1 - t0, 'numpy' in sys.modules)")
+
+
+def time_case(statement, repeat):
+    times = []
+    loads_numpy = False
+    env = dict(os.environ, PYTHONPATH=PACKAGE_ROOT)
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, '-c', TIMER.format(statement)], capture_output=True, text=True,
+                             check=True, env=env).stdout.split()
+        times.append(float(out[0]))
+        loads_numpy = out[1] == 'True'
+    return statistics.median(times), loads_numpy
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('-n', '--repeat', type=int, default=10,
+                        help="Number of interpreters started per case. Default is 10.")
+    args = parser.parse_args()
+
+    for name, statement in CASES.items():
+        median, loads_numpy = time_case(statement, args.repeat)
+        print(f"{name:<28} {median * 1e3:8.2f} ms   numpy loaded: {loads_numpy}")
+
+    median, loads_numpy = time_case(CASES["import pytrigno"], args.repeat)
+    assert not loads_numpy, "import pytrigno must not import numpy"
@@ -0,0 +1,102 @@
+"""
+Compares the throughput of the legacy TrignoEMG/TrignoAccel/TrignoIM API
+before and after it was rebuilt on the TrignoSDKClient engine.
+
+"before" replays the previous implementation of ``read()``, which opened a
+new data connection for every call, concatenated the received segments,
+decoded them with struct.unpack into float64 and then selected and scaled
+the rows;
+"after" uses the current classes, fed by the reader thread of the shared
+engine. For every reader, prints the reads and samples per second, the CPU
+time per second of acquisition (all threads of the process) and the mean
+and worst read latency. Requires a TCU (or a compatible server) streaming.
+
+Use `-h` or `--help` for options.
+"""
+
+import argparse
+import socket
+import statistics
+import struct
+import time
+
+import numpy
+
+try:
+    import pytrigno
+except ImportError:
+    import sys
+    sys.path.insert(0, '..')
+    import pytrigno
+
+READERS = {
+    # name: (class, data port, total channels, channel range, samples per read,
+    #        rows and scaler applied by the previous read(), None for no scaling)
+    "TrignoEMG": (pytrigno.TrignoEMG, 50043, 16, (0, 0), 270, slice(None), 1.),
+    "TrignoAccel": (pytrigno.TrignoAccel, 50042, 48, (0, 2), 10, slice(0, 3), None),
+    "TrignoIM": (pytrigno.TrignoIM, 50044, 144, (0, 9), 10, slice(0, 9), None),
+}
+
+
+def command(host, text, cmd_port=50040):
+    with socket.create_connection((host, cmd_port), 10.) as sock:
+        sock.recv(1024)
+        sock.sendall(bytes(f"{text}\r\n\r\n", encoding='ascii'))
+        sock.recv(128)
+
+
+def before(host, data_port, total_channels, num_samples, rows, scaler, timeout=10.):
+    """One read of the previous implementation."""
+    sock = socket.create_connection((host, data_port), timeout)
+    l_des = num_samples * total_channels * 4
+    packet = bytes()
+    while len(packet) < l_des:
+        packet += sock.recv(l_des - len(packet))
+    sock.close()
+    data = numpy.asarray(struct.unpack('<' + 'f' * total_channels * num_samples, packet))
+    data = numpy.transpose(data.reshape((-1, total_channels)))[rows]
+    return data if scaler is None else scaler * data
+
+
+def run(read, duration):
+    latencies = []
+    n_samples = 0
+    cpu = time.process_time()
+    end = time.monotonic() + duration
+    while time.monotonic() < end:
+        t0 = time.monotonic()
+        data = read()
+        latencies.append(time.monotonic() - t0)
+        n_samples += data.shape[1]
+    cpu = time.process_time() - cpu
+    return len(latencies) / duration, n_samples / duration, cpu / duration, latencies
+
+
+def report(name, reads, samples, cpu, latencies):
+    print(f"{name:<20} {reads:8.1f} reads/s {samples:10.1f} samples/s {cpu * 1e3:8.2f} ms cpu/s   "
+          f"latency mean {statistics.fmean(latencies) * 1e3:7.2f} ms  max {max(latencies) * 1e3:7.2f} ms")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('-a', '--addr', dest='host', default='localhost',
+                        help="IP address of the machine running TCU. Default is localhost.")
+    parser.add_argument('-d', '--duration', type=float, default=10.,
+                        help="Seconds of acquisition per reader and implementation. Default is 10.")
+    parser.add_argument('-n', '--samples', type=int, default=None,
+                        help="Samples per read. Default is 270 for EMG and 10 for aux data.")
+    args = parser.parse_args()
+
+    for name, (cls, port, total_channels, channel_range, num_samples, rows, scaler) in READERS.items():
+        num_samples = args.samples or num_samples
+
+        command(args.host, 'START')
+        report(f"{name} before", *run(lambda: before(args.host, port, total_channels, num_samples, rows, scaler),
+                                       args.duration))
+        command(args.host, 'STOP')
+
+        dev = cls(channel_range=channel_range, samples_per_read=num_samples, host=args.host)
+        dev.start()
+        report(f"{name} after", *run(dev.read, args.duration))
+        dev.stop()
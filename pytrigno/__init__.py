@@ -1 +1,53 @@
-from .streaming import TrignoEMG, TrignoAccel, TrignoIM, TrignoSDKClient
\ No newline at end of file
+"""
+Python interface to the Delsys Trigno wireless EMG system.
+
+Submodules are imported on first attribute access, so ``import pytrigno``
+does not load numpy nor open any socket until a class is actually used.
+"""
+
+import importlib
+
+_LAZY_ATTRIBUTES = {
+    "TrignoSDKClient": "sdk_client",
+    "TrignoEMG": "streaming",
+    "TrignoAccel": "streaming",
+    "TrignoIM": "streaming",
+    "Sensor": "sensor",
+    "Topology": "topology",
+    "SensorLayout": "topology",
+    "Type": "topology",
+    "FrameValidator": "integrity",
+    "TriggerGate": "trigger",
+    "PreviewStream": "preview",
+    "ArchiveWriter": "archive",
+    "ArchiveReader": "archive",
+    "SessionIndex": "session_index",
+    "DriftEstimator": "clock",
+    "OrientationFilter": "orientation",
+    "RelayServer": "relay",
+    "RelayClient": "relay",
+    "ChunkPolicy": "chunking",
+    "QualityMonitor": "quality",
+    "SpillFile": "history",
+    "AvantiSensor": "enums",
+    "LegacySensor": "enums",
+    "SensorType": "enums",
+    "EMGAvantiMode": "avanti_mode_enum",
+    "GoniometerMode": "gognio_mode_enum",
+}
+
+__all__ = list(_LAZY_ATTRIBUTES)
+
+
+def __getattr__(name):
+    if name not in _LAZY_ATTRIBUTES:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    module = importlib.import_module(f".{_LAZY_ATTRIBUTES[name]}", __name__)
+    value = getattr(module, name)
+    # Cache on the package so later lookups skip __getattr__.
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
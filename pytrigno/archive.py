@@ -0,0 +1,339 @@
+import bisect
+import json
+import lzma
+import struct
+import threading
+import zlib
+
+import numpy as np
+
+from .integrity import EMG_RANGE
+from .session_index import SessionIndex
+
+
+MAGIC = b'PYTRIGNO'
+VERSION = 1
+# magic, version
+HEADER = struct.Struct('<8sH')
+# index offset, index length, magic
+FOOTER = struct.Struct('<QQ8s')
+CODECS = {"zlib": (zlib.compress, zlib.decompress),
+          "lzma": (lzma.compress, lzma.decompress),
+          }
+
+
+def shuffle(words):
+    """Group the bytes of a 1d integer array by significance, so slowly varying high bytes compress well."""
+    return words.view(np.uint8).reshape((-1, words.itemsize)).T.tobytes()
+
+
+def unshuffle(raw, dtype):
+    dtype = np.dtype(dtype)
+    return np.frombuffer(raw, dtype=np.uint8).reshape((dtype.itemsize, -1)).T.copy().view(dtype).ravel()
+
+
+class StreamInfo:
+    """
+    Description of one archived stream.
+
+    Parameters
+    ----------
+    name : str
+        Name of the stream, e.g. 'sensor3_emg'.
+    n_channels : int
+        Number of channels.
+    rate : float
+        Sampling rate in Hz.
+    quantize : float, optional
+        If set, samples are stored as int16 over [-quantize, quantize] (lossy),
+        otherwise float32 words are stored losslessly.
+    """
+
+    def __init__(self, name, n_channels, rate, quantize=None):
+        self.name = name
+        self.n_channels = n_channels
+        self.rate = rate
+        self.quantize = quantize
+        self.n_samples = 0
+        # One entry per chunk: first sample, number of samples, then (offset, length) of every channel
+        self.chunks = []
+
+    @property
+    def scale(self):
+        return self.quantize / np.iinfo(np.int16).max
+
+    def encode(self, channel, compress):
+        """Delta + shuffle + compress one channel of a chunk."""
+        if self.quantize is None:
+            words = np.ascontiguousarray(channel, dtype='<f4').view('<u4')
+        else:
+            words = np.clip(np.round(channel / self.scale), -32767, 32767).astype('<i2').view('<u2')
+        # Unsigned integers wrap around, so the delta is exactly reversible.
+        delta = np.diff(words, prepend=words.dtype.type(0))
+        return compress(shuffle(delta))
+
+    def decode(self, raw, decompress):
+        dtype = '<u4' if self.quantize is None else '<u2'
+        words = np.cumsum(unshuffle(decompress(raw), dtype), dtype=dtype)
+        if self.quantize is None:
+            return words.view('<f4')
+        return words.view('<i2') * np.float32(self.scale)
+
+    def to_dict(self):
+        return {"name": self.name, "n_channels": self.n_channels, "rate": self.rate, "quantize": self.quantize,
+                "n_samples": self.n_samples, "chunks": self.chunks}
+
+    @classmethod
+    def from_dict(cls, values):
+        info = cls(values["name"], values["n_channels"], values["rate"], values["quantize"])
+        info.n_samples = values["n_samples"]
+        info.chunks = values["chunks"]
+        return info
+
+
+class ArchiveWriter:
+    """
+    Chunked, per-channel compressed archive of recorded streams.
+
+    Samples appended with ``write`` are buffered per stream and flushed every
+    ``chunk_samples`` samples. Each channel of a chunk is delta encoded, byte
+    shuffled and compressed on its own, and the chunk index written on
+    ``close`` lets ArchiveReader decompress only the chunks and channels of a
+    requested sample range.
+
+    Parameters
+    ----------
+    path : str
+        File to create.
+    codec : {'zlib', 'lzma'}, optional
+        Standard library compressor used for every chunk.
+    chunk_samples : int, optional
+        Number of samples per channel in a chunk.
+
+    Attributes
+    ----------
+    index : SessionIndex
+        Time index of the streams, saved with the chunk index.
+    """
+
+    def __init__(self, path, codec="zlib", chunk_samples=8192):
+        if codec not in CODECS:
+            raise ValueError(f"Unknown codec {codec!r}, expected one of {list(CODECS)}.")
+        self.path = path
+        self.codec = codec
+        self.chunk_samples = chunk_samples
+        self.streams = {}
+        self.metadata = {}
+        self.index = SessionIndex(anchor_interval=chunk_samples)
+        self._pending = {}
+        self._n_pending = {}
+        self._compress = CODECS[codec][0]
+        self._lock = threading.Lock()
+        self._file = open(path, 'wb')
+        self._file.write(HEADER.pack(MAGIC, VERSION))
+
+    def add_stream(self, name, n_channels, rate, quantize=None):
+        """Declare a stream before writing to it. ``quantize`` is the full scale of the int16 mode."""
+        self.streams[name] = StreamInfo(name, n_channels, rate, quantize)
+        self.index.add_stream(name, rate)
+        self._pending[name] = np.empty((n_channels, self.chunk_samples), dtype=np.float32)
+        self._n_pending[name] = 0
+        return self.streams[name]
+
+    def add_sensor_streams(self, topology, quantize_emg=False, subscription=None):
+        """
+        Declare the EMG and aux streams of every paired sensor of a Topology as 'sensor<i>_emg/aux'.
+        :param subscription: set of (sensor index, 'emg' or 'aux') to declare, every stream if None
+        """
+        for layout in topology.paired_sensors():
+            if layout.nb_emg_channels and (subscription is None or (layout.index, "emg") in subscription):
+                self.add_stream(f"sensor{layout.index}_emg", layout.nb_emg_channels, layout.emg_rate,
+                                EMG_RANGE if quantize_emg else None)
+            if layout.nb_aux_channels and (subscription is None or (layout.index, "aux") in subscription):
+                self.add_stream(f"sensor{layout.index}_aux", layout.nb_aux_channels, layout.aux_rate)
+
+    def write(self, name, data, first_sample=None, time=None, idle=False):
+        """
+        Append a (n_channels, n_samples) block to a stream.
+        :param first_sample: device sample index of the first sample, a jump is indexed as a gap
+        :param time: wall-clock time of the first sample
+        :param idle: a jump of ``first_sample`` skips samples left out on purpose and is not a gap
+        """
+        if self.closed:
+            raise ValueError(f"Cannot write to {name}, the archive is closed.")
+        pending = self._pending[name]
+        n_data = data.shape[1]
+        self.index.add_block(name, self.streams[name].n_samples + self._n_pending[name], n_data, first_sample, time,
+                             idle)
+        done = 0
+        while done < n_data:
+            n_pending = self._n_pending[name]
+            n = min(self.chunk_samples - n_pending, n_data - done)
+            pending[:, n_pending:n_pending + n] = data[:, done:done + n]
+            self._n_pending[name] = n_pending + n
+            done += n
+            if self._n_pending[name] == self.chunk_samples:
+                self._flush(name)
+
+    def _flush(self, name):
+        n = self._n_pending[name]
+        if not n:
+            return
+        info = self.streams[name]
+        encoded = [info.encode(channel, self._compress) for channel in self._pending[name][:, :n]]
+        with self._lock:
+            entry = [info.n_samples, n]
+            for raw in encoded:
+                entry += [self._file.tell(), len(raw)]
+                self._file.write(raw)
+        info.chunks.append(entry)
+        info.n_samples += n
+        self._n_pending[name] = 0
+
+    @property
+    def closed(self):
+        return self._file.closed
+
+    def close(self):
+        if self.closed:
+            return
+        for name in self.streams:
+            self._flush(name)
+        index = json.dumps({"codec": self.codec,
+                            "metadata": self.metadata,
+                            "streams": [info.to_dict() for info in self.streams.values()],
+                            "index": self.index.to_dict(),
+                            }).encode('utf-8')
+        offset = self._file.tell()
+        self._file.write(index)
+        self._file.write(FOOTER.pack(offset, len(index), MAGIC))
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class ArchiveReader:
+    """
+    Random access reader of an archive written by ArchiveWriter.
+
+    Only the chunk index is loaded when the file is opened; ``read`` seeks to
+    and decompresses the chunks overlapping the requested range, for the
+    requested channels only.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        magic, version = HEADER.unpack(self._file.read(HEADER.size))
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a pytrigno archive.")
+        if version > VERSION:
+            raise ValueError(f"{path} has version {version}, newer than the supported version {VERSION}.")
+        self._file.seek(-FOOTER.size, 2)
+        offset, length, magic = FOOTER.unpack(self._file.read(FOOTER.size))
+        if magic != MAGIC:
+            raise ValueError(f"{path} is truncated, its index is missing.")
+        self._file.seek(offset)
+        index = json.loads(self._file.read(length).decode('utf-8'))
+        self.codec = index["codec"]
+        self.metadata = index["metadata"]
+        self.streams = {values["name"]: StreamInfo.from_dict(values) for values in index["streams"]}
+        self.index = SessionIndex.from_dict(index["index"])
+        self._decompress = CODECS[self.codec][1]
+        self._chunk_starts = {name: [chunk[0] for chunk in info.chunks] for name, info in self.streams.items()}
+
+    def read(self, name, start=0, stop=None, channels=None):
+        """
+        Return the samples [start, stop) of a stream as a float32 (n_channels, n_samples) array.
+        :param channels: sequence of channel indices, all channels if None
+        """
+        info = self.streams[name]
+        stop = info.n_samples if stop is None else min(stop, info.n_samples)
+        start = max(0, start)
+        channels = range(info.n_channels) if channels is None else channels
+        out = np.empty((len(channels), max(0, stop - start)), dtype=np.float32)
+        if stop <= start:
+            return out
+        first = bisect.bisect_right(self._chunk_starts[name], start) - 1
+        for chunk in info.chunks[first:]:
+            chunk_start, n = chunk[0], chunk[1]
+            if chunk_start >= stop:
+                break
+            lo, hi = max(start, chunk_start), min(stop, chunk_start + n)
+            for row, channel in enumerate(channels):
+                offset, length = chunk[2 + 2 * channel], chunk[3 + 2 * channel]
+                self._file.seek(offset)
+                values = info.decode(self._file.read(length), self._decompress)
+                out[row, lo - start:hi - start] = values[lo - chunk_start:hi - chunk_start]
+        return out
+
+    def query(self, name, start_time=None, stop_time=None, channels=None):
+        """
+        Return the samples of a stream recorded between two wall-clock times as a LazySlice.
+        Nothing is decompressed until the slice is converted to an array.
+        """
+        timeline = self.index.timelines[name]
+        start = 0 if start_time is None else timeline.archive_index_at(start_time)
+        stop = self.streams[name].n_samples if stop_time is None else timeline.archive_index_at(stop_time)
+        return LazySlice(self, name, start, max(start, stop), channels)
+
+    def query_samples(self, name, start_sample, stop_sample, channels=None):
+        """Same as query, with a range of device sample indices instead of times."""
+        start = self.index.archive_index_of_device(name, start_sample)
+        stop = self.index.archive_index_of_device(name, stop_sample)
+        return LazySlice(self, name, start, max(start, stop), channels)
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class LazySlice:
+    """
+    Range of archived samples decoded on demand.
+
+    ``numpy.asarray(lazy_slice)`` or ``load()`` decompresses the overlapping
+    chunks only, so the cost is proportional to the slice length.
+    """
+
+    def __init__(self, reader, name, start, stop, channels=None):
+        self.reader = reader
+        self.name = name
+        self.start = start
+        self.stop = stop
+        self.channels = list(range(reader.streams[name].n_channels)) if channels is None else list(channels)
+
+    @property
+    def shape(self):
+        return len(self.channels), self.stop - self.start
+
+    @property
+    def times(self):
+        """Wall-clock time of every sample of the slice."""
+        timeline = self.reader.index.timelines[self.name]
+        return timeline.times_at(np.arange(self.start, self.stop))
+
+    @property
+    def sample_indices(self):
+        """Device sample index of every sample of the slice."""
+        timeline = self.reader.index.timelines[self.name]
+        return timeline.device_indices_at(np.arange(self.start, self.stop, dtype=np.int64))
+
+    def load(self):
+        return self.reader.read(self.name, self.start, self.stop, self.channels)
+
+    def __array__(self, dtype=None, copy=None):
+        data = self.load()
+        return data if dtype is None else data.astype(dtype)
+
+    def __len__(self):
+        return self.stop - self.start
@@ -40,9 +40,9 @@ class EMGAvantiMode(Enum):
     EMG_ACC_GYRO_148HZ_8G_250DPS = 52
     EMG_ACC_GYRO_148HZ_16G_250DPS = 53
     EMG_ACC_GYRO_148HZ_2G_250DPS_2 = 54
-    EMG_ACC_GYRO_148HZ_4G_250DPS = 55
-    EMG_ACC_GYRO_148HZ_8G_250DPS = 56
-    EMG_ACC_GYRO_148HZ_16G_250DPS = 57
+    EMG_ACC_GYRO_148HZ_4G_250DPS_2 = 55
+    EMG_ACC_GYRO_148HZ_8G_250DPS_2 = 56
+    EMG_ACC_GYRO_148HZ_16G_250DPS_2 = 57
     EMG_ACC_GYRO_148HZ_2G_500DPS = 58
     EMG_ACC_GYRO_148HZ_4G_500DPS = 59
     EMG_ACC_GYRO_148HZ_8G_500DPS = 60
@@ -0,0 +1,111 @@
+import numpy as np
+
+from .topology import FRAME_INTERVAL
+
+
+class Rechunker:
+    """
+    Cut the chunks of one stream into blocks of exactly ``batch_samples`` samples.
+
+    Device frames larger than a batch are split into views of the decoded
+    frame, without copy. Samples which do not complete a batch are copied once
+    into a batch buffer, filled by the following frames until the
+    batch is complete (coalescing), then delivered and replaced by a new
+    buffer since consumers may keep the arrays they receive.
+
+    A discontinuity of the sample index (gap, trigger window) flushes the
+    incomplete batch, so a short batch is delivered rather than mixing samples
+    from both sides of the discontinuity.
+    """
+
+    def __init__(self, n_channels, batch_samples, deliver, dtype=np.float32):
+        self.n_channels = n_channels
+        self.batch_samples = batch_samples
+        self.deliver = deliver
+        self.dtype = np.dtype(dtype)
+        self._buffer = None
+        self._n_pending = 0
+        self._first = None
+        self._next = None
+
+    def push(self, data, first_sample):
+        """Consume a (n_channels, n_samples) block starting at device sample ``first_sample``."""
+        if self._n_pending and first_sample != self._next:
+            self.flush()
+        n = data.shape[1]
+        done = 0
+        if self._n_pending:
+            done = min(self.batch_samples - self._n_pending, n)
+            self._buffer[:, self._n_pending:self._n_pending + done] = data[:, :done]
+            self._n_pending += done
+            if self._n_pending == self.batch_samples:
+                self.flush()
+        while n - done >= self.batch_samples:
+            self.deliver(data[:, done:done + self.batch_samples], first_sample + done)
+            done += self.batch_samples
+        if done < n:
+            if self._buffer is None:
+                self._buffer = np.empty((self.n_channels, self.batch_samples), dtype=self.dtype)
+            self._buffer[:, :n - done] = data[:, done:]
+            self._n_pending = n - done
+            self._first = first_sample + done
+        self._next = first_sample + n
+
+    def flush(self):
+        """Deliver the incomplete batch, if any."""
+        if not self._n_pending:
+            return
+        buffer, n = self._buffer, self._n_pending
+        self._buffer = None
+        self._n_pending = 0
+        self.deliver(buffer[:, :n], self._first)
+
+
+class ChunkPolicy:
+    """
+    Delivery policy of a chunk callback, see TrignoSDKClient.add_chunk_callback.
+
+    The device sends frames of FRAME_INTERVAL (13.5 ms) and the reader threads
+    always read whole frames. A policy adapts them to a consumer:
+
+    - ``batch_samples`` delivers blocks of exactly that many samples per
+      channel, splitting or coalescing frames;
+    - ``latency`` delivers as many whole frames at once as fit in the target
+      latency (at least one), measured from the first sample of a block. Small
+      targets deliver every frame as it arrives, large ones reduce the per
+      call overhead of e.g. recording.
+
+    Batches are per stream, so on a stream the batch size is the same for
+    every sensor. The policy is called like a chunk callback and forwards
+    ``callback(stream_name, data, first_sample_index)`` for every batch.
+    """
+
+    def __init__(self, callback, batch_samples=None, latency=None):
+        if (batch_samples is None) == (latency is None):
+            raise ValueError("Give either a batch size or a target latency.")
+        self.callback = callback
+        self.batch_samples = batch_samples
+        self.latency = latency
+        self._rechunkers = {}
+
+    def samples_per_batch(self, stream):
+        if self.batch_samples is not None:
+            return self.batch_samples
+        return max(1, int(self.latency / FRAME_INTERVAL)) * stream.n_samples
+
+    def bind(self, trigno_box):
+        """Preallocate one Rechunker per stream of the topology and subscription of a TrignoSDKClient."""
+        self._rechunkers = {}
+        for name, stream in trigno_box.topology.streams.items():
+            def _deliver(data, first_sample, name=name):
+                self.callback(name, data, first_sample)
+            self._rechunkers[name] = Rechunker(trigno_box.stream_channels(name), self.samples_per_batch(stream),
+                                               _deliver, trigno_box.dtype)
+        return self
+
+    def __call__(self, name, data, first_sample):
+        self._rechunkers[name].push(data, first_sample)
+
+    def flush(self):
+        for rechunker in self._rechunkers.values():
+            rechunker.flush()
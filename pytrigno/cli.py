@@ -0,0 +1,352 @@
+"""
+Command line tool to qualify a Trigno station, installed as the ``pytrigno`` console script.
+
+    pytrigno discover                   print the sensors paired to the base
+    pytrigno record session.ptg -d 60   stream to an archive with a live throughput view
+    pytrigno replay session.ptg         decode an archive through the same view
+    pytrigno benchmark -d 30            stream for a while and report throughput, latency, drops and CPU
+    pytrigno relay -l 0.0.0.0:50050     rebroadcast the session to RelayClient subscribers
+
+Use `-h` or `--help` after a subcommand for its options.
+"""
+
+import argparse
+import collections
+import sys
+import time
+
+
+class ThroughputMonitor:
+    """
+    Per-stream counters shown by the live view.
+
+    ``account`` is called for every chunk, possibly from the reader threads;
+    ``snapshot`` computes the rates over the interval since the previous
+    snapshot, so the view shows the current state rather than session averages.
+
+    Latency is the delay between the estimated production of the last sample
+    of a chunk (see DriftEstimator) and its arrival. The estimator bounds the
+    production times by the fastest deliveries, so it is the queueing and
+    scheduling delay above the best observed transport delay.
+    """
+
+    def __init__(self, rates, latency_window=256):
+        self.rates = rates
+        self.samples = dict.fromkeys(rates, 0)
+        self.chunks = dict.fromkeys(rates, 0)
+        self.latencies = {name: collections.deque(maxlen=latency_window) for name in rates}
+        self.start()
+
+    def start(self):
+        """Start the session totals now, e.g. once streaming started."""
+        self._start = self._last = (time.monotonic(), time.process_time(), dict(self.samples))
+
+    def account(self, name, n_samples, latency=None):
+        self.samples[name] += n_samples
+        self.chunks[name] += 1
+        if latency is not None:
+            self.latencies[name].append(latency)
+
+    def snapshot(self, drops=None, since_start=False):
+        """
+        Return one row per stream and the CPU load of the process (% of one core).
+        :param drops: number of lost samples per stream
+        """
+        now = (time.monotonic(), time.process_time(), dict(self.samples))
+        wall, cpu, samples = self._start if since_start else self._last
+        self._last = now
+        elapsed = max(now[0] - wall, 1e-9)
+        rows = []
+        for name, rate in self.rates.items():
+            latencies = list(self.latencies[name])
+            rows.append({"stream": name,
+                         "rate": (now[2][name] - samples[name]) / elapsed,
+                         "expected": rate,
+                         "samples": now[2][name],
+                         "chunks": self.chunks[name],
+                         "latency": sum(latencies) / len(latencies) if latencies else float('nan'),
+                         "max_latency": max(latencies) if latencies else float('nan'),
+                         "drops": (drops or {}).get(name, 0),
+                         })
+        return rows, 100 * (now[1] - cpu) / elapsed
+
+
+def format_rows(rows, cpu):
+    lines = [f"{'stream':<14}{'samples/s':>12}{'expected':>11}{'latency ms':>12}{'max ms':>9}"
+             f"{'drops':>8}{'samples':>12}"]
+    for row in rows:
+        lines.append(f"{row['stream']:<14}{row['rate']:>12.1f}{row['expected']:>11.1f}"
+                     f"{row['latency'] * 1e3:>12.2f}{row['max_latency'] * 1e3:>9.2f}"
+                     f"{row['drops']:>8}{row['samples']:>12}")
+    lines.append(f"cpu {cpu:.1f}%")
+    return lines
+
+
+class LiveView:
+    """Redraw a block of lines in place on a terminal, or append them when the output is redirected."""
+
+    def __init__(self, stream=sys.stdout):
+        self.stream = stream
+        self.n_lines = 0
+
+    def show(self, lines):
+        if self.n_lines and self.stream.isatty():
+            # Move to the first line of the previous block and clear to the end of the screen.
+            self.stream.write(f"\x1b[{self.n_lines}F\x1b[J")
+        self.stream.write("\n".join(lines) + "\n")
+        self.stream.flush()
+        self.n_lines = len(lines)
+
+
+def _connect(args):
+    # Imported here so that `pytrigno --help` does not pay for numpy.
+    from .sdk_client import TrignoSDKClient
+    memory_budget = None if args.memory_budget is None else int(args.memory_budget * 2 ** 20)
+    client = TrignoSDKClient(host=args.host, buffer_size=args.buffer_size, resilient=args.resilient,
+                             history=args.history, memory_budget=memory_budget, spill=args.spill)
+    if args.sensors is not None or args.no_aux:
+        client.subscribe(args.sensors, aux=not args.no_aux)
+    return client
+
+
+def _monitor_client(client):
+    rates = {name: stream.rate for name, stream in client.topology.streams.items()
+             if stream.is_used and client.stream_channels(name)}
+    monitor = ThroughputMonitor(rates)
+
+    def _account_chunk(name, data, count):
+        last_sample = count + data.shape[1] - 1
+        monitor.account(name, data.shape[1], time.monotonic() - float(client.get_host_time(name, last_sample)))
+
+    client.add_chunk_callback(_account_chunk)
+    return monitor
+
+
+def _client_drops(client):
+    return {name: sum(n for _, n in gaps) for name, gaps in client.gaps.items()}
+
+
+def _run_live(client, monitor, duration, interval, quiet=False, status=None):
+    """
+    Refresh the live view until ``duration`` seconds elapsed or Ctrl-C.
+    :param status: function returning an extra line to show under the table
+    """
+    view = LiveView()
+    stop = None if duration is None else time.monotonic() + duration
+    try:
+        while stop is None or time.monotonic() < stop:
+            time.sleep(interval if stop is None else max(0., min(interval, stop - time.monotonic())))
+            rows, cpu = monitor.snapshot(_client_drops(client))
+            if not quiet:
+                view.show(format_rows(rows, cpu) + ([status()] if status is not None else []))
+    except KeyboardInterrupt:
+        pass
+
+
+def discover(args):
+    client = _connect(args)
+    try:
+        print(f"base {client.get_base_serial()}  firmware {client.get_base_firmware()}")
+        print(f"{'sensor':<8}{'type':<20}{'mode':>6}{'emg':>5}{'emg Hz':>9}{'aux':>5}{'aux Hz':>9}  streams")
+        for layout in client.topology.paired_sensors():
+            print(f"{layout.index:<8}{layout.type.name:<20}{layout.mode:>6}{layout.nb_emg_channels:>5}"
+                  f"{layout.emg_rate:>9.1f}{layout.nb_aux_channels:>5}{layout.aux_rate:>9.1f}  "
+                  f"{layout.emg_stream}, {layout.aux_stream}")
+        if not client.topology.paired_sensors():
+            print("no paired sensor")
+    finally:
+        client.disconnect()
+
+
+def record(args):
+    client = _connect(args)
+    monitor = _monitor_client(client)
+    writer = client.record(args.path, args.codec, args.quantize_emg)
+    client.start_streaming()
+    monitor.start()
+    try:
+        _run_live(client, monitor, args.duration, args.interval)
+    finally:
+        # Stop the reader threads first, so that no chunk is written while the archive is closed.
+        client.stop_streaming()
+        client.stop_recording()
+        client.disconnect()
+    streams = writer.streams.values()
+    print(f"{sum(info.n_samples for info in streams)} samples of {len(streams)} streams written to {args.path}")
+
+
+def benchmark(args):
+    client = _connect(args)
+    monitor = _monitor_client(client)
+    client.enable_quality(args.line_frequency)
+    client.start_streaming()
+    monitor.start()
+    try:
+        _run_live(client, monitor, args.duration, args.interval, args.quiet)
+    finally:
+        client.disconnect()
+    rows, cpu = monitor.snapshot(_client_drops(client), since_start=True)
+    print("session totals:")
+    for line in format_rows(rows, cpu):
+        print(line)
+    for name, stats in client.get_integrity_stats().items():
+        if name in monitor.rates and (stats["invalid_chunks"] or client.reconnections[name]):
+            print(f"{name}: {stats['invalid_chunks']} invalid chunks, {stats['misalignments']} realignments, "
+                  f"{client.reconnections[name]} reconnections")
+    footprint = client.get_memory_footprint()
+    seconds = [signal["seconds"] for sensor in footprint["sensors"].values() for signal in sensor.values()
+               if signal["bytes"]]
+    print(f"sensor buffers: {footprint['bytes'] / 2 ** 20:.1f} MiB"
+          + (f" for {min(seconds):.1f} s of history" if seconds else "")
+          + (f", {footprint['spilled_bytes'] / 2 ** 20:.1f} MiB spilled" if footprint["spilled_bytes"] else ""))
+    for name, stats in client.get_clock_stats().items():
+        print(f"{name}: device clock drift {stats['drift'] * 1e6:+.1f} ppm")
+    for index, report in client.get_quality().items():
+        for kind, quality in report.items():
+            if quality is None:
+                continue
+            flagged = [name for name, flags in quality["flags"].items() if flags.any()]
+            print(f"sensor {index} {kind}: {quality['loss'] * 100:.2f}% lost"
+                  + (f", flags: {', '.join(flagged)}" if flagged else ""))
+
+
+def relay(args):
+    from .relay import RelayServer
+    client = _connect(args)
+    monitor = _monitor_client(client)
+    if args.listen.startswith('unix:'):
+        address = args.listen[len('unix:'):]
+    else:
+        host, _, port = args.listen.rpartition(':')
+        address = (host or '0.0.0.0', int(port))
+    server = RelayServer(client, address, args.queue_size).start()
+    client.start_streaming()
+    monitor.start()
+
+    def _status():
+        stats = server.stats
+        return f"relay {server.address}: {stats['subscribers']} subscribers, {stats['evicted']} evicted"
+
+    try:
+        _run_live(client, monitor, args.duration, args.interval, status=_status)
+    finally:
+        server.stop()
+        client.disconnect()
+
+
+def replay(args):
+    from .archive import ArchiveReader
+    reader = ArchiveReader(args.path)
+    names = args.stream or list(reader.streams)
+    if args.list:
+        for name, info in reader.streams.items():
+            print(f"{name:<16}{info.n_channels:>4} channels {info.rate:>9.1f} Hz {info.n_samples:>10} samples")
+        for event in reader.index.events:
+            print(f"{event['kind']:<8} {event['stream']:<16} sample {event['archive_index']} at {event['time']:.3f}")
+        return
+    monitor = ThroughputMonitor({name: reader.streams[name].rate for name in names})
+    view = LiveView()
+    positions = dict.fromkeys(names, 0)
+    start = time.monotonic()
+    last_view = start
+    elapsed = 0.
+    try:
+        while any(positions[name] < reader.streams[name].n_samples for name in names):
+            elapsed += args.block
+            if args.speed:
+                # Wait until the block would have been complete at the recording pace.
+                time.sleep(max(0., start + elapsed / args.speed - time.monotonic()))
+            for name in names:
+                stop = int(round(elapsed * reader.streams[name].rate))
+                data = reader.read(name, positions[name], stop)
+                positions[name] += data.shape[1]
+                # Latency is the lag of the replay behind the recording pace.
+                lag = time.monotonic() - start - elapsed / args.speed if args.speed else None
+                monitor.account(name, data.shape[1], lag)
+            if not args.quiet and time.monotonic() - last_view >= args.interval:
+                last_view = time.monotonic()
+                view.show(format_rows(*monitor.snapshot()))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        reader.close()
+    rows, cpu = monitor.snapshot(since_start=True)
+    print(f"replayed {elapsed:.1f} s of recording in {time.monotonic() - start:.1f} s:")
+    for line in format_rows(rows, cpu):
+        print(line)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='pytrigno', description=__doc__,
+                                     formatter_class=argparse.RawTextHelpFormatter)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    connection = argparse.ArgumentParser(add_help=False)
+    connection.add_argument('-a', '--addr', dest='host', default='127.0.0.1',
+                            help="IP address of the machine running TCU. Default is localhost.")
+    connection.add_argument('-b', '--buffer-size', type=int, default=1000,
+                            help="Number of chunks (13.5 ms device frames) kept per sensor. Default is 1000.")
+    connection.add_argument('--history', type=float, default=None,
+                            help="Seconds of history kept per sensor, instead of --buffer-size.")
+    connection.add_argument('--memory-budget', type=float, default=None,
+                            help="MiB shared by the sensor buffers, caps --history.")
+    connection.add_argument('--spill', default=None, metavar='DIR',
+                            help="Keep the history evicted from the sensor buffers in files of this directory.")
+    connection.add_argument('-r', '--resilient', action='store_true',
+                            help="Reconnect dropped data connections instead of failing.")
+    connection.add_argument('--sensors', type=int, nargs='+', default=None,
+                            help="Indices of the sensors to acquire. Default is every sensor.")
+    connection.add_argument('--no-aux', action='store_true', help="Only acquire the EMG channels.")
+    live = argparse.ArgumentParser(add_help=False)
+    live.add_argument('-d', '--duration', type=float, default=None,
+                      help="Seconds to stream. Default is until Ctrl-C.")
+    live.add_argument('-i', '--interval', type=float, default=1.,
+                      help="Refresh interval of the live view in seconds. Default is 1.")
+
+    sub = subparsers.add_parser('discover', parents=[connection], help="print the sensors paired to the base")
+    sub.set_defaults(func=discover)
+
+    sub = subparsers.add_parser('record', parents=[connection, live],
+                                help="stream to an archive with a live throughput view")
+    sub.add_argument('path', help="archive file to create")
+    sub.add_argument('--codec', choices=['zlib', 'lzma'], default='zlib', help="Default is zlib.")
+    sub.add_argument('--quantize-emg', action='store_true', help="store EMG as int16 (lossy, about half the size)")
+    sub.set_defaults(func=record)
+
+    sub = subparsers.add_parser('relay', parents=[connection, live],
+                                help="rebroadcast the session to RelayClient subscribers")
+    sub.add_argument('-l', '--listen', default='0.0.0.0:50050',
+                     help="[host]:port to listen on, or unix:<path>. Default is 0.0.0.0:50050.")
+    sub.add_argument('--queue-size', type=int, default=256,
+                     help="chunks queued per subscriber before it is evicted. Default is 256.")
+    sub.set_defaults(func=relay)
+
+    sub = subparsers.add_parser('replay', help="decode an archive through the live throughput view")
+    sub.add_argument('path', help="archive file to read")
+    sub.add_argument('-s', '--stream', action='append',
+                     help="stream to replay, can be repeated. Default is every stream.")
+    sub.add_argument('--speed', type=float, default=0.,
+                     help="replay speed relative to the recording, 0 for as fast as possible. Default is 0.")
+    sub.add_argument('--block', type=float, default=0.1,
+                     help="seconds of recording decoded per step. Default is 0.1.")
+    sub.add_argument('-i', '--interval', type=float, default=1.,
+                     help="Refresh interval of the live view in seconds. Default is 1.")
+    sub.add_argument('-l', '--list', action='store_true', help="only list the streams and events")
+    sub.add_argument('-q', '--quiet', action='store_true', help="only print the totals")
+    sub.set_defaults(func=replay)
+
+    sub = subparsers.add_parser('benchmark', parents=[connection, live],
+                                help="stream and report throughput, latency, drops and CPU")
+    sub.add_argument('-q', '--quiet', action='store_true', help="only print the totals")
+    sub.add_argument('--line-frequency', type=float, default=50., help="mains frequency in Hz. Default is 50.")
+    sub.set_defaults(func=benchmark, duration=10.)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+import time
+
+import numpy as np
+
+
+class DriftEstimator:
+    """
+    Online estimate of the mapping between the sample index of a stream and host time.
+
+    Every chunk is stamped with its monotonic host arrival time. Arrival
+    times are the production time of the last sample plus a transport and
+    scheduling delay which is never negative but often large, so a plain
+    least-squares fit is biased by congestion. Instead, the points are
+    grouped in blocks of ``block_size`` chunks and only the earliest arrival
+    of each block (relative to the nominal rate) is kept; a least-squares
+    line through the last ``window`` of these minima gives the offset and
+    the actual sample period, i.e. the device/host clock drift.
+
+    Parameters
+    ----------
+    rate : float
+        Nominal sampling rate of the stream in Hz.
+    block_size : int, optional
+        Number of chunks per minimum filtering block.
+    window : int, optional
+        Number of blocks used by the fit.
+    """
+
+    def __init__(self, rate, block_size=32, window=256):
+        self.rate = rate
+        self.block_size = block_size
+        self.window = window
+        self.n_chunks = 0
+        # Host clock to wall clock, to express estimates as time.time() values
+        self.wall_offset = time.time() - time.monotonic()
+        self._origin = None
+        self._x = np.zeros(window)
+        self._y = np.zeros(window)
+        self._n_points = 0
+        self._block_best = None
+        self._block_count = 0
+        self.period = 1 / rate
+        self.offset = 0.
+
+    def add(self, sample_index, arrival_time):
+        """Account a chunk whose samples up to ``sample_index`` (exclusive) arrived at ``arrival_time``."""
+        self.n_chunks += 1
+        if self._origin is None:
+            self._origin = (sample_index, arrival_time)
+            self.offset = arrival_time - sample_index * self.period
+        x = sample_index - self._origin[0]
+        y = arrival_time - self._origin[1]
+        latency = y - x / self.rate
+        if self._block_best is None or latency < self._block_best[2]:
+            self._block_best = (x, y, latency)
+        self._block_count += 1
+        if self._block_count == self.block_size:
+            self._add_point(*self._block_best[:2])
+            self._block_best = None
+            self._block_count = 0
+
+    def _add_point(self, x, y):
+        position = self._n_points % self.window
+        self._x[position] = x
+        self._y[position] = y
+        self._n_points += 1
+        n = min(self._n_points, self.window)
+        xs, ys = self._x[:n], self._y[:n]
+        dx = xs - xs.mean()
+        spread = np.dot(dx, dx)
+        period = float(np.dot(dx, ys - ys.mean()) / spread) if spread > 0 else self.period
+        # Keep the line under every retained point: the earliest arrivals bound the production times.
+        intercept = float(np.min(ys - period * xs))
+        self.period = period
+        self.offset = self._origin[1] + intercept - self._origin[0] * period
+
+    @property
+    def drift(self):
+        """Relative deviation of the device rate from its nominal value (positive if the device is slow)."""
+        return self.period * self.rate - 1
+
+    @property
+    def estimated_rate(self):
+        return 1 / self.period
+
+    def to_host_time(self, sample_index):
+        """Monotonic host time at which ``sample_index`` (int or array) was produced."""
+        return self.offset + np.asarray(sample_index) * self.period
+
+    def to_wall_time(self, sample_index):
+        """Same as to_host_time, expressed as a time.time() value."""
+        return self.to_host_time(sample_index) + self.wall_offset
@@ -0,0 +1,122 @@
+import os
+from array import array
+
+import numpy as np
+
+# Bytes of the sample index kept next to every buffered chunk
+CHUNK_START_BYTES = 8
+
+
+def plan_history(buffers, itemsize, history=None, memory_budget=None, default_chunks=1000):
+    """
+    Ring capacity, in chunks, of every sensor buffer.
+
+    Every buffer gets the same duration of history, so the capacities follow
+    the sample rates and number of channels of each signal rather than a single
+    chunk count. With ``history`` the buffers hold at least that many seconds;
+    with ``memory_budget`` the duration is the largest fitting in the budget,
+    and with both the budget caps the requested history. Every buffer keeps at
+    least one chunk, whatever the budget.
+
+    Parameters
+    ----------
+    buffers : dict
+        (n_channels, samples per chunk, rate in Hz) of each buffer, by key.
+    itemsize : int
+        Bytes per sample of the buffers dtype.
+    history : float, optional
+        Seconds of history of every buffer.
+    memory_budget : int, optional
+        Bytes available for all the buffers.
+    default_chunks : int, optional
+        Capacity of every buffer if neither ``history`` nor ``memory_budget`` is given.
+
+    Returns
+    -------
+    capacities : dict
+        Number of chunks of each buffer, by key.
+    """
+    if history is None and memory_budget is None:
+        return {key: default_chunks for key in buffers}
+    seconds, limited_by_budget = history, False
+    if memory_budget is not None:
+        per_second = sum((n_channels * n_samples * itemsize + CHUNK_START_BYTES) * rate / n_samples
+                         for n_channels, n_samples, rate in buffers.values())
+        budget_seconds = memory_budget / per_second if per_second else np.inf
+        if seconds is None or budget_seconds < seconds:
+            seconds, limited_by_budget = budget_seconds, True
+    capacities = {}
+    for key, (n_channels, n_samples, rate) in buffers.items():
+        chunks = seconds * rate / n_samples
+        # Round down to stay within the budget, up to cover the requested history.
+        chunks = np.floor(chunks + 1e-9) if limited_by_budget else np.ceil(chunks - 1e-9)
+        capacities[key] = max(1, int(chunks))
+    return capacities
+
+
+class SpillFile:
+    """
+    Disk-backed history of one sensor signal.
+
+    The chunks evicted from a ring buffer are appended to a raw file, sample
+    after sample, so that the file is a (n_samples, n_channels) array growing
+    by whole rows. ``read`` memory-maps it as a read-only (n_channels,
+    n_samples) array: spilled history costs disk space, not memory. An
+    existing file is never overwritten: every allocation of a sensor buffer
+    starts a new numbered file (``path_for``), so the history spilled before a
+    subscribe, configure or new session is kept on disk.
+    """
+
+    def __init__(self, path, n_channels, dtype=np.float32):
+        self.path = path
+        self.n_channels = n_channels
+        self.dtype = np.dtype(dtype)
+        self.n_samples = 0
+        self.chunk_samples = None
+        self._starts = array('q')
+        self._file = open(path, 'xb')
+
+    def append(self, chunk, first_sample):
+        """Write a (n_channels, n_samples) chunk starting at sample index ``first_sample``."""
+        self._file.write(chunk.T.astype(self.dtype, copy=False).tobytes())
+        self._starts.append(first_sample)
+        self.chunk_samples = chunk.shape[1]
+        self.n_samples += chunk.shape[1]
+
+    def read(self):
+        """Spilled samples from oldest to newest as a read-only (n_channels, n_samples) memory map."""
+        n_samples = self.n_samples
+        if not n_samples:
+            return np.empty((self.n_channels, 0), dtype=self.dtype)
+        self._file.flush()
+        return np.memmap(self.path, dtype=self.dtype, mode='r', shape=(n_samples, self.n_channels)).T
+
+    @property
+    def frame_numbers(self):
+        """Sample indices of the spilled samples, in the order of ``read``."""
+        if not self._starts:
+            return np.empty(0, dtype=np.int64)
+        starts = np.array(self._starts, dtype=np.int64)
+        return (starts[:, None] + np.arange(self.chunk_samples)).ravel()
+
+    @property
+    def nbytes(self):
+        return self.n_samples * self.n_channels * self.dtype.itemsize
+
+    def close(self):
+        """Close the file, removed if nothing was spilled."""
+        if self._file.closed:
+            return
+        self._file.close()
+        if not self.n_samples:
+            os.remove(self.path)
+
+    @staticmethod
+    def path_for(directory, index, kind):
+        """First unused path of the numbered spill files of a sensor signal in ``directory``."""
+        number = 0
+        while True:
+            path = os.path.join(directory, f"sensor_{index:02d}_{kind}_{number:03d}.raw")
+            if not os.path.exists(path):
+                return path
+            number += 1
@@ -0,0 +1,131 @@
+import numpy as np
+
+
+BYTES_PER_CHANNEL = 4
+EMG_RANGE = 0.011
+AUX_RANGE = 1e5
+
+
+class FrameValidator:
+    """
+    Streaming check of the frame alignment of one data port.
+
+    The validator looks at the raw float32 words of every chunk for values
+    that cannot come from the device: NaN, infinities or magnitudes outside of
+    ``value_range``. A stream read from the middle of a word produces such
+    values almost everywhere, which is used to find the byte shift that brings
+    the stream back on a word boundary.
+
+    A stream shifted by whole words carries plausible values, but the device
+    sends exact zeros on the channels of the frame where no sensor is paired.
+    Once these idle channels are known (``set_idle_channels``), non-zero
+    words on them reveal a channel shift, and the word shift that puts the
+    zeros back on the idle channels realigns the stream on a frame boundary.
+    Without any idle channel (every channel used, or no sensor at all) a
+    whole-word shift cannot be told from the data and is not detected.
+
+    A single bad chunk, e.g. a transient on an idle channel, says little
+    about the alignment: the stream is only realigned once ``confirmations``
+    consecutive invalid chunks agree on the same shift (``confirm_shift``).
+    Invalid chunks which are not realigned are counted as rejected.
+
+    Parameters
+    ----------
+    n_channels : int
+        Number of channels in one frame of the stream.
+    value_range : float
+        Largest absolute value a channel can take (volts for EMG).
+    tolerance : float, optional
+        Relative margin added to ``value_range`` before a value is flagged.
+    confirmations : int, optional
+        Number of consecutive invalid chunks giving the same shift before realigning.
+    """
+
+    def __init__(self, n_channels, value_range, tolerance=0.1, confirmations=3):
+        self.n_channels = n_channels
+        self.frame_size = n_channels * BYTES_PER_CHANNEL
+        self.limit = value_range * (1 + tolerance)
+        self.confirmations = confirmations
+        self.idle_channels = np.empty(0, dtype=np.intp)
+        self._pending_shift = 0
+        self._n_agreeing = 0
+        self.n_chunks = 0
+        self.n_invalid_chunks = 0
+        self.n_rejected_chunks = 0
+        self.n_misalignments = 0
+        self.n_dropped_bytes = 0
+
+    def set_idle_channels(self, used_channels):
+        """Channels of the frame carrying no sensor, from the channels used by the paired sensors."""
+        idle = np.ones(self.n_channels, dtype=bool)
+        idle[list(used_channels)] = False
+        # With every channel idle there is no signal to locate the frame boundary with.
+        self.idle_channels = np.flatnonzero(idle) if not idle.all() else np.empty(0, dtype=np.intp)
+
+    def is_valid(self, packet):
+        """
+        Return True if every word of ``packet`` is a plausible sample and the idle channels are zero.
+        The range check only makes two reductions over a zero-copy view.
+        """
+        self.n_chunks += 1
+        words = np.frombuffer(packet, dtype='<f4', count=len(packet) // BYTES_PER_CHANNEL)
+        # NaN propagates through max/min so the comparisons below also reject it.
+        if words.max() <= self.limit and words.min() >= -self.limit:
+            if not len(self.idle_channels) or not words.reshape((-1, self.n_channels))[:, self.idle_channels].any():
+                self._n_agreeing = 0
+                return True
+        self.n_invalid_chunks += 1
+        return False
+
+    def find_shift(self, packet):
+        """
+        Return the number of leading bytes to drop from ``packet`` to get back on a frame boundary.
+        Zero means the chunk is aligned and only contains corrupted values.
+        """
+        n_words = len(packet) // BYTES_PER_CHANNEL - 1
+        scores = []
+        for shift in range(BYTES_PER_CHANNEL):
+            words = np.frombuffer(packet, dtype='<f4', count=n_words, offset=shift)
+            scores.append(np.count_nonzero(~(np.abs(words) <= self.limit)))
+        byte_shift = int(np.argmin(scores))
+        if not len(self.idle_channels):
+            return byte_shift
+        words = np.frombuffer(packet, dtype='<f4', count=n_words, offset=byte_shift)
+        n_frames = n_words // self.n_channels
+        # Non-zero words per position in the frame; dropping k words moves position (k + c) to channel c.
+        non_zero = np.count_nonzero(words[:n_frames * self.n_channels].reshape((n_frames, self.n_channels)), axis=0)
+        positions = (np.arange(self.n_channels)[:, None] + self.idle_channels[None, :]) % self.n_channels
+        word_shift = int(np.argmin(non_zero[positions].sum(axis=1)))
+        return byte_shift + word_shift * BYTES_PER_CHANNEL
+
+    def confirm_shift(self, shift):
+        """
+        Return True if the stream should be realigned by ``shift`` bytes, found in an invalid chunk.
+        That is once ``confirmations`` consecutive invalid chunks gave the same non-zero shift,
+        the other invalid chunks are counted as rejected.
+        """
+        if shift and shift == self._pending_shift:
+            self._n_agreeing += 1
+        else:
+            self._pending_shift = shift
+            self._n_agreeing = 1 if shift else 0
+        if shift and self._n_agreeing >= self.confirmations:
+            self._n_agreeing = 0
+            return True
+        self.n_rejected_chunks += 1
+        return False
+
+    def resync(self, shift):
+        """Record that ``shift`` bytes were dropped to realign the stream."""
+        self.n_misalignments += 1
+        self.n_dropped_bytes += shift
+
+    @property
+    def stats(self):
+        return {"chunks": self.n_chunks,
+                "invalid_chunks": self.n_invalid_chunks,
+                "rejected_chunks": self.n_rejected_chunks,
+                "misalignments": self.n_misalignments,
+                "dropped_bytes": self.n_dropped_bytes,
+                "idle_channels": len(self.idle_channels),
+                }
@@ -0,0 +1,126 @@
+import numpy as np
+
+
+IMU_CHANNELS = 9
+
+
+class OrientationFilter:
+    """
+    Madgwick orientation filter running on many IMU sensors at once.
+
+    The quaternions of all sensors are updated together, sample by sample,
+    with numpy operations over the sensor axis, so the cost of a chunk is a
+    handful of array operations whatever the number of sensors. The state
+    persists between calls and chunks can be of any length.
+
+    Parameters
+    ----------
+    n_sensors : int
+        Number of IMU sensors.
+    rate : float
+        Sampling rate of the aux channels in Hz.
+    beta : float, optional
+        Gain of the gradient descent correction.
+    use_magnetometer : bool, optional
+        If False, or for samples with a null magnetic field, only the
+        accelerometer corrects the gyroscope integration (no heading reference).
+    gyro_scale : float, optional
+        Factor converting gyroscope values to rad/s (Trigno sensors report deg/s).
+
+    Attributes
+    ----------
+    quaternions : ndarray, shape=(n_sensors, 4)
+        Orientation of each sensor as (w, x, y, z), sensor frame to earth frame.
+    """
+
+    def __init__(self, n_sensors, rate, beta=0.1, use_magnetometer=True, gyro_scale=np.pi / 180):
+        self.n_sensors = n_sensors
+        self.dt = 1 / rate
+        self.beta = beta
+        self.use_magnetometer = use_magnetometer
+        self.gyro_scale = gyro_scale
+        self.quaternions = np.zeros((n_sensors, 4))
+        self.quaternions[:, 0] = 1
+        self.n_samples = 0
+
+    def reset(self):
+        self.quaternions[:] = 0
+        self.quaternions[:, 0] = 1
+        self.n_samples = 0
+
+    def update_from_aux(self, data):
+        """
+        Update from an aux block of shape (n_sensors * 9, n_samples) where each
+        sensor contributes acc xyz, gyro xyz and mag xyz, as served by TrignoIM.
+        """
+        imu = np.asarray(data, dtype=np.float64).reshape((self.n_sensors, IMU_CHANNELS, -1))
+        return self.update(imu[:, 0:3], imu[:, 3:6], imu[:, 6:9] if self.use_magnetometer else None)
+
+    def update(self, acc, gyro, mag=None):
+        """
+        Integrate (n_sensors, 3, n_samples) accelerometer, gyroscope and optional magnetometer blocks.
+        :return: the updated quaternions
+        """
+        for t in range(acc.shape[-1]):
+            self._step(acc[..., t], gyro[..., t] * self.gyro_scale, None if mag is None else mag[..., t])
+        self.n_samples += acc.shape[-1]
+        return self.quaternions
+
+    def _step(self, a, g, m):
+        q0, q1, q2, q3 = self.quaternions.T
+        gx, gy, gz = g.T
+        q_dot = 0.5 * np.stack((-q1 * gx - q2 * gy - q3 * gz,
+                                q0 * gx + q2 * gz - q3 * gy,
+                                q0 * gy - q1 * gz + q3 * gx,
+                                q0 * gz + q1 * gy - q2 * gx), axis=1)
+
+        a_norm = np.linalg.norm(a, axis=1)
+        has_acc = a_norm > 0
+        ax, ay, az = (a / np.where(has_acc, a_norm, 1)[:, None]).T
+
+        # Gradient J^T f of the gravity objective function (Madgwick 2010, eq. 25-26)
+        f0 = 2 * (q1 * q3 - q0 * q2) - ax
+        f1 = 2 * (q0 * q1 + q2 * q3) - ay
+        f2 = 1 - 2 * (q1 * q1 + q2 * q2) - az
+        s0 = -2 * q2 * f0 + 2 * q1 * f1
+        s1 = 2 * q3 * f0 + 2 * q0 * f1 - 4 * q1 * f2
+        s2 = -2 * q0 * f0 + 2 * q3 * f1 - 4 * q2 * f2
+        s3 = 2 * q1 * f0 + 2 * q2 * f1
+
+        if m is not None:
+            m_norm = np.linalg.norm(m, axis=1)
+            has_mag = m_norm > 0
+            mx, my, mz = (m / np.where(has_mag, m_norm, 1)[:, None]).T
+            # Earth magnetic field direction, with its horizontal component on x (eq. 45-46)
+            hx = (mx * (q0 * q0 + q1 * q1 - q2 * q2 - q3 * q3) + 2 * my * (q1 * q2 - q0 * q3)
+                  + 2 * mz * (q1 * q3 + q0 * q2))
+            hy = (2 * mx * (q1 * q2 + q0 * q3) + my * (q0 * q0 - q1 * q1 + q2 * q2 - q3 * q3)
+                  + 2 * mz * (q2 * q3 - q0 * q1))
+            _2bz = 2 * ((2 * mx * (q1 * q3 - q0 * q2) + 2 * my * (q2 * q3 + q0 * q1)
+                         + mz * (q0 * q0 - q1 * q1 - q2 * q2 + q3 * q3)) * has_mag)
+            _2bx = 2 * np.sqrt(hx * hx + hy * hy) * has_mag
+            # Gradient of the magnetic objective function (eq. 29-30), null without a field
+            b0 = _2bx * (0.5 - q2 * q2 - q3 * q3) + _2bz * (q1 * q3 - q0 * q2) - mx * has_mag
+            b1 = _2bx * (q1 * q2 - q0 * q3) + _2bz * (q0 * q1 + q2 * q3) - my * has_mag
+            b2 = _2bx * (q0 * q2 + q1 * q3) + _2bz * (0.5 - q1 * q1 - q2 * q2) - mz * has_mag
+            s0 += -_2bz * q2 * b0 + (-_2bx * q3 + _2bz * q1) * b1 + _2bx * q2 * b2
+            s1 += _2bz * q3 * b0 + (_2bx * q2 + _2bz * q0) * b1 + (_2bx * q3 - 2 * _2bz * q1) * b2
+            s2 += (-2 * _2bx * q2 - _2bz * q0) * b0 + (_2bx * q1 + _2bz * q3) * b1 + (_2bx * q0 - 2 * _2bz * q2) * b2
+            s3 += (-2 * _2bx * q3 + _2bz * q1) * b0 + (-_2bx * q0 + _2bz * q2) * b1 + _2bx * q1 * b2
+        step = np.stack((s0, s1, s2, s3), axis=1)
+
+        step_norm = np.linalg.norm(step, axis=1)
+        correct = has_acc & (step_norm > 0)
+        step /= np.where(correct, step_norm, 1)[:, None]
+        q_dot -= self.beta * step * correct[:, None]
+
+        q = self.quaternions + q_dot * self.dt
+        self.quaternions = q / np.linalg.norm(q, axis=1)[:, None]
+
+    def get_euler(self):
+        """Roll, pitch and yaw (rad) of every sensor, shape (n_sensors, 3)."""
+        q0, q1, q2, q3 = self.quaternions.T
+        roll = np.arctan2(2 * (q0 * q1 + q2 * q3), 1 - 2 * (q1 * q1 + q2 * q2))
+        pitch = np.arcsin(np.clip(2 * (q0 * q2 - q3 * q1), -1, 1))
+        yaw = np.arctan2(2 * (q0 * q3 + q1 * q2), 1 - 2 * (q2 * q2 + q3 * q3))
+        return np.stack((roll, pitch, yaw), axis=1)
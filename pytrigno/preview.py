@@ -0,0 +1,113 @@
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+def lowpass_taps(factor, n_taps=None, dtype=np.float32):
+    """
+    Hamming windowed-sinc low-pass filter for a decimation by ``factor``.
+    The cutoff is placed at 80% of the new Nyquist frequency.
+    """
+    if n_taps is None:
+        n_taps = 4 * factor + 1
+    cutoff = 0.8 * 0.5 / factor
+    n = np.arange(n_taps) - (n_taps - 1) / 2
+    taps = 2 * cutoff * np.sinc(2 * cutoff * n) * np.hamming(n_taps)
+    return (taps / taps.sum()).astype(dtype)
+
+
+class PreviewStream:
+    """
+    Downsampled view of a signal maintained incrementally, one chunk at a time.
+
+    Samples are grouped in blocks of ``factor`` consecutive samples. For each
+    complete block the stream stores the anti-aliased (low-pass filtered)
+    sample at the end of the block, the min/max envelope and the RMS of the
+    block, in rings of ``history`` blocks. Samples of an incomplete block and
+    the filter history are carried over to the next chunk, so the result does
+    not depend on the chunk size. Given the sample index of the chunks, the
+    stream restarts from an empty filter history when samples are missing,
+    so a block never spans a gap.
+
+    Parameters
+    ----------
+    n_channels : int
+        Number of channels of the signal.
+    rate : float
+        Sampling rate of the signal in Hz.
+    preview_rate : float, optional
+        Target rate of the preview in Hz. The decimation factor is the closest integer.
+    history : int, optional
+        Number of preview samples kept.
+    dtype : numpy dtype, optional
+        Floating point type of the preview.
+    """
+
+    def __init__(self, n_channels, rate, preview_rate=100., history=1000, dtype=np.float32):
+        self.n_channels = n_channels
+        self.factor = max(1, int(round(rate / preview_rate)))
+        self.rate = rate / self.factor
+        self.history = history
+        self.dtype = np.dtype(dtype)
+        self.taps = lowpass_taps(self.factor, dtype=self.dtype)
+        n_lag = len(self.taps) - 1
+        # Filter history followed by the samples of the block in progress
+        self._carry = np.zeros((n_channels, n_lag), dtype=self.dtype)
+        self._decimated = np.zeros((n_channels, history), dtype=self.dtype)
+        self._min = np.zeros((n_channels, history), dtype=self.dtype)
+        self._max = np.zeros((n_channels, history), dtype=self.dtype)
+        self._rms = np.zeros((n_channels, history), dtype=self.dtype)
+        self._index = 0
+        self.n_blocks = 0
+        self.n_restarts = 0
+        self._next_sample = None
+
+    def restart(self):
+        """Drop the filter history and the block in progress, e.g. after missing samples."""
+        self._carry = np.zeros((self.n_channels, len(self.taps) - 1), dtype=self.dtype)
+        self.n_restarts += 1
+
+    def update(self, data, first_sample=None):
+        """
+        Consume a (n_channels, n_samples) chunk and append the preview of every completed block.
+        :param first_sample: sample index of the first sample; on a discontinuity the decimator restarts
+            rather than filtering and grouping samples from both sides of the missing ones
+        """
+        if first_sample is not None:
+            if self._next_sample is not None and first_sample != self._next_sample:
+                self.restart()
+            self._next_sample = first_sample + data.shape[1]
+        n_lag = len(self.taps) - 1
+        x = np.concatenate((self._carry, data.astype(self.dtype, copy=False)), axis=1)
+        n = (x.shape[1] - n_lag) // self.factor
+        if n:
+            blocks = x[:, n_lag:n_lag + n * self.factor].reshape((self.n_channels, n, self.factor))
+            # Window k ends on the last sample of block k
+            windows = sliding_window_view(x, len(self.taps), axis=1)[:, self.factor - 1::self.factor][:, :n]
+            self._write(self._decimated, windows @ self.taps[::-1], n)
+            self._write(self._min, blocks.min(axis=-1), n)
+            self._write(self._max, blocks.max(axis=-1), n)
+            self._write(self._rms, np.sqrt(np.mean(np.square(blocks), axis=-1)), n)
+            self._index = (self._index + n) % self.history
+            self.n_blocks += n
+        self._carry = x[:, n * self.factor:].copy()
+
+    def _write(self, ring, values, n):
+        positions = (self._index + np.arange(n)) % self.history
+        ring[:, positions] = values
+
+    def _ordered(self, ring):
+        filled = min(self.n_blocks, self.history)
+        positions = (self._index - filled + np.arange(filled)) % self.history
+        return ring[:, positions]
+
+    def get_decimated(self):
+        """Anti-aliased preview samples, oldest first."""
+        return self._ordered(self._decimated)
+
+    def get_envelope(self):
+        """(min, max) of every preview block, oldest first."""
+        return self._ordered(self._min), self._ordered(self._max)
+
+    def get_rms(self):
+        """RMS of every preview block, oldest first."""
+        return self._ordered(self._rms)
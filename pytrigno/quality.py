@@ -0,0 +1,164 @@
+import numpy as np
+
+
+class QualityMonitor:
+    """
+    Incremental signal quality checks of one sensor signal, updated chunk by chunk.
+
+    Every statistic is computed with a few reductions over the (n_channels,
+    n_samples) chunk and carried over to the next chunk, so the flags do not
+    depend on the chunk size:
+
+    - dropout: the channel has been exactly zero for at least ``flat_duration``;
+      Trigno fills the samples of lost packets with zeros;
+    - flat: the channel has been stuck at the same non-zero value for at least
+      ``flat_duration`` (disconnected electrode, dead sensor);
+    - saturated: more than ``saturation_ratio`` of the recent samples are
+      beyond ``saturation`` times ``value_range``;
+    - line_noise: more than ``line_ratio`` of the signal power is at the line
+      frequency, estimated by demodulation over blocks of ``line_block`` seconds.
+
+    The packet loss of a sensor is estimated as the proportion of samples
+    where all its channels are exactly zero, which real signals never are. A
+    monitor can run on a whole data stream at once, with one group of
+    channels per sensor, and ``report`` gives the results of one sensor.
+
+    Parameters
+    ----------
+    n_channels : int
+        Number of channels of the signal.
+    rate : float
+        Sampling rate in Hz.
+    value_range : float, optional
+        Full scale of the signal, None to disable the saturation check.
+    line_frequency : float, optional
+        Mains frequency in Hz, None to disable the line noise check.
+    flat_duration : float, optional
+        Duration in seconds of a zero or constant run raising a flag.
+    window : float, optional
+        Time constant in seconds of the recent saturation and loss averages.
+    groups : dict, optional
+        Contiguous channel slice of every sensor, by key. All channels form a single group if None.
+    """
+
+    def __init__(self, n_channels, rate, value_range=None, line_frequency=50., flat_duration=0.05, window=1.,
+                 saturation=0.95, saturation_ratio=0.01, line_ratio=0.3, line_block=0.2, groups=None):
+        self.n_channels = n_channels
+        self.groups = {None: slice(0, n_channels)} if groups is None else dict(groups)
+        # Packet loss is reduced per group with a single reduceat over the group boundaries.
+        self._bounds = sorted({bound for channels in self.groups.values() for bound in (channels.start, channels.stop)
+                               if bound < n_channels})
+        self._group_rows = [self._bounds.index(channels.start) for channels in self.groups.values()]
+        self.rate = rate
+        self.value_range = value_range
+        self.line_frequency = line_frequency
+        self.flat_samples = max(2, int(round(flat_duration * rate)))
+        self.window = window
+        self.saturation = saturation
+        self.saturation_ratio = saturation_ratio
+        self.line_ratio = line_ratio
+        self.line_block_samples = max(1, int(round(line_block * rate)))
+        self._omega = 2 * np.pi * (line_frequency or 0.) / rate
+        self._phasor = np.exp(-1j * self._omega * np.arange(self.line_block_samples))
+        self.reset()
+
+    def reset(self):
+        n = self.n_channels
+        self.n_samples = 0
+        self.n_lost = np.zeros(len(self.groups), dtype=np.int64)
+        self.recent_loss = np.zeros(len(self.groups))
+        self.zero_run = np.zeros(n, dtype=np.int64)
+        self.flat_run = np.zeros(n, dtype=np.int64)
+        self.n_saturated = np.zeros(n, dtype=np.int64)
+        self.recent_saturation = np.zeros(n)
+        self.line_noise_ratio = np.zeros(n)
+        self._last = np.full(n, np.nan)
+        self._line_sum = np.zeros(n, dtype=np.complex128)
+        self._line_energy = np.zeros(n)
+        self._line_count = 0
+
+    def update(self, data, first_sample=None):
+        """
+        Account a (n_channels, n_samples) chunk.
+        :param first_sample: sample index of the first sample, keeps the line demodulation in phase across gaps
+        """
+        n = data.shape[1]
+        if not n:
+            return
+        if first_sample is None:
+            first_sample = self.n_samples
+        alpha = 1 - np.exp(-n / (self.window * self.rate))
+
+        non_zero = data != 0
+        # Zeros after the last non-zero sample, or the whole chunk prolonging the previous run
+        self.zero_run = np.where(non_zero.any(axis=1), np.argmax(non_zero[:, ::-1], axis=1), self.zero_run + n)
+
+        changes = np.empty(data.shape, dtype=bool)
+        changes[:, 0] = data[:, 0] != self._last
+        np.not_equal(data[:, 1:], data[:, :-1], out=changes[:, 1:])
+        self.flat_run = np.where(changes.any(axis=1), np.argmax(changes[:, ::-1], axis=1) + 1, self.flat_run + n)
+        self._last = data[:, -1].astype(np.float64)
+
+        non_zero_per_group = np.add.reduceat(non_zero, self._bounds, axis=0)[self._group_rows]
+        lost = np.count_nonzero(non_zero_per_group == 0, axis=1)
+        self.n_lost += lost
+        self.recent_loss += alpha * (lost / n - self.recent_loss)
+
+        if self.value_range is not None:
+            saturated = np.count_nonzero(np.abs(data) >= self.saturation * self.value_range, axis=1)
+            self.n_saturated += saturated
+            self.recent_saturation += alpha * (saturated / n - self.recent_saturation)
+
+        if self.line_frequency is not None:
+            self._update_line_noise(data, first_sample)
+        self.n_samples += n
+
+    def _update_line_noise(self, data, first_sample):
+        done = 0
+        n = data.shape[1]
+        while done < n:
+            take = min(self.line_block_samples - self._line_count, n - done)
+            block = data[:, done:done + take]
+            # Demodulate with a precomputed phasor, rotated to the phase of the first sample.
+            self._line_sum += (block @ self._phasor[:take]) * np.exp(-1j * self._omega * (first_sample + done))
+            self._line_energy += np.einsum('ij,ij->i', block, block)
+            self._line_count += take
+            done += take
+            if self._line_count == self.line_block_samples:
+                # A sinusoid of amplitude A has a power A**2 / 2 and |sum| = A * N / 2.
+                line_power = 2 * np.abs(self._line_sum) ** 2 / self._line_count ** 2
+                power = self._line_energy / self._line_count
+                self.line_noise_ratio = np.divide(line_power, power, out=np.zeros_like(power), where=power > 0)
+                self._line_sum[:] = 0
+                self._line_energy[:] = 0
+                self._line_count = 0
+
+    @property
+    def loss(self):
+        """Proportion of the samples lost since the start, per group."""
+        return self.n_lost / max(self.n_samples, 1)
+
+    @property
+    def flags(self):
+        """Boolean array per check, one value per channel."""
+        return {"dropout": self.zero_run >= self.flat_samples,
+                "flat": (self.flat_run >= self.flat_samples) & (self.zero_run < self.flat_samples),
+                "saturated": self.recent_saturation > self.saturation_ratio,
+                "line_noise": self.line_noise_ratio > self.line_ratio,
+                }
+
+    @property
+    def is_good(self):
+        """True for the channels without any flag."""
+        return ~np.any(list(self.flags.values()), axis=0)
+
+    def report(self, key=None):
+        """Loss, per channel flags and statistics of one group."""
+        group = list(self.groups).index(key)
+        channels = self.groups[key]
+        return {"loss": float(self.loss[group]),
+                "recent_loss": float(self.recent_loss[group]),
+                "saturated_samples": self.n_saturated[channels],
+                "line_noise_ratio": self.line_noise_ratio[channels],
+                "flags": {name: flag[channels] for name, flag in self.flags.items()},
+                }
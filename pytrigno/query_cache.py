@@ -0,0 +1,97 @@
+import re
+
+
+# Queries whose answer only changes through one of the mutating commands below.
+CACHEABLE_QUERIES = re.compile(
+    r"^(MAX SAMPLES (EMG|AUX)"
+    r"|BASE (SERIAL|FIRMWARE)\?"
+    r"|UPSAMPLING\?|ENDIANNESS\?|BACKWARDS COMPATIBILITY\?|TRIGGER\?"
+    r"|SENSOR \d+ (PAIRED|TYPE|MODE|SERIAL|FIRMWARE|EMGCHANNELCOUNT|AUXCHANNELCOUNT|STARTINDEX|AUXSTARTINDEX)\?)$")
+
+_SENSOR_COMMAND = re.compile(r"^SENSOR (\d+) (SETMODE|PAIR)\b")
+_START_INDEX = re.compile(r"^SENSOR \d+ (STARTINDEX|AUXSTARTINDEX)\?$")
+_CHANNEL_LAYOUT = re.compile(r"^SENSOR \d+ (EMGCHANNELCOUNT|AUXCHANNELCOUNT|STARTINDEX|AUXSTARTINDEX)\?$")
+_FRAME_SHAPE = re.compile(r"^MAX SAMPLES (EMG|AUX)$")
+
+
+def _exact(query):
+    return lambda cached: cached == query
+
+
+class QueryCache:
+    """
+    Memoized answers of the command channel for the current session.
+
+    Static queries (base serial, sensor layout, frame shape...) are answered
+    from memory once seen. Mutating commands invalidate exactly the entries
+    they can change: ``SETMODE``/``PAIR`` on a sensor drop every query of that
+    sensor, the start indices of all sensors (a different channel count shifts
+    the following sensors) and the frame shape; ``UPSAMPLE``, ``ENDIAN``,
+    ``BACKWARDS COMPATIBILITY`` and ``TRIGGER`` drop their own query and what
+    depends on them.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def is_cacheable(command):
+        return CACHEABLE_QUERIES.match(command) is not None
+
+    @staticmethod
+    def is_mutating(command):
+        if _SENSOR_COMMAND.match(command):
+            return True
+        return (command.startswith(("UPSAMPLE ", "ENDIAN ", "BACKWARDS COMPATIBILITY ", "TRIGGER "))
+                and not command.endswith("?"))
+
+    def lookup(self, command):
+        """Return the cached answer of ``command`` or None, and count the hit or miss."""
+        if command in self._entries:
+            self.hits += 1
+            return self._entries[command]
+        if self.is_cacheable(command):
+            self.misses += 1
+        return None
+
+    def store(self, command, response):
+        if response and self.is_cacheable(command):
+            self._entries[command] = response
+
+    def invalidate_for(self, command):
+        """Drop the entries a mutating ``command`` may have changed."""
+        sensor_command = _SENSOR_COMMAND.match(command)
+        if sensor_command:
+            prefix = f"SENSOR {sensor_command.group(1)} "
+            self._drop(lambda cached: cached.startswith(prefix) or _START_INDEX.match(cached)
+                       or _FRAME_SHAPE.match(cached))
+        elif command.startswith("UPSAMPLE "):
+            self._drop(lambda cached: cached == "UPSAMPLING?" or _FRAME_SHAPE.match(cached))
+        elif command.startswith("ENDIAN "):
+            self._drop(_exact("ENDIANNESS?"))
+        elif command.startswith("BACKWARDS COMPATIBILITY "):
+            self._drop(lambda cached: cached == "BACKWARDS COMPATIBILITY?" or _CHANNEL_LAYOUT.match(cached)
+                       or _FRAME_SHAPE.match(cached))
+        elif command.startswith("TRIGGER "):
+            self._drop(_exact("TRIGGER?"))
+
+    def _drop(self, predicate):
+        stale = [cached for cached in self._entries if predicate(cached)]
+        for cached in stale:
+            del self._entries[cached]
+        self.invalidations += len(stale)
+
+    def clear(self):
+        self.invalidations += len(self._entries)
+        self._entries.clear()
+
+    @property
+    def stats(self):
+        return {"hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "entries": len(self._entries),
+                }
@@ -0,0 +1,259 @@
+import json
+import os
+import socket
+import struct
+import threading
+from queue import Queue, Full
+
+import numpy as np
+
+
+MAGIC = b'TR'
+# magic, kind, sensor index, sequence number, device index of the first sample, number of channels, payload bytes
+HEADER = struct.Struct('<2sBBIqHI')
+HELLO = 0
+EMG = 1
+AUX = 2
+KIND_NAMES = {EMG: "emg", AUX: "aux"}
+
+
+def pack_frame(kind, sensor, sequence, first_sample, data):
+    """Frame a (n_channels, n_samples) block, sent as float32 little endian words in channel-major order."""
+    payload = np.ascontiguousarray(data, dtype='<f4').tobytes()
+    return HEADER.pack(MAGIC, kind, sensor, sequence & 0xFFFFFFFF, first_sample, data.shape[0], len(payload)) + payload
+
+
+class RelayServer:
+    """
+    Rebroadcast the data of one TrignoSDKClient session to many subscribers.
+
+    Every decoded chunk is demultiplexed per sensor and framed once, with a
+    22 bytes header (see HEADER) in front of the float32 samples; the frames of
+    a chunk are then queued to every subscriber, whose own thread writes them
+    to its socket. Queues are bounded: a subscriber which falls behind by
+    more than ``queue_size`` chunks is evicted (disconnected) rather than
+    slowing down the acquisition or the other subscribers.
+
+    On connection a subscriber first receives a HELLO frame whose JSON payload
+    describes the relayed sensors. Data frames are numbered by the relay, so
+    a consumer can check it did not miss any and consumers can match frames.
+
+    Parameters
+    ----------
+    trigno_box : TrignoSDKClient
+        Connected client. Streaming can be started before or after the relay.
+    address : tuple or str
+        (host, port) to listen on TCP, or the path of a Unix socket.
+    queue_size : int, optional
+        Maximum number of chunks waiting to be sent to a subscriber.
+    sensors : sequence of int, optional
+        1-based indices of the relayed sensors, every subscribed sensor if None.
+    """
+
+    def __init__(self, trigno_box, address, queue_size=256, sensors=None):
+        self.trigno_box = trigno_box
+        self.address = address
+        self.queue_size = queue_size
+        self.subscribers = []
+        self.n_evicted = 0
+        self.n_frames = 0
+        self._lock = threading.Lock()
+        self._listener = None
+        self._routes = {name: [] for name in trigno_box.topology.streams}
+        description = []
+        for layout in trigno_box.topology.paired_sensors():
+            if sensors is not None and layout.index not in sensors:
+                continue
+            emg_channels = trigno_box.channel_slice(layout, "emg")
+            aux_channels = trigno_box.channel_slice(layout, "aux")
+            if emg_channels is None and aux_channels is None:
+                # Not subscribed by the session
+                continue
+            description.append({"index": layout.index, "type": layout.type.name,
+                                 "emg_channels": layout.nb_emg_channels if emg_channels is not None else 0,
+                                 "emg_rate": layout.emg_rate,
+                                 "aux_channels": layout.nb_aux_channels if aux_channels is not None else 0,
+                                 "aux_rate": layout.aux_rate})
+            if emg_channels is not None:
+                self._routes[layout.emg_stream].append((EMG, layout.index, emg_channels))
+            if aux_channels is not None:
+                self._routes[layout.aux_stream].append((AUX, layout.index, aux_channels))
+        self.description = {"sensors": description}
+
+    def start(self):
+        if isinstance(self.address, str):
+            if os.path.exists(self.address):
+                os.unlink(self.address)
+            self._listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        else:
+            self._listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self._listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._listener.bind(self.address)
+        self._listener.listen()
+        if not isinstance(self.address, str):
+            self.address = self._listener.getsockname()
+        threading.Thread(target=self._accept, name='relay', daemon=True).start()
+        self.trigno_box.add_chunk_callback(self._broadcast)
+        return self
+
+    def stop(self):
+        self.trigno_box.remove_chunk_callback(self._broadcast)
+        if self._listener is not None:
+            self._listener.close()
+            self._listener = None
+            if isinstance(self.address, str) and os.path.exists(self.address):
+                os.unlink(self.address)
+        with self._lock:
+            subscribers, self.subscribers = self.subscribers, []
+        for subscriber in subscribers:
+            subscriber.close()
+
+    def _accept(self):
+        hello = json.dumps(self.description).encode('utf-8')
+        while True:
+            try:
+                connection, _ = self._listener.accept()
+            except (OSError, AttributeError):
+                # The listener was closed by stop().
+                return
+            if connection.family != socket.AF_UNIX:
+                connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            subscriber = _Subscriber(connection, self.queue_size)
+            with self._lock:
+                subscriber.queue.put_nowait(HEADER.pack(MAGIC, HELLO, 0, 0, 0, 0, len(hello)) + hello)
+                self.subscribers.append(subscriber)
+            subscriber.start(self._remove)
+
+    def _broadcast(self, name, data, count):
+        routes = self._routes[name]
+        if not routes or not self.subscribers:
+            return
+        with self._lock:
+            # Frame the chunk once, every subscriber is sent the same bytes.
+            frames = b''.join(pack_frame(kind, index, self.n_frames + i, count, data[channels])
+                              for i, (kind, index, channels) in enumerate(routes))
+            self.n_frames += len(routes)
+            for subscriber in list(self.subscribers):
+                try:
+                    subscriber.queue.put_nowait(frames)
+                except Full:
+                    self.subscribers.remove(subscriber)
+                    self.n_evicted += 1
+                    subscriber.close()
+
+    def _remove(self, subscriber):
+        with self._lock:
+            if subscriber in self.subscribers:
+                self.subscribers.remove(subscriber)
+
+    @property
+    def stats(self):
+        return {"subscribers": len(self.subscribers),
+                "frames": self.n_frames,
+                "evicted": self.n_evicted,
+                "queued": [subscriber.queue.qsize() for subscriber in self.subscribers],
+                }
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+
+class _Subscriber:
+    def __init__(self, connection, queue_size):
+        self.connection = connection
+        self.queue = Queue(queue_size)
+        self.closed = False
+
+    def start(self, on_exit):
+        def _send():
+            try:
+                while not self.closed:
+                    frames = self.queue.get()
+                    if frames is None:
+                        break
+                    self.connection.sendall(frames)
+            except OSError:
+                pass
+            self.close()
+            on_exit(self)
+        threading.Thread(target=_send, name='relay-subscriber', daemon=True).start()
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            self.connection.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.connection.close()
+        # Wake up the sender thread if it is waiting for frames.
+        try:
+            self.queue.put_nowait(None)
+        except Full:
+            pass
+
+
+class RelayClient:
+    """
+    Subscriber of a RelayServer.
+
+    ``read()`` returns the next frame as (kind, sensor index, first sample
+    index, data), where kind is 'emg' or 'aux' and data is a float32
+    (n_channels, n_samples) array. ``sensors`` holds the description sent by
+    the server and ``n_missed`` counts the frames missing from the sequence.
+    """
+
+    def __init__(self, address, timeout=None):
+        family = socket.AF_UNIX if isinstance(address, str) else socket.AF_INET
+        self._socket = socket.socket(family, socket.SOCK_STREAM)
+        self._socket.settimeout(timeout)
+        self._socket.connect(address)
+        self._file = self._socket.makefile('rb')
+        self.n_missed = 0
+        self._sequence = None
+        kind, _, _, _, payload = self._read_raw()
+        self._sequence = None
+        if kind != HELLO:
+            raise ValueError("The relay did not start with a HELLO frame.")
+        self.sensors = json.loads(payload.decode('utf-8'))["sensors"]
+
+    def _read_raw(self):
+        header = self._file.read(HEADER.size)
+        if len(header) < HEADER.size:
+            raise ConnectionError("Relay connection closed.")
+        magic, kind, sensor, sequence, first_sample, n_channels, n_bytes = HEADER.unpack(header)
+        if magic != MAGIC:
+            raise ValueError("Relay stream out of sync.")
+        payload = self._file.read(n_bytes)
+        if len(payload) < n_bytes:
+            raise ConnectionError("Relay connection closed.")
+        if self._sequence is not None:
+            self.n_missed += (sequence - self._sequence - 1) & 0xFFFFFFFF
+        self._sequence = sequence
+        return kind, sensor, first_sample, n_channels, payload
+
+    def read(self):
+        kind, sensor, first_sample, n_channels, payload = self._read_raw()
+        data = np.frombuffer(payload, dtype='<f4').reshape((n_channels, -1))
+        return KIND_NAMES[kind], sensor, first_sample, data
+
+    def __iter__(self):
+        while True:
+            try:
+                yield self.read()
+            except ConnectionError:
+                return
+
+    def close(self):
+        self._file.close()
+        self._socket.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
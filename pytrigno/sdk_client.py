@@ -1,27 +1,71 @@
+import os
 import socket
-import struct
 import threading
-from queue import Queue
+from queue import Queue, Empty
 import time
 
 import numpy as np
 from .enums import AvantiSensor, LegacySensor
-from .sensor import Sensor, Type
+from .integrity import FrameValidator, EMG_RANGE, AUX_RANGE
+from .query_cache import QueryCache
+from .trigger import TriggerGate, TRIGGER_EDGES
+from .archive import ArchiveWriter
+from .chunking import ChunkPolicy
+from .quality import QualityMonitor
+from .clock import DriftEstimator
+from .orientation import OrientationFilter, IMU_CHANNELS
+from .history import plan_history
+from .sensor import Sensor
+from .topology import Topology, Type, FRAME_INTERVAL, N_SENSORS
 
 
 BYTES_PER_CHANNEL = 4
 CMD_TERM = '\r\n\r\n'
 EMG_SAMPLE_RATE = 2000
 AUX_SAMPLE_RATE = 148.148
+RECONNECT_BACKOFF = 0.1
+RECONNECT_MAX_BACKOFF = 5.0
 
 class TrignoSDKClient:
-    def __init__(self, host='127.0.0.1', cmd_port=50040, timeout=2.0, fast_mode=False, buffer_size=1000):
+    def __init__(self, host='127.0.0.1', cmd_port=50040, timeout=2.0, fast_mode=False, buffer_size=1000,
+                 resilient=False, stall_timeout=5.0, max_reconnect=None, dtype=np.float32,
+                 history=None, memory_budget=None, spill=None):
+        """
+        :param buffer_size: number of chunks kept per sensor buffer, unless history or memory_budget is given
+        :param history: seconds of history kept by every sensor buffer, see plan_history
+        :param memory_budget: bytes shared by all the sensor buffers, every buffer holding the same duration
+        :param spill: directory where the chunks evicted from the sensor buffers are appended, see SpillFile
+        """
         self.buffer_size = buffer_size
+        self.history = history
+        self.memory_budget = memory_budget
+        self.spill = spill
+        self.dtype = np.dtype(dtype)
         self.host = host
         self.cmd_port = cmd_port
         self.timeout = timeout
         self._comm_socket = None
+        self._comm_lock = threading.RLock()
+        self.query_cache = QueryCache()
+        self.trigger_gates = {}
+        self._chunk_callbacks = []
+        self.clocks = {}
+        self._recorder = None
+        self._orientation = None
+        self.subscription = None
+        self.quality = {}
+        self._quality_config = None
+        # Streams read even without any subscribed sensor, see require_streams
+        self.required_streams = set()
         self.fast_mode = fast_mode
+        self.resilient = resilient
+        self.stall_timeout = stall_timeout
+        self.max_reconnect = max_reconnect
+        self._is_streaming = False
+        self._session = None
+        # Streams whose reader thread was started for the current session
+        self._running_streams = set()
+        self._data_connected = False
         self.avanti_emg_socket = None
         self.avanti_aux_socket = None
         self.legacy_emg_socket = None
@@ -42,6 +86,29 @@ class TrignoSDKClient:
                           "legacy_emg": self.legacy_emg_queue,
                           "legacy_aux": self.legacy_aux_queue,
                           }
+        # Lost intervals per stream as (first missing sample index, number of samples)
+        self.gaps = {"avanti_emg": [],
+                     "avanti_aux": [],
+                     "legacy_emg": [],
+                     "legacy_aux": [],
+                     }
+        self.validators = {"avanti_emg": FrameValidator(16, EMG_RANGE),
+                           "avanti_aux": FrameValidator(144, AUX_RANGE),
+                           "legacy_emg": FrameValidator(16, EMG_RANGE),
+                           "legacy_aux": FrameValidator(48, AUX_RANGE),
+                           }
+        self.reconnections = {"avanti_emg": 0,
+                              "avanti_aux": 0,
+                              "legacy_emg": 0,
+                              "legacy_aux": 0,
+                              }
+        # Exceptions raised by chunk callbacks per stream, the reader threads carry on without them
+        self.callback_errors = {"avanti_emg": 0,
+                                "avanti_aux": 0,
+                                "legacy_emg": 0,
+                                "legacy_aux": 0,
+                                }
+        self.last_callback_error = None
 
         if self.fast_mode:
             print("Warning: Fast mode enabled. Responses will not be waited for.")
@@ -49,60 +116,269 @@ class TrignoSDKClient:
         self.connect()
 
     def connect(self):
-        """Establish connection to Trigno SDK command port."""
+        """Establish connection to Trigno SDK command port, the data ports are connected by start_streaming."""
+        self._connect_command()
+        self.initialize_sensors()
+
+    def _connect_command(self):
+        """Open the command socket and consume the server greeting."""
         self._comm_socket = socket.create_connection(
             (self.host, self.cmd_port), self.timeout)
         self.send_command("BACKWARDS COMPATIBILITY OFF")
-        self.initiate_data_connection()
-        self.initialize_sensors()
-
         try:
             _ = self._comm_socket.recv(1024)
         except socket.timeout:
             pass
 
     def initiate_data_connection(self):
-        self.avanti_emg_socket = self._connect_to_socket(AvantiSensor().emg_port)
-        self.avanti_aux_socket = self._connect_to_socket(AvantiSensor().aux_port)
-        self.legacy_emg_socket = self._connect_to_socket(LegacySensor().emg_port)
-        self.legacy_aux_socket = self._connect_to_socket(LegacySensor().aux_port)
-        self.all_socket = {"avanti_emg": self.avanti_emg_socket, 
-                           "avanti_aux": self.avanti_aux_socket,
-                           "legacy_emg": self.legacy_emg_socket,
-                           "legacy_aux": self.legacy_aux_socket,
-                           }
+        """
+        Connect the data ports of the streams to read only. The TCU writes to every connected port,
+        a port that is never read would fill up its send buffer.
+        """
+        self.all_socket = {name: self._connect_to_socket(self._stream_port(name))
+                           for name, run in self._threads_to_run.items() if run}
+        self.avanti_emg_socket = self.all_socket.get("avanti_emg")
+        self.avanti_aux_socket = self.all_socket.get("avanti_aux")
+        self.legacy_emg_socket = self.all_socket.get("legacy_emg")
+        self.legacy_aux_socket = self.all_socket.get("legacy_aux")
         self.all_events = {"avanti_emg": threading.Event(), 
                            "avanti_aux": threading.Event(),
                            "legacy_emg": threading.Event(),
                            "legacy_aux": threading.Event(),
                            }
+        self._data_connected = True
+
+    def _close_data_sockets(self):
+        for data_socket in self.all_socket.values():
+            # close() alone does not wake up a reader thread blocked in recv().
+            try:
+                data_socket.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            data_socket.close()
+        self._data_connected = False
 
     def initialize_sensors(self):
-        """Initialize all sensors."""
-        self.sensors = [Sensor(i, self, self.buffer_size) for i in range(1, 16)]
+        """Discover the sensor topology once and preallocate all sensor buffers and demux tables from it."""
+        self.topology = Topology.discover(self)
+        self.sensors = [Sensor(layout.index, None, self.buffer_size, layout) for layout in self.topology.sensors]
+        # Bound here rather than by Sensor(index, self), which would allocate buffers of the default size.
+        for sensor in self.sensors:
+            sensor.trigno_box = self
+        self._allocate_buffers()
+        self._build_demux()
         self._get_which_thread_to_run()
-        
-    def _get_which_thread_to_run(self):
-        is_avanti = [False, False] # EMG and AUX
-        is_legacy = [False, False] # EMG and AUX
+
+    def subscribe(self, sensors=None, emg=True, aux=True):
+        """
+        Restrict the session to some sensors and signals.
+
+        Only the channels of the subscribed sensors are decoded, buffered and passed to the chunk
+        callbacks, and the ports carrying none of them are not read at all. Callbacks receive the
+        subscribed channels only, use ``channel_slice`` to locate a sensor in their data.
+
+        :param sensors: 1-based indices of the sensors to acquire, every sensor if None
+        :param emg: acquire the EMG channels of these sensors
+        :param aux: acquire the aux channels of these sensors
+        :return: the set of subscribed (sensor index, 'emg' or 'aux') pairs, None if everything is acquired
+        """
+        if self._is_streaming:
+            raise RuntimeError("Stop streaming before changing the subscription.")
+        if sensors is None and emg and aux:
+            self.subscription = None
+        else:
+            indices = [layout.index for layout in self.topology.sensors] if sensors is None else list(sensors)
+            kinds = [kind for kind, wanted in (("emg", emg), ("aux", aux)) if wanted]
+            self.subscription = {(index, kind) for index in indices for kind in kinds}
+        self._allocate_buffers()
+        self._build_demux()
+        self._get_which_thread_to_run()
+        return self.subscription
+
+    def _allocate_buffers(self, indices=None):
+        """
+        Size the buffers of the subscribed signals from the history and memory budget, and allocate them.
+        :param indices: sensor indices whose buffers are allocated, every sensor if None. The sizes are
+            planned over all the buffers either way, so the other sensors whose planned capacity changed,
+            e.g. a share of the memory budget taken by a new channel, are reallocated as well.
+        """
+        buffers = {}
+        for layout in self.topology.paired_sensors():
+            if layout.nb_emg_channels and self.is_subscribed(layout.index, "emg"):
+                buffers[(layout.index, "emg")] = (layout.nb_emg_channels, layout.emg_samples, layout.emg_rate)
+            if layout.nb_aux_channels and self.is_subscribed(layout.index, "aux"):
+                buffers[(layout.index, "aux")] = (layout.nb_aux_channels, layout.aux_samples, layout.aux_rate)
+        capacities = plan_history(buffers, self.dtype.itemsize, self.history, self.memory_budget, self.buffer_size)
+        if self.spill is not None:
+            os.makedirs(self.spill, exist_ok=True)
+        for layout in self.topology.sensors:
+            sensor = self.sensors[layout.index - 1]
+            emg_chunks = capacities.get((layout.index, "emg"), 0)
+            aux_chunks = capacities.get((layout.index, "aux"), 0)
+            if (indices is not None and layout.index not in indices
+                    and (sensor.emg_capacity, sensor.aux_capacity) == (emg_chunks, aux_chunks)):
+                continue
+            sensor.initialize(self, layout, *self._subscribed_kinds(layout.index), emg_chunks=emg_chunks,
+                              aux_chunks=aux_chunks, spill=self.spill)
+
+    def get_memory_footprint(self):
+        """
+        Bytes allocated for the sensor buffers and the seconds of history they hold, per sensor and signal,
+        with the totals in memory and spilled to disk.
+        """
+        sensors = {sensor.index: sensor.get_footprint() for sensor in self.sensors if sensor.is_paired}
+        signals = [signal for footprint in sensors.values() for signal in footprint.values()]
+        return {"sensors": sensors,
+                "bytes": sum(signal["bytes"] for signal in signals),
+                "spilled_bytes": sum(signal["spilled_bytes"] for signal in signals),
+                }
+
+    def is_subscribed(self, index, kind):
+        return self.subscription is None or (index, kind) in self.subscription
+
+    def _subscribed_kinds(self, index):
+        return self.is_subscribed(index, "emg"), self.is_subscribed(index, "aux")
+
+    def channel_slice(self, layout, kind):
+        """Channels of a sensor ('emg' or 'aux') in the data passed to chunk callbacks, None if not subscribed."""
+        return self._channel_slices.get((layout.index, kind))
+
+    def stream_channels(self, name):
+        """Number of channels of the data passed to chunk callbacks for a stream."""
+        channels = self._decoded_channels[name]
+        return self.topology.streams[name].n_channels if channels is None else len(channels)
+
+    def _build_demux(self):
+        """
+        Per stream list of (sensor update method, channel slice) used to dispatch decoded chunks,
+        and the channels to decode from each stream (None for every channel).
+        """
+        self._demux = {name: [] for name in self.topology.streams}
+        self._decoded_channels = {name: None if self.subscription is None else [] for name in self.topology.streams}
+        self._channel_slices = {}
+        # Every paired sensor occupies its channels on the wire, subscribed or not.
+        for name, stream in self.topology.streams.items():
+            slices = [sensor.emg_slice if "emg" in name else sensor.aux_slice for sensor in stream.sensors]
+            self.validators[name].set_idle_channels([channel for channels in slices
+                                                     for channel in range(channels.start, channels.stop)])
+        entries = []
         for sensor in self.sensors:
             if not sensor.is_paired:
                 continue
-            avanti = True if sensor.type == Type.Avanti or sensor.type == Type.AvantiGoniometer else False
-            is_avanti[0] = avanti and sensor.nb_emg_channels if not is_avanti[0] else True
-            is_avanti[1] = avanti and sensor.nb_aux_channels if not is_avanti[1] else True
-            is_legacy[0] = sensor.type == Type.Legacy and sensor.nb_emg_channels if not is_legacy[0] else True
-            is_legacy[1] = sensor.type == Type.Legacy and sensor.nb_aux_channels if not is_legacy[1] else True
-        self._threads_to_run = {"avanti_emg": is_avanti[0], 
-                                "avanti_aux": is_avanti[1], 
-                                "legacy_emg": is_legacy[0], 
-                                "legacy_aux": is_legacy[1]}
+            layout = sensor.layout
+            if layout.nb_emg_channels and self.is_subscribed(layout.index, "emg"):
+                entries.append((layout.emg_stream, layout.emg_slice, (layout.index, "emg"), sensor.update_emg_buffer))
+            if layout.nb_aux_channels and self.is_subscribed(layout.index, "aux"):
+                entries.append((layout.aux_stream, layout.aux_slice, (layout.index, "aux"), sensor.update_aux_buffer))
+        for stream, channels, key, update in sorted(entries, key=lambda entry: (entry[0], entry[1].start)):
+            decoded = self._decoded_channels[stream]
+            if decoded is not None:
+                # Keep the decoded channels in stream order, every sensor is then a slice of them.
+                start = len(decoded)
+                decoded.extend(range(channels.start, channels.stop))
+                channels = slice(start, len(decoded))
+            self._channel_slices[key] = channels
+            self._demux[stream].append((update, channels))
+        for callback in self._chunk_callbacks:
+            if isinstance(callback, ChunkPolicy):
+                callback.bind(self)
+        if self._quality_config is not None:
+            self.enable_quality(**self._quality_config)
+
+    def require_streams(self, *names):
+        """Read the data ports of these streams even when no subscribed sensor is on them, e.g. to get raw frames."""
+        for name in names:
+            if name not in self.topology.streams:
+                raise ValueError(f"Unknown stream {name}.")
+        self.required_streams.update(names)
+        self._get_which_thread_to_run()
+
+    def is_stream_running(self, name):
+        """True if a reader thread of the current session reads this stream."""
+        return self._is_streaming and name in self._running_streams
+
+    def _get_which_thread_to_run(self):
+        self._threads_to_run = {name: bool(self._demux[name]) or name in self.required_streams
+                                for name in self.topology.streams}
+
+    @staticmethod
+    def _stream_port(name):
+        return {"avanti_emg": AvantiSensor().emg_port,
+                "avanti_aux": AvantiSensor().aux_port,
+                "legacy_emg": LegacySensor().emg_port,
+                "legacy_aux": LegacySensor().aux_port,
+                }[name]
 
     def _connect_to_socket(self, port):
         _data_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         _data_socket.connect((self.host, port))
+        if self.resilient:
+            # A blocking recv never returns on a silent link, so a stall must time out to be detected.
+            _data_socket.settimeout(self.stall_timeout)
         return _data_socket
 
+    def _is_command_alive(self):
+        if self._comm_socket is None:
+            return False
+        try:
+            self.send_command("BASE SERIAL?", use_cache=False)
+        except OSError:
+            return False
+        return True
+
+    def _recover_command(self, session):
+        """
+        Reconnect the command socket if it is dead and re-issue START. Return True if reconnected.
+        Nothing is done once ``session`` has ended: the socket was closed on purpose by disconnect().
+        """
+        with self._comm_lock:
+            if self._session is not session or self._is_command_alive():
+                return False
+            # The settings may have been changed from the TCU while we were away.
+            self.query_cache.clear()
+            try:
+                self._comm_socket.close()
+            except (OSError, AttributeError):
+                pass
+            self._connect_command()
+            if self._is_streaming:
+                self.send_command("START")
+            return True
+
+    def _recover_stream(self, name, session):
+        """
+        Reconnect the data socket of a stream with exponential backoff.
+        The partial frame received before the failure is discarded: a fresh data connection
+        starts on a frame boundary, so the stream is realigned to the 16/48/144-channel layout.
+        Return True once reconnected, False if ``session`` ended (stop_streaming, disconnect) meanwhile.
+        """
+        # The sockets of the session: a new session may replace all_socket while this one backs off.
+        sockets = self.all_socket
+        port = self._stream_port(name)
+        delay = RECONNECT_BACKOFF
+        attempt = 0
+        while self._session is session:
+            try:
+                sockets[name].close()
+            except OSError:
+                pass
+            try:
+                self._recover_command(session)
+                sockets[name] = self._connect_to_socket(port)
+                if self._session is not session:
+                    # stop_streaming may have closed the data sockets before this one was stored.
+                    sockets[name].close()
+                    return False
+                self.reconnections[name] += 1
+                return True
+            except OSError:
+                attempt += 1
+                if self.max_reconnect is not None and attempt >= self.max_reconnect:
+                    raise
+                time.sleep(delay)
+                delay = min(delay * 2, RECONNECT_MAX_BACKOFF)
+        return False
+
     def _bytes_per_sample(self, n_channels):
         """Return the number of bytes per sample for a given number of channels."""
         return n_channels * BYTES_PER_CHANNEL
@@ -117,98 +393,543 @@ class TrignoSDKClient:
             self._comm_socket.close()
             self._comm_socket = None
 
-    def send_command(self, command: str) -> str:
+    def send_command(self, command: str, use_cache=True) -> str:
         """
         Send a command or query to the Trigno system and return the response as a string.
         Command strings must already include any needed arguments.
+        Static queries are answered from the query cache unless ``use_cache`` is False.
         """
         if self._comm_socket is None:
             raise RuntimeError("Not connected. Call connect() first.")
 
+        cached = self.query_cache.lookup(command) if use_cache else None
+        if cached is not None:
+            return cached
+        if self.query_cache.is_mutating(command):
+            self.query_cache.invalidate_for(command)
+
         full_command = f"{command}\r\n\r\n"
-        self._comm_socket.sendall(full_command.encode('ascii'))
+        with self._comm_lock:
+            self._comm_socket.sendall(full_command.encode('ascii'))
 
-        # If in fast mode, return immediately without waiting for a response
-        if self.fast_mode:
-            return ""
-        
-        # Give the server time to respond
-        time.sleep(0.3)
+            # If in fast mode, return immediately without waiting for a response
+            if self.fast_mode:
+                return ""
+
+            # Give the server time to respond
+            time.sleep(0.3)
+            try:
+                response = self._comm_socket.recv(1024)
+            except socket.timeout:
+                return None
+        if not response:
+            raise ConnectionError("Command connection closed by the server.")
+        response = self._filter_trigger_messages(response.decode('ascii')).strip()
+        self.query_cache.store(command, response)
+        return response
+
+    def send_commands(self, commands):
+        """
+        Send several commands in a single write and return their responses in order.
+        Responses are split on the command terminator instead of waiting a fixed delay per command,
+        so a batch costs one round trip. A response missing after ``timeout`` is returned as None.
+        """
+        if self._comm_socket is None:
+            raise RuntimeError("Not connected. Call connect() first.")
+        if not commands:
+            return []
+
+        # Queries are answered from the cache unless a mutating command precedes them in the batch.
+        cached = {}
+        to_send = []
+        mutated = False
+        for i, command in enumerate(commands):
+            mutated = mutated or self.query_cache.is_mutating(command)
+            response = None if mutated else self.query_cache.lookup(command)
+            if response is None:
+                to_send.append(command)
+            else:
+                cached[i] = response
+        if not to_send:
+            return [cached[i] for i in range(len(commands))]
+
+        sent = iter(self._send_batch(to_send))
+        responses = [cached[i] if i in cached else next(sent) for i in range(len(commands))]
+        for command, response in zip(commands, responses):
+            if self.query_cache.is_mutating(command):
+                self.query_cache.invalidate_for(command)
+            else:
+                self.query_cache.store(command, response)
+        return responses
+
+    def _send_batch(self, commands):
+        payload = "".join(f"{command}{CMD_TERM}" for command in commands)
+        terminator = CMD_TERM.encode('ascii')
+        with self._comm_lock:
+            self._drain_command()
+            self._comm_socket.sendall(payload.encode('ascii'))
+            if self.fast_mode:
+                return [""] * len(commands)
+
+            received = bytes()
+            while received.count(terminator) < len(commands):
+                try:
+                    chunk = self._comm_socket.recv(4096)
+                except socket.timeout:
+                    break
+                if not chunk:
+                    raise ConnectionError("Command connection closed by the server.")
+                received += chunk
+                if self.trigger_gates:
+                    received = self._filter_trigger_messages(received.decode('ascii')).encode('ascii')
+        responses = [response.decode('ascii').strip() for response in received.split(terminator)[:-1]]
+        return responses + [None] * (len(commands) - len(responses))
+
+    def _drain_command(self):
+        """Discard unread bytes of the command socket, such as the late answer of a timed out query."""
+        self._comm_socket.setblocking(False)
         try:
-            response = self._comm_socket.recv(1024)
-            return response.decode('ascii').strip()
-        except socket.timeout:
-            return None
+            while True:
+                unread = self._comm_socket.recv(4096)
+                if not unread:
+                    break
+                self._dispatch_trigger_messages(unread)
+        except (BlockingIOError, InterruptedError):
+            pass
+        finally:
+            self._comm_socket.settimeout(self.timeout)
+
+    def arm_trigger(self, pre_trigger=1.0, stop_trigger=True):
+        """
+        Enable the hardware start (and stop) trigger and gate acquisition on it.
+
+        Until a start edge, the words of the subscribed channels are kept
+        undecoded in a preallocated ring of ``pre_trigger`` seconds; only the
+        windows between start and stop edges are decoded and dispatched to the
+        sensors. The TCU notifies edges with unsolicited START/STOP messages on
+        the command port, which are watched while the trigger is armed. Edges
+        can also be injected with trigger_edge().
+
+        :param pre_trigger: duration of the pre-trigger history, in seconds
+        :param stop_trigger: whether the stop trigger closes the recording window
+        :return: dict of TriggerGate by stream name
+        """
+        self.send_commands(["TRIGGER START ON", f"TRIGGER STOP {'ON' if stop_trigger else 'OFF'}"])
+        gates = {}
+        for name, stream in self.topology.streams.items():
+            if not self._threads_to_run[name]:
+                continue
+            pre_trigger_chunks = int(np.ceil(pre_trigger * stream.rate / stream.n_samples))
+            # The pre-trigger history has the channels passed to the chunk callbacks, see channel_slice.
+            gates[name] = TriggerGate(stream.chunk_bytes, stream.n_channels, stream.n_samples,
+                                      pre_trigger_chunks, self.dtype, self._decoded_channels[name])
+        self.trigger_gates = gates
+        threading.Thread(target=self._watch_triggers, name='trigger', daemon=True).start()
+        return gates
+
+    def disarm_trigger(self):
+        """Disable the hardware triggers and return to continuous acquisition."""
+        self.trigger_gates = {}
+        return self.send_commands(["TRIGGER START OFF", "TRIGGER STOP OFF"])
+
+    def trigger_edge(self, edge):
+        """Signal a 'START' or 'STOP' edge to every gated stream, e.g. for a software trigger."""
+        for gate in self.trigger_gates.values():
+            gate.signal(edge)
+
+    def _dispatch_trigger_messages(self, raw):
+        self._filter_trigger_messages(raw.decode('ascii', errors='ignore'))
+
+    def _filter_trigger_messages(self, text):
+        """Signal the trigger messages found in ``text`` while armed and return the remaining text."""
+        if not self.trigger_gates:
+            return text
+        kept = []
+        for message in text.split(CMD_TERM):
+            if message.strip() in TRIGGER_EDGES:
+                self.trigger_edge(message.strip())
+            else:
+                kept.append(message)
+        return CMD_TERM.join(kept)
+
+    def _watch_triggers(self):
+        """Poll the command socket for trigger messages between commands while the trigger is armed."""
+        gates = self.trigger_gates
+        while self.trigger_gates is gates:
+            with self._comm_lock:
+                try:
+                    self._drain_command()
+                except OSError:
+                    pass
+            time.sleep(0.005)
+
+    def configure(self, modes=None, pair=()):
+        """
+        Apply sensor modes and pairing requests in one pipelined batch and verify them.
+
+        Only the sensors whose layout changed get their buffers reallocated and their
+        demux entries rebuilt, the rest of the topology is kept as is. With a memory
+        budget, the buffers of the other sensors are resized too if their share changed.
+
+        :param modes: dict mapping sensor index to a mode (EMGAvantiMode, GoniometerMode or int)
+        :param pair: iterable of sensor indices to put in pairing mode
+        :return: list of the indices of the sensors whose layout changed
+        """
+        if self._is_streaming:
+            raise RuntimeError("Stop streaming before configuring sensors.")
+        modes = {index: getattr(mode, "value", mode) for index, mode in (modes or {}).items()}
+        pair = list(pair)
+        commands = [f"SENSOR {n} PAIR" for n in pair] + [f"SENSOR {n} SETMODE {mode}" for n, mode in modes.items()]
+        responses = self.send_commands(commands)
+        failed = [command for command, response in zip(commands, responses)
+                  if not self.fast_mode and response != "OK"]
+        if failed:
+            raise RuntimeError(f"Commands rejected by the Trigno system: {failed}")
+
+        layouts, max_emg_samples, max_aux_samples = Topology.query_layouts(self, sorted(set(pair) | set(modes)))
+        wrong_modes = [n for n in modes if layouts[n].mode != str(modes[n])]
+        if wrong_modes:
+            raise RuntimeError(f"Sensors {wrong_modes} did not switch to the requested mode.")
+
+        if (self.topology.max_emg_samples, self.topology.max_aux_samples) != (max_emg_samples, max_aux_samples):
+            # The frame shape changed, every buffer has to follow.
+            self.initialize_sensors()
+            return [layout.index for layout in self.topology.sensors]
+
+        changed = self.topology.update(list(layouts.values()))
+        self._allocate_buffers(changed)
+        self._build_demux()
+        self._get_which_thread_to_run()
+        return changed
         
-    def read(self, connection, buffer_size, n_channels):
-        l = 0
-        packet = bytes()
-        while l < buffer_size:
-            packet += connection.recv(buffer_size-l)
-            l = len(packet)
-        data = np.asarray(struct.unpack('<'+'f'*(buffer_size // 4), packet))
-        data = np.transpose(data.reshape((-1, n_channels)))
-        return data
+    def _recv_exactly(self, connection, n_bytes):
+        # Receive in place: a chunk arrives in several segments and concatenating them copies it again each time.
+        packet = bytearray(n_bytes)
+        view = memoryview(packet)
+        received = 0
+        while received < n_bytes:
+            n = connection.recv_into(view[received:])
+            if not n:
+                raise ConnectionError("Data connection closed by the server.")
+            received += n
+        return packet
+
+    def read(self, connection, buffer_size, n_channels, validator=None):
+        return self.decode(self._read_packet(connection, buffer_size, validator), n_channels)
+
+    def _read_packet(self, connection, buffer_size, validator=None):
+        packet = self._recv_exactly(connection, buffer_size)
+        if validator is not None:
+            if not validator.is_valid(packet):
+                shift = validator.find_shift(packet)
+                if validator.confirm_shift(shift):
+                    # Drop the partial word or frame and complete the chunk from the stream.
+                    packet = packet[shift:] + self._recv_exactly(connection, shift)
+                    validator.resync(shift)
+        return packet
+
+    def decode(self, packet, n_channels, channels=None):
+        """
+        Decode a chunk as a (n_channels, n_samples) array.
+        :param channels: indices of the channels to decode, all channels if None
+        """
+        # Every packet is a new bytearray, so float32 samples can be used in place without a copy.
+        data = np.frombuffer(packet, dtype='<f4').reshape((-1, n_channels))
+        if channels is not None:
+            data = data[:, channels]
+        return np.transpose(data.astype(self.dtype, copy=False))
 
     def start_streaming(self):
+        if not self._data_connected:
+            # stop_streaming closed the data connections of the previous session.
+            self.initiate_data_connection()
         is_started = self.send_command("START") == "OK"
         if not is_started and not self.fast_mode:
             raise RuntimeError("Streaming not started.")
+        self._is_streaming = True
+        # Threads of a previous session exit as soon as they see the session changed.
+        self._session = object()
         self._launch_threads()
 
     def buffer_size_for_type(self, name):
-        if "emg" in name:
-            n_samples = self.get_max_emg_samples()
-            n_channel = 16
-            buffer_size = n_channel * n_samples * BYTES_PER_CHANNEL
-        elif "aux" in name:
-            n_samples = self.get_max_aux_samples()
-            n_channel = 144 if "avanti" in name.lower() else 48
-            buffer_size = n_channel * n_samples * BYTES_PER_CHANNEL
-        else:
+        if name not in self.topology.streams:
             raise RuntimeError("Invalid sensor type.")
-        return buffer_size, n_channel, n_samples
+        stream = self.topology.streams[name]
+        return stream.chunk_bytes, stream.n_channels, stream.n_samples
 
-    def _launch_one_thread(self, socket_tmp, name, data_queue, event):
+    def _launch_one_thread(self, name, data_queue, event):
+        session, sockets = self._session, self.all_socket
         buffer_size, n_chanels, n_samples = self.buffer_size_for_type(name)
+        rate = self.topology.streams[name].rate
+        clock = self.clocks[name] = DriftEstimator(rate)
+        decoded_channels = self._decoded_channels[name]
         def _thread_func():
             count = 0
-            while True:
-                data = self.read(socket_tmp, buffer_size, n_chanels)
+            last_chunk_time = time.monotonic()
+            while self._session is session:
+                try:
+                    packet = self._read_packet(sockets[name], buffer_size, self.validators[name])
+                except OSError:
+                    if self._session is not session:
+                        # The sockets were closed by stop_streaming().
+                        return
+                    if not self.resilient:
+                        raise
+                    if not self._recover_stream(name, session):
+                        return
+                    # Whatever the device produced since the last complete chunk is lost,
+                    # keep the sample index timeline continuous by skipping over it.
+                    n_lost = int(round((time.monotonic() - last_chunk_time) * rate))
+                    if n_lost > 0:
+                        self.gaps[name].append((count, n_lost))
+                        count += n_lost
+                    last_chunk_time = time.monotonic()
+                    continue
+                last_chunk_time = time.monotonic()
+                clock.add(count + n_samples, last_chunk_time)
+                gate = self.trigger_gates.get(name)
+                if gate is not None and not gate.admit(packet, count):
+                    count += n_samples
+                    continue
+                data = self.decode(packet, n_chanels, decoded_channels)
+                monitor = self.quality.get(name)
+                if monitor is not None:
+                    monitor.update(data, count)
+                for callback in self._chunk_callbacks:
+                    try:
+                        callback(name, data, count)
+                    except Exception as error:
+                        # A failing consumer must not stop the acquisition of the others.
+                        self.callback_errors[name] += 1
+                        self.last_callback_error = error
                 data_queue.queue.clear()
-                data_queue.put_nowait((data, count))
+                data_queue.put_nowait((data, count, last_chunk_time))
                 event.set()
                 count += n_samples
         thread = threading.Thread(target=_thread_func, name=name)
         thread.start()
 
     def _launch_threads(self):
-        all_soc, all_q, all_ev = self.all_socket, self.all_queue, self.all_events
-        _ = [self._launch_one_thread(all_soc[n], n, all_q[n], all_ev[n]) for n in self._threads_to_run.keys() if self._threads_to_run[n]]
+        session, all_q, all_ev = self._session, self.all_queue, self.all_events
+        running = [n for n in self._threads_to_run.keys() if self._threads_to_run[n]]
+        self._running_streams = set(running)
+        _ = [self._launch_one_thread(n, all_q[n], all_ev[n]) for n in running]
    
         def _main_thread_func():
-            while True:
-                for name in self.all_socket.keys():
-                    self.all_events[name].wait()
-                    self.all_events[name].clear()
+            while self._session is session:
+                for name in running:
+                    while not all_ev[name].wait(0.5):
+                        if self._session is not session:
+                            return
+                    all_ev[name].clear()
                 self._set_all_data()
 
         main_thread = threading.Thread(target=_main_thread_func, name='main')
         main_thread.start()
         
+    def get_host_time(self, name, sample_index):
+        """Monotonic host time of sample indices of a stream, corrected for the device clock drift."""
+        return self.clocks[name].to_host_time(sample_index)
+
+    def get_clock_stats(self):
+        """Return the estimated rate and drift of every running stream."""
+        return {name: {"rate": clock.estimated_rate, "drift": clock.drift, "chunks": clock.n_chunks}
+                for name, clock in self.clocks.items()}
+
+    def add_chunk_callback(self, callback, batch_samples=None, latency=None):
+        """
+        Call ``callback(stream_name, data, first_sample_index)`` for every decoded chunk.
+        Callbacks run in the reader thread of the stream, so no chunk is missed, and must return quickly.
+        :param batch_samples: deliver blocks of exactly this number of samples instead of device frames
+        :param latency: deliver as many device frames at once as fit in this latency (s), see ChunkPolicy
+        """
+        if batch_samples is not None or latency is not None:
+            callback = ChunkPolicy(callback, batch_samples, latency).bind(self)
+        self._chunk_callbacks = self._chunk_callbacks + [callback]
+
+    def remove_chunk_callback(self, callback):
+        """Stop calling ``callback``, after delivering the incomplete batch of its policy if any."""
+        policies = [c for c in self._chunk_callbacks if isinstance(c, ChunkPolicy) and c.callback is callback]
+        self._chunk_callbacks = [c for c in self._chunk_callbacks if c is not callback and c not in policies]
+        for policy in policies:
+            policy.flush()
+
+    def record(self, path, codec="zlib", quantize_emg=False, chunk_samples=8192):
+        """
+        Record the EMG and aux data of every paired sensor to a compressed archive, see ArchiveWriter.
+        :param quantize_emg: store EMG as int16 over the +/-11 mV range instead of lossless float32
+        :return: the ArchiveWriter, closed by stop_recording()
+        """
+        if self._recorder is not None:
+            raise RuntimeError("Already recording.")
+        writer = ArchiveWriter(path, codec, chunk_samples)
+        writer.add_sensor_streams(self.topology, quantize_emg, self.subscription)
+        writer.metadata.update(host=self.host, start_time=time.time())
+        routes = {name: [] for name in self.topology.streams}
+        for layout in self.topology.paired_sensors():
+            if layout.nb_emg_channels and self.is_subscribed(layout.index, "emg"):
+                routes[layout.emg_stream].append((f"sensor{layout.index}_emg", self.channel_slice(layout, "emg")))
+            if layout.nb_aux_channels and self.is_subscribed(layout.index, "aux"):
+                routes[layout.aux_stream].append((f"sensor{layout.index}_aux", self.channel_slice(layout, "aux")))
+
+        # Held while a chunk is written, so stop_recording closes the archive between two chunks.
+        lock = threading.Lock()
+
+        def _write_chunk(name, data, count):
+            first_sample_time = float(self.clocks[name].to_wall_time(count))
+            # The first chunk of a trigger window follows an idle span of the gate, not lost data.
+            gate = self.trigger_gates.get(name)
+            idle = gate is not None and bool(gate.windows) and gate.windows[-1][0] == count
+            with lock:
+                # A reader thread may still hold the callback list from before stop_recording.
+                if writer.closed:
+                    return
+                for key, channels in routes[name]:
+                    writer.write(key, data[channels], count, first_sample_time, idle)
+
+        self.add_chunk_callback(_write_chunk)
+        self._recorder = (writer, _write_chunk, lock)
+        return writer
+
+    def stop_recording(self):
+        if self._recorder is None:
+            return
+        writer, callback, lock = self._recorder
+        self.remove_chunk_callback(callback)
+        self._recorder = None
+        # Wait for the chunk being written by a reader thread, if any.
+        with lock:
+            self._close_recording(writer)
+
+    def _close_recording(self, writer):
+        """Index the trigger edges of a recording and close its archive."""
+        try:
+            # Index the trigger edges on every archived stream fed by the gated data port.
+            for key in writer.streams:
+                sensor = self.sensors[int(key[len("sensor"):key.index("_")]) - 1]
+                stream = sensor.layout.emg_stream if key.endswith("_emg") else sensor.layout.aux_stream
+                gate = self.trigger_gates.get(stream)
+                timeline = writer.index.timelines[key]
+                if gate is None or not timeline.device_index:
+                    continue
+                for edge, device_index in gate.edges:
+                    # Edges from before or after the recording have no place in the archive.
+                    if not timeline.device_index[0] <= device_index <= timeline.next_device_index:
+                        continue
+                    archive_index = writer.index.archive_index_of_device(key, device_index)
+                    writer.index.add_event("trigger", key, archive_index, device_index,
+                                           timeline.time_at(archive_index), edge=edge)
+        finally:
+            writer.close()
+
+    def enable_previews(self, emg_rate=100., aux_rate=None, history=1000):
+        """Maintain downsampled previews for every paired sensor, see Sensor.enable_preview."""
+        for sensor in self.sensors:
+            sensor.enable_preview(emg_rate, aux_rate, history)
+
+    def enable_quality(self, line_frequency=50., flat_duration=0.05, window=1.):
+        """
+        Monitor the signal quality of every acquired sensor, see QualityMonitor.
+
+        One monitor runs per data stream on all its acquired channels at once, in the reader
+        thread so that every chunk is checked. EMG streams are checked for dropouts, flat
+        lines, saturation near the +/-11 mV range and line noise, aux streams for dropouts and
+        flat lines. Results are read with Sensor.get_quality() or get_quality().
+        """
+        self._quality_config = dict(line_frequency=line_frequency, flat_duration=flat_duration, window=window)
+        monitors = {}
+        for name, stream in self.topology.streams.items():
+            if not self._demux[name]:
+                continue
+            is_emg = name.endswith("_emg")
+            # One group per sensor, to estimate the packet loss of each sensor
+            groups = {index: channels for (index, kind), channels in self._channel_slices.items()
+                      if getattr(self.sensors[index - 1].layout, f"{kind}_stream") == name}
+            monitors[name] = QualityMonitor(self.stream_channels(name), stream.rate, EMG_RANGE if is_emg else None,
+                                            line_frequency if is_emg else None, flat_duration, window, groups=groups)
+        self.quality = monitors
+        return monitors
+
+    def disable_quality(self):
+        self._quality_config = None
+        self.quality = {}
+
+    def get_quality(self):
+        """Quality report of every acquired sensor, by sensor index, see Sensor.get_quality."""
+        return {sensor.index: sensor.get_quality() for sensor in self.sensors
+                if sensor.is_paired and (sensor.emg_subscribed or sensor.aux_subscribed)}
+
+    def enable_orientation(self, sensors=None, beta=0.1, use_magnetometer=True):
+        """
+        Estimate the orientation of the IMU sensors (9 aux channels: acc, gyro, mag) from every aux chunk.
+        All sensors are updated together by a single OrientationFilter, in the aux reader thread.
+        :param sensors: 1-based indices of the sensors to track, every IMU sensor of the Avanti aux stream if None.
+            Sensors of an unknown type are only tracked when listed here.
+        :return: the OrientationFilter, its ``sensor_indices`` attribute gives the sensor of each row
+        """
+        self.disable_orientation()
+        layouts = [layout for layout in self.topology.paired_sensors()
+                   if layout.nb_aux_channels == IMU_CHANNELS and self.is_subscribed(layout.index, "aux")
+                   and (layout.type is not Type.Unknown if sensors is None else layout.index in sensors)]
+        if not layouts:
+            raise RuntimeError("No IMU sensor to track.")
+        streams = {layout.aux_stream for layout in layouts}
+        if len(streams) > 1:
+            raise RuntimeError("Avanti and legacy IMU sensors cannot be tracked by the same filter.")
+        stream = streams.pop()
+        orientation = OrientationFilter(len(layouts), self.topology.streams[stream].rate, beta, use_magnetometer)
+        orientation.sensor_indices = [layout.index for layout in layouts]
+        # Gather every tracked channel of the aux chunk in a single fancy indexing
+        slices = [self.channel_slice(layout, "aux") for layout in layouts]
+        channels = np.concatenate([np.arange(channels.start, channels.stop) for channels in slices])
+
+        def _update_orientation(name, data, count):
+            if name == stream:
+                orientation.update_from_aux(data[channels])
+
+        self.add_chunk_callback(_update_orientation)
+        self._orientation = (orientation, _update_orientation)
+        return orientation
+
+    def disable_orientation(self):
+        if self._orientation is not None:
+            self.remove_chunk_callback(self._orientation[1])
+            self._orientation = None
+
+    def get_orientation(self):
+        """Return the (n_sensors, 4) quaternions of the sensors tracked since enable_orientation()."""
+        if self._orientation is None:
+            raise RuntimeError("Orientation tracking is not enabled.")
+        return self._orientation[0].quaternions
+
+    def get_cache_stats(self):
+        """Return the hit/miss counters of the command channel query cache."""
+        return self.query_cache.stats
+
+    def get_integrity_stats(self):
+        """Return the frame integrity counters of every stream."""
+        return {name: validator.stats for name, validator in self.validators.items()}
+
     def stop_streaming(self):
-        return self.send_command("STOP")
+        """Stop the device and the reader threads, start_streaming reconnects the data ports."""
+        self._is_streaming = False
+        self._session = None
+        self._running_streams = set()
+        response = self.send_command("STOP")
+        if self._data_connected:
+            self._close_data_sockets()
+        return response
     
     def disconnect(self):
         self.stop_streaming()
-        _ = [socket.close() for socket in self.all_socket.values()]
-        self._comm_socket.close()
+        with self._comm_lock:
+            self._comm_socket.close()
+            self._comm_socket = None
+        for sensor in self.sensors:
+            sensor.close_spill()
     
     def get_emg_streaming_rate(self):
-        return int(self.send_command("MAX SAMPLES EMG")) * 0.0135
-    
-    def get_aux_streaming_rate(self):
-        return int(self.send_command("MAX SAMPLES AUX")) * 0.0135
+        return int(self.send_command("MAX SAMPLES EMG")) / FRAME_INTERVAL
 
     def get_max_emg_samples(self):
         return int(self.send_command("MAX SAMPLES EMG"))
@@ -217,7 +938,7 @@ class TrignoSDKClient:
         return int(self.send_command("MAX SAMPLES AUX"))
     
     def get_aux_streaming_rate(self):
-        return int(self.send_command("MAX SAMPLES AUX")) * 0.0135
+        return int(self.send_command("MAX SAMPLES AUX")) / FRAME_INTERVAL
 
     def get_trigger_state(self):
         return self.send_command("TRIGGER?")
@@ -258,7 +979,7 @@ class TrignoSDKClient:
     
     def get_list_sensors_and_idx(self):
         sensors = []
-        for i in range(1, 16):
+        for i in range(1, N_SENSORS + 1):
             if self.is_sensor_paired(i):
                 sensors.append([self.get_sensor_info(i, 'TYPE'), self.get_sensor_idx(i)])
             else:
@@ -285,58 +1006,24 @@ class TrignoSDKClient:
     
     def get_number_emgchannel(self):
         nb_channel = 0
-        for i in range(1, 16):
+        for i in range(1, N_SENSORS + 1):
             nb_channel += self.get_sensor_emgchannel(i)
         return nb_channel
     
     def get_number_auxchannel(self):
         nb_channel = 0
-        for i in range(1, 16):
+        for i in range(1, N_SENSORS + 1):
             nb_channel += self.get_sensor_auxchannel(i)
         return nb_channel
 
-    def _set_avanti_emg_data(self):
-        try:
-            data = self.avanti_emg_queue.get_nowait()
-            for sensor in self.sensors:
-                if sensor.type == Type.Avanti or sensor.type == Type.AvantiGogniometer:
-                    sensor.update_emg_buffer(data[0][sensor.emg_range[0]:sensor.emg_range[1], :], data[1])
-        except:
-            return
-    
-    def _set_avanti_aux_data(self):
-        try:
-            data = self.avanti_aux_queue.get_nowait()
-            for sensor in self.sensors:
-                if sensor.type == Type.Avanti or sensor.type == Type.AvantiGogniometer:
-                    sensor.update_aux_buffer(data[0][sensor.aux_range[0]:sensor.aux_range[1], :], data[1])
-        except:
-            return
-        
-    def _set_legacy_emg_data(self):
+    def _set_stream_data(self, name):
         try:
-            data = self.legacy_emg_queue.get_nowait()
-            for sensor in self.sensors:
-                if sensor.type == Type.Legacy:
-                    sensor.update_emg_buffer(data[0][sensor.emg_range[0]:sensor.emg_range[1], :], data[1])
-        except:
+            data, count, _ = self.all_queue[name].get_nowait()
+        except Empty:
             return
-        
-    def _set_legacy_aux_data(self):
-        try:
-            data = self.legacy_aux_queue.get_nowait()
-            for sensor in self.sensors:
-                if sensor.type == Type.Legacy:
-                    sensor.update_aux_buffer(data[0][sensor.aux_range[0]:sensor.aux_range[1], :], data[1])
-        except:
-            return
-    
-    def _set_all_data(self):
-        self._set_avanti_emg_data(),
-        self._set_avanti_aux_data(),
-        self._set_legacy_emg_data(),
-        self._set_legacy_aux_data(),
-        
-            
-
+        for update, channels in self._demux[name]:
+            update(data[channels], count)
 
+    def _set_all_data(self):
+        for name in self._demux:
+            self._set_stream_data(name)
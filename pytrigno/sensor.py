@@ -1,24 +1,23 @@
+from typing import TYPE_CHECKING
 from .enums import SensorType
-from sdk_client import TrignoSDKClient
-from enum import Enum, IntEnum
+from .topology import SensorLayout, Type
+from .preview import PreviewStream
+from .history import SpillFile, CHUNK_START_BYTES
 import numpy as np
 
-
-class Type(Enum):
-    Avanti = 'O'
-    Legacy = 'A'
-    AvantiGogniometer = '23'
+if TYPE_CHECKING:
+    from .sdk_client import TrignoSDKClient
 
 
 class Sensor:
-    def __init__(self, index, trigno_box=None, buff_size=100):
+    def __init__(self, index, trigno_box=None, buff_size=100, layout=None):
         self.buff_size = buff_size
         self.name = f'sensor {index}'
         self.index = index
+        self.is_paired = False
         self.type = None
         self.mode = None
         self.units = None
-        self.type = None
         self.range = None
         self.nb_emg_channels = None
         self.nb_aux_channels = None
@@ -28,100 +27,248 @@ class Sensor:
         self.aux_rate = None
         self._index_emg = 0
         self._index_aux = 0
-        self._emg_frame_numbers = []
-        self._aux_frame_numbers = []
+        self._emg_chunk_starts = None
+        self._aux_chunk_starts = None
+        self.emg_subscribed = True
+        self.aux_subscribed = True
+        self.emg_capacity = 0
+        self.aux_capacity = 0
         self.sensor_start_idx = 0
+        self.layout = layout
 
         self.emg_buffer = None
         self.aux_buffer = None
+        self.emg_preview = None
+        self.aux_preview = None
+        self._preview_config = None
+        self.emg_spill = None
+        self.aux_spill = None
         self.trigno_box = trigno_box
 
         if trigno_box is not None:
-            self.initialize(trigno_box)
+            self.initialize(trigno_box, layout)
 
-    def initialize(self, trigno_box: TrignoSDKClient):
+    def initialize(self, trigno_box: 'TrignoSDKClient', layout: SensorLayout = None, emg=True, aux=True,
+                   emg_chunks=None, aux_chunks=None, spill=None):
         """
-        Initialize the sensor
+        Initialize the sensor and preallocate its buffers
         :param trigno_box: TrignoBox object
+        :param layout: SensorLayout of the sensor, discovered from the command channel if None
+        :param emg: False if the EMG channels are not subscribed, the EMG buffer then holds no chunk
+        :param aux: False if the aux channels are not subscribed, the aux buffer then holds no chunk
+        :param emg_chunks: capacity of the EMG buffer in chunks, buff_size if None
+        :param aux_chunks: capacity of the aux buffer in chunks, buff_size if None
+        :param spill: directory where the chunks evicted from the buffers are kept, see SpillFile.
+            New spill files are started, the previous ones of the sensor are kept.
         :return: None
         """
-        if self.is_sensor_paired():
-            self.is_paired = False
+        self.close_spill()
+        if layout is None:
+            layout = SensorLayout.discover(trigno_box, self.index,
+                                           trigno_box.get_max_emg_samples(), trigno_box.get_max_aux_samples())
+        self.layout = layout
+        self.is_paired = layout.is_paired
+        if not self.is_paired:
+            return
+
+        self.mode = layout.mode
+        self.type = layout.type
+        self.nb_emg_channels = layout.nb_emg_channels
+        self.nb_aux_channels = layout.nb_aux_channels
+        self.max_emg_samples = layout.emg_samples
+        self.max_aux_samples = layout.aux_samples
+        self.emg_rate = layout.emg_rate
+        self.aux_rate = layout.aux_rate
+        self.sensor_start_idx = layout.emg_offset
+        self.emg_range = (layout.emg_slice.start, layout.emg_slice.stop)
+        self.aux_range = (layout.aux_slice.start, layout.aux_slice.stop)
+
+        self.emg_subscribed = emg
+        self.aux_subscribed = aux
+        n_emg_chunks = (self.buff_size if emg_chunks is None else emg_chunks) if emg else 0
+        n_aux_chunks = (self.buff_size if aux_chunks is None else aux_chunks) if aux else 0
+        self.emg_capacity = n_emg_chunks
+        self.aux_capacity = n_aux_chunks
+        self._index_emg = 0
+        self._index_aux = 0
+        self.emg_buffer = np.zeros((self.nb_emg_channels, self.max_emg_samples, n_emg_chunks), dtype=trigno_box.dtype)
+        self.aux_buffer = np.zeros((self.nb_aux_channels, self.max_aux_samples, n_aux_chunks), dtype=trigno_box.dtype)
+        # Sample index of the first sample of each buffered chunk, -1 while the slot is empty
+        self._emg_chunk_starts = np.full(n_emg_chunks, -1, dtype=np.int64)
+        self._aux_chunk_starts = np.full(n_aux_chunks, -1, dtype=np.int64)
+        if spill is not None:
+            if n_emg_chunks and self.nb_emg_channels:
+                self.emg_spill = SpillFile(SpillFile.path_for(spill, self.index, "emg"), self.nb_emg_channels,
+                                           trigno_box.dtype)
+            if n_aux_chunks and self.nb_aux_channels:
+                self.aux_spill = SpillFile(SpillFile.path_for(spill, self.index, "aux"), self.nb_aux_channels,
+                                           trigno_box.dtype)
+        if self._preview_config is not None:
+            self.enable_preview(**self._preview_config)
+
+    def enable_preview(self, emg_rate=100., aux_rate=None, history=1000):
+        """
+        Maintain downsampled previews (decimated signal, min/max envelope, RMS) next to the raw buffers.
+        :param emg_rate: preview rate of the EMG channels in Hz, None to disable
+        :param aux_rate: preview rate of the aux channels in Hz, None to disable
+        :param history: number of preview samples kept
+        """
+        self._preview_config = dict(emg_rate=emg_rate, aux_rate=aux_rate, history=history)
+        if not self.is_paired:
             return
-        
-        self.is_paired = True
-        self.mode = self.get_sensor_mode()
-        self.units = self.get_sensor_units()
-        self.type = self.get_sensor_type()
-        self.nb_emg_channels = self.get_sensor_emgchannel()
-        self.nb_aux_channels = self.get_sensor_auxchannel()
-        self.aux_rate = self.get_aux_streaming_rate()
-        self.sensor_start_idx = self.get_sensor_idx()
-        self.emg_range = (self.sensor_start_idx, self.sensor_start_idx + self.nb_emg_channels)
-        self.aux_range = (self.sensor_start_idx * 9, self.sensor_start_idx * 9 + self.nb_aux_channels)
-
-        self.emg_buffer = np.empty((self.nb_emg_channels, self.max_emg_samples, self.buff_size))
-        self.aux_buffer = np.empty((self.nb_aux_channels, self.max_aux_samples, self.buff_size))
+        dtype = self.emg_buffer.dtype
+        self.emg_preview = None
+        self.aux_preview = None
+        if emg_rate is not None and self.nb_emg_channels and self.emg_subscribed:
+            self.emg_preview = PreviewStream(self.nb_emg_channels, self.emg_rate, emg_rate, history, dtype)
+        if aux_rate is not None and self.nb_aux_channels and self.aux_subscribed:
+            self.aux_preview = PreviewStream(self.nb_aux_channels, self.aux_rate, aux_rate, history, dtype)
+
+    def disable_preview(self):
+        self._preview_config = None
+        self.emg_preview = None
+        self.aux_preview = None
 
     @property
     def last_emg_chunck(self):
-        return self.emg_buffer[..., self._index_emg]
-    
+        """Latest EMG chunk, None if the EMG channels are not buffered (unpaired sensor or not subscribed)."""
+        if not self.emg_capacity:
+            return None
+        return self.emg_buffer[..., (self._index_emg - 1) % self.emg_capacity]
+
     @property
     def last_aux_chunck(self):
-        return self.aux_buffer[..., self._index_aux]
-    
+        """Latest aux chunk, None if the aux channels are not buffered (unpaired sensor or not subscribed)."""
+        if not self.aux_capacity:
+            return None
+        return self.aux_buffer[..., (self._index_aux - 1) % self.aux_capacity]
+
     def update_emg_buffer(self, emg_data, n_chunck=None):
         if not self.is_paired:
             return
-        self.extend_frame_numbers(self._emg_frame_numbers, n_chunck, self.max_emg_samples)
+        start = self._next_chunk_start(self._emg_chunk_starts, self._index_emg, n_chunck, self.max_emg_samples)
+        if self.emg_spill is not None and self._emg_chunk_starts[self._index_emg] >= 0:
+            self.emg_spill.append(self.emg_buffer[..., self._index_emg], self._emg_chunk_starts[self._index_emg])
+        self._emg_chunk_starts[self._index_emg] = start
         self.emg_buffer[..., self._index_emg] = emg_data
-        self._index_emg = (self._index_emg + 1) % self.buff_size
+        self._index_emg = (self._index_emg + 1) % self.emg_capacity
+        if self.emg_preview is not None:
+            self.emg_preview.update(emg_data, start)
 
     def update_aux_buffer(self, aux_data, n_chunck=None):
         if not self.is_paired:
             return
-        self.extend_frame_numbers(self._aux_frame_numbers, n_chunck, self.max_aux_samples)
+        start = self._next_chunk_start(self._aux_chunk_starts, self._index_aux, n_chunck, self.max_aux_samples)
+        if self.aux_spill is not None and self._aux_chunk_starts[self._index_aux] >= 0:
+            self.aux_spill.append(self.aux_buffer[..., self._index_aux], self._aux_chunk_starts[self._index_aux])
+        self._aux_chunk_starts[self._index_aux] = start
         self.aux_buffer[..., self._index_aux] = aux_data
-        self._index_aux = (self._index_aux + 1) % self.buff_size
-    
+        self._index_aux = (self._index_aux + 1) % self.aux_capacity
+        if self.aux_preview is not None:
+            self.aux_preview.update(aux_data, start)
+
+    def _next_chunk_start(self, chunk_starts, index, n_chunck, n_samples):
+        if n_chunck is not None:
+            return n_chunck
+        previous = chunk_starts[(index - 1) % len(chunk_starts)]
+        return 0 if previous < 0 else previous + n_samples
+
     @property
     def emg_frame_numbers(self):
-        return self._emg_frame_numbers
+        return self.frame_numbers(self._emg_chunk_starts, self._index_emg, self.max_emg_samples)
 
     @property
     def aux_frame_numbers(self):
-        return self._aux_frame_numbers
-    
-    def extend_frame_numbers(self, init_list, n_chunck, n_samples):
-        if n_chunck is None:
-            init_list.extend(list(range(len(init_list), len(init_list) + n_samples)))
-        else:
-            init_list.extend(list(range(n_chunck, n_chunck + n_samples)))
-        return init_list
-    
+        return self.frame_numbers(self._aux_chunk_starts, self._index_aux, self.max_aux_samples)
+
+    def frame_numbers(self, chunk_starts, index, n_samples):
+        """Sample indices of the buffered history, in the order of get_emg_from_buffer/get_aux_from_buffer."""
+        starts = np.roll(chunk_starts, -index)
+        starts = starts[starts >= 0]
+        return (starts[:, None] + np.arange(n_samples)).ravel()
+
+    def get_emg_times(self):
+        """Monotonic host time of every sample of get_emg_from_buffer."""
+        return self.trigno_box.get_host_time(self.layout.emg_stream, self.emg_frame_numbers)
+
+    def get_aux_times(self):
+        """Monotonic host time of every sample of get_aux_from_buffer."""
+        return self.trigno_box.get_host_time(self.layout.aux_stream, self.aux_frame_numbers)
+
     def get_emg_from_buffer(self):
-        return np.roll(self.emg_buffer, -self._index_emg, axis=-1).reshape((self.nb_emg_channels, -1))
+        return self._ordered_history(self.emg_buffer, self._emg_chunk_starts, self._index_emg)
 
     def get_aux_from_buffer(self):
-        return np.roll(self.aux_buffer, -self._index_aux, axis=-1).reshape((self.nb_aux_channels, -1))
-    
+        return self._ordered_history(self.aux_buffer, self._aux_chunk_starts, self._index_aux)
+
+    def _ordered_history(self, buffer, chunk_starts, index):
+        """Buffered chunks from oldest to newest as a (n_channels, n_samples) array."""
+        filled = np.roll(chunk_starts, -index) >= 0
+        history = np.roll(buffer, -index, axis=-1)[..., filled]
+        return history.transpose(0, 2, 1).reshape((buffer.shape[0], -1))
+
+    def get_spilled_emg(self):
+        """EMG evicted from the buffer as a memory-mapped (n_channels, n_samples) array, and its sample indices."""
+        return self._spilled(self.emg_spill, self.nb_emg_channels)
+
+    def get_spilled_aux(self):
+        """Aux data evicted from the buffer as a memory-mapped (n_channels, n_samples) array, and its sample indices."""
+        return self._spilled(self.aux_spill, self.nb_aux_channels)
+
+    def _spilled(self, spill, n_channels):
+        if spill is None:
+            return np.empty((n_channels or 0, 0), dtype=self.trigno_box.dtype), np.empty(0, dtype=np.int64)
+        return spill.read(), spill.frame_numbers
+
+    def close_spill(self):
+        for spill in (self.emg_spill, self.aux_spill):
+            if spill is not None:
+                spill.close()
+        self.emg_spill = None
+        self.aux_spill = None
+
+    def get_footprint(self):
+        """Bytes allocated for the buffers of the sensor, the seconds of history they hold and the bytes spilled."""
+        footprint = {}
+        for kind, buffer, rate, spill in (("emg", self.emg_buffer, self.emg_rate, self.emg_spill),
+                                          ("aux", self.aux_buffer, self.aux_rate, self.aux_spill)):
+            if buffer is None:
+                footprint[kind] = {"bytes": 0, "seconds": 0., "spilled_bytes": 0}
+                continue
+            n_chunks = buffer.shape[-1]
+            footprint[kind] = {"bytes": buffer.nbytes + n_chunks * CHUNK_START_BYTES,
+                               "seconds": n_chunks * buffer.shape[1] / rate if rate else 0.,
+                               "spilled_bytes": spill.nbytes if spill is not None else 0,
+                               }
+        return footprint
+
+    def get_quality(self):
+        """
+        Packet loss, quality flags and statistics of the EMG and aux channels of the sensor,
+        None for a signal which is not monitored. See TrignoSDKClient.enable_quality.
+        """
+        report = {}
+        for kind, stream in (("emg", self.layout.emg_stream), ("aux", self.layout.aux_stream)):
+            monitor = self.trigno_box.quality.get(stream)
+            report[kind] = monitor.report(self.index) if monitor is not None and self.index in monitor.groups else None
+        return report
+
     def get_sensor_info(self, info='TYPE'):
         return self.trigno_box.send_command(f"SENSOR {self.index} {info}?")
-    
+
     def get_sensor_type(self):
-        return [t  for t in Type if t.value == self.trigno_box.send_command(f"SENSOR {self.index} TYPE?")][0]
-    
+        return Type(self.trigno_box.send_command(f"SENSOR {self.index} TYPE?"))
+
     def get_sensor_emgchannel(self):
-        if not self.is_sensor_paired(self.index):
+        if not self.is_sensor_paired():
             return 0
         return int(self.trigno_box.send_command(f"SENSOR {self.index} EMGCHANNELCOUNT?"))
-    
+
     def get_sensor_auxchannel(self):
-        if not self.is_sensor_paired(self.index):
+        if not self.is_sensor_paired():
             return 0
         return int(self.trigno_box.send_command(f"SENSOR {self.index} AUXCHANNELCOUNT?"))
-    
+
     def is_sensor_paired(self):
         return self.trigno_box.send_command(f"SENSOR {self.index} PAIRED?") == "YES"
 
@@ -132,7 +279,7 @@ class Sensor:
 
 if __name__ == "__main__":
     print(1)
-        
+
 
 
 
@@ -0,0 +1,141 @@
+import bisect
+import math
+
+import numpy as np
+
+
+class StreamTimeline:
+    """
+    Piecewise linear map between archive sample index, device sample index and wall-clock time.
+
+    An anchor is stored when a stream starts, after every gap and every
+    ``anchor_interval`` samples; between anchors samples are assumed to be
+    evenly spaced at ``rate``.
+    """
+
+    def __init__(self, rate, anchor_interval=8192):
+        self.rate = rate
+        self.anchor_interval = anchor_interval
+        self.archive_index = []
+        self.device_index = []
+        self.time = []
+        self.next_device_index = None
+
+    def add_anchor(self, archive_index, device_index, time):
+        self.archive_index.append(archive_index)
+        self.device_index.append(device_index)
+        self.time.append(time)
+
+    def time_at(self, archive_index):
+        i = max(0, bisect.bisect_right(self.archive_index, archive_index) - 1)
+        return self.time[i] + (archive_index - self.archive_index[i]) / self.rate
+
+    def times_at(self, archive_indices):
+        """Vectorized time_at over an array of archive sample indices."""
+        anchors = np.maximum(np.searchsorted(self.archive_index, archive_indices, side='right') - 1, 0)
+        return np.asarray(self.time)[anchors] + (archive_indices - np.asarray(self.archive_index)[anchors]) / self.rate
+
+    def device_indices_at(self, archive_indices):
+        """Vectorized device_index_at over an array of archive sample indices."""
+        anchors = np.maximum(np.searchsorted(self.archive_index, archive_indices, side='right') - 1, 0)
+        return np.asarray(self.device_index)[anchors] + archive_indices - np.asarray(self.archive_index)[anchors]
+
+    def device_index_at(self, archive_index):
+        i = max(0, bisect.bisect_right(self.archive_index, archive_index) - 1)
+        return self.device_index[i] + archive_index - self.archive_index[i]
+
+    def archive_index_at(self, time):
+        """First archive sample at or after ``time``. Times inside a gap map to the end of the gap."""
+        if not self.archive_index:
+            # No data was recorded on the stream, every range is empty.
+            return 0
+        i = max(0, bisect.bisect_right(self.time, time) - 1)
+        index = self.archive_index[i] + max(0, math.ceil((time - self.time[i]) * self.rate - 1e-9))
+        if i + 1 < len(self.archive_index):
+            index = min(index, self.archive_index[i + 1])
+        return index
+
+    def to_dict(self):
+        return {"rate": self.rate, "anchor_interval": self.anchor_interval, "archive_index": self.archive_index,
+                "device_index": self.device_index, "time": self.time}
+
+    @classmethod
+    def from_dict(cls, values):
+        timeline = cls(values["rate"], values["anchor_interval"])
+        timeline.archive_index = values["archive_index"]
+        timeline.device_index = values["device_index"]
+        timeline.time = values["time"]
+        return timeline
+
+
+class SessionIndex:
+    """
+    Time index of a recorded session: one StreamTimeline per stream plus
+    the session events (trigger edges and gap markers), each stamped with
+    the stream, archive sample index, device sample index and time.
+    """
+
+    def __init__(self, anchor_interval=8192):
+        self.anchor_interval = anchor_interval
+        self.timelines = {}
+        self.events = []
+
+    def add_stream(self, name, rate):
+        self.timelines[name] = StreamTimeline(rate, self.anchor_interval)
+
+    def add_block(self, name, archive_index, n_samples, device_index=None, time=None, idle=False):
+        """
+        Index a block of ``n_samples`` appended at ``archive_index``.
+        :param device_index: sample index of the first sample on the device timeline, contiguous if None
+        :param time: wall-clock time of the first sample, extrapolated from the last anchor if None
+        :param idle: the samples skipped since the previous block were not acquired on purpose (e.g. outside of
+            a trigger window), so a jump is anchored without a gap event
+        """
+        timeline = self.timelines[name]
+        expected = timeline.next_device_index
+        if device_index is None:
+            device_index = archive_index if expected is None else expected
+        if time is None:
+            time = timeline.time_at(archive_index) if timeline.time else 0.
+        if expected is None:
+            timeline.add_anchor(archive_index, device_index, time)
+        elif device_index != expected and idle:
+            timeline.add_anchor(archive_index, device_index, time)
+        elif device_index != expected:
+            self.add_event("gap", name, archive_index, expected, timeline.time_at(archive_index),
+                           n_samples=device_index - expected)
+            timeline.add_anchor(archive_index, device_index, time)
+        elif archive_index - timeline.archive_index[-1] >= timeline.anchor_interval:
+            timeline.add_anchor(archive_index, device_index, time)
+        timeline.next_device_index = device_index + n_samples
+
+    def add_event(self, kind, name, archive_index, device_index, time, **info):
+        self.events.append(dict(kind=kind, stream=name, archive_index=archive_index, device_index=device_index,
+                                time=time, **info))
+
+    def archive_index_of_device(self, name, device_index):
+        """Archive sample index of a device sample index, the next recorded sample if it was not recorded."""
+        timeline = self.timelines[name]
+        if not timeline.device_index:
+            return 0
+        i = max(0, bisect.bisect_right(timeline.device_index, device_index) - 1)
+        index = timeline.archive_index[i] + max(0, device_index - timeline.device_index[i])
+        if i + 1 < len(timeline.archive_index):
+            index = min(index, timeline.archive_index[i + 1])
+        return index
+
+    def get_events(self, kind=None, name=None):
+        return [event for event in self.events
+                if (kind is None or event["kind"] == kind) and (name is None or event["stream"] == name)]
+
+    def to_dict(self):
+        return {"anchor_interval": self.anchor_interval,
+                "timelines": {name: timeline.to_dict() for name, timeline in self.timelines.items()},
+                "events": self.events}
+
+    @classmethod
+    def from_dict(cls, values):
+        index = cls(values["anchor_interval"])
+        index.timelines = {name: StreamTimeline.from_dict(timeline) for name, timeline in values["timelines"].items()}
+        index.events = values["events"]
+        return index
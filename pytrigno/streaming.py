@@ -1,15 +1,97 @@
 import socket
-import struct
-# from .enums import EMGType
+import threading
+from queue import Queue, Empty, Full
+
 import numpy
+
+from .chunking import Rechunker
+from .enums import AvantiSensor, LegacySensor
 from .sdk_client import TrignoSDKClient
 
+# Stream of the SDK client served on each data port
+STREAMS_BY_PORT = {AvantiSensor().emg_port: "avanti_emg",
+                   AvantiSensor().aux_port: "avanti_aux",
+                   LegacySensor().emg_port: "legacy_emg",
+                   LegacySensor().aux_port: "legacy_aux",
+                   }
+# Blocks kept for read(), the oldest ones are dropped when the caller falls behind.
+MAX_QUEUED_READS = 64
+
+_engines = {}
+_engines_lock = threading.RLock()
+
+
+class _SharedEngine:
+    """
+    TrignoSDKClient shared by the legacy objects of one TCU.
+
+    The client streams while at least one of its users is started; starting a
+    user whose stream is not read yet restarts the session with it. The sample
+    count restarts with the session, so the blocks of the users already
+    started are dropped and their reads start over on the new session.
+    """
+
+    def __init__(self, host, cmd_port, timeout, fast_mode):
+        self.key = (socket.gethostbyname(host), cmd_port)
+        self.client = TrignoSDKClient(host=host, cmd_port=cmd_port, timeout=timeout, fast_mode=fast_mode)
+        self.n_users = 0
+        self.started = set()
+
+    @classmethod
+    def attach(cls, host, cmd_port, timeout, fast_mode=False):
+        # 'localhost' and '127.0.0.1' are the same TCU, which a second client would stop under the first.
+        key = (socket.gethostbyname(host), cmd_port)
+        with _engines_lock:
+            engine = _engines.get(key)
+            if engine is None:
+                engine = _engines[key] = cls(host, cmd_port, timeout, fast_mode)
+            engine.n_users += 1
+            return engine
+
+    def detach(self, user):
+        with _engines_lock:
+            self.stop(user)
+            self.n_users -= 1
+            if self.n_users:
+                return
+            del _engines[self.key]
+        self.client.disconnect()
+
+    def start(self, user, stream):
+        with _engines_lock:
+            self.started.add(user)
+            self.client.require_streams(stream)
+            if self.client.is_stream_running(stream):
+                return
+            if self.client._is_streaming:
+                self.client.stop_streaming()
+                for started in self.started:
+                    if started._read_format is not None:
+                        started._subscribe(*started._read_format)
+            self.client.start_streaming()
+
+    def stop(self, user):
+        with _engines_lock:
+            if user not in self.started:
+                return
+            self.started.discard(user)
+            if not self.started:
+                self.client.stop_streaming()
+
+
 class _BaseTrignoDaq(object):
     """
     Delsys Trigno wireless EMG system.
 
     Requires the Trigno Control Utility to be running.
 
+    Every object of a TCU (host and command port) shares a single
+    TrignoSDKClient acquisition engine: its reader thread of the data port
+    decodes every frame once, and each object receives the blocks of
+    ``read()`` from a chunk callback instead of opening its own data
+    connection. Blocks of ``samples_per_read`` samples are queued from
+    ``start()`` on, so consecutive reads return contiguous samples.
+
     Parameters
     ----------
     host : str
@@ -17,13 +99,16 @@ class _BaseTrignoDaq(object):
     cmd_port : int
         Port of TCU command messages.
     data_port : int
-        Port of TCU data access.
+        Port of TCU data access, one of the ports of STREAMS_BY_PORT.
     rate : int
         Sampling rate of the data source.
     total_channels : int
         Total number of channels supported by the device.
     timeout : float
         Number of seconds before socket returns a timeout exception
+    dtype : numpy dtype, optional
+        Floating point type of the returned arrays. The wire format is float32,
+        so float32 avoids any conversion; float64 can be requested.
 
     Attributes
     ----------
@@ -40,28 +125,33 @@ class _BaseTrignoDaq(object):
 
     BYTES_PER_CHANNEL = 4
     CMD_TERM = '\r\n\r\n'
+    # Samples per read of the subclasses, whose blocks are then queued from start()
+    samples_per_read = None
 
-    def __init__(self, host, cmd_port, data_port, total_channels, timeout):
+    def __init__(self, host, cmd_port, data_port, total_channels, timeout, dtype=numpy.float32, fast_mode=False):
+        if data_port not in STREAMS_BY_PORT:
+            raise ValueError(f"Unsupported data port {data_port}, use one of {sorted(STREAMS_BY_PORT)}.")
+        self.dtype = numpy.dtype(dtype)
         self.host = host
         self.cmd_port = cmd_port
         self.data_port = data_port
+        self.stream = STREAMS_BY_PORT[data_port]
         self.total_channels = total_channels
         self.timeout = timeout
+        self.fast_mode = fast_mode
 
         self._min_recv_size = self.total_channels * self.BYTES_PER_CHANNEL
+        self._engine = None
+        self._queue = Queue(MAX_QUEUED_READS)
+        self._read_format = None
+        self._rechunker = None
+        # Bound once, remove_chunk_callback compares callbacks by identity.
+        self._callback = self._on_chunk
 
         self._initialize()
 
     def _initialize(self):
-
-        # create command socket and consume the servers initial response
-        self._comm_socket = socket.create_connection(
-            (self.host, self.cmd_port), self.timeout)
-        self._comm_socket.recv(1024)
-
-        # # create the data socket
-        # self._data_socket = socket.create_connection(
-        #     (self.host, self.data_port), self.timeout)
+        self._engine = _SharedEngine.attach(self.host, self.cmd_port, self.timeout, self.fast_mode)
 
     def start(self):
         """
@@ -70,7 +160,9 @@ class _BaseTrignoDaq(object):
         You should call ``read()`` soon after this, though the device typically
         takes about two seconds to send back the first batch of data.
         """
-        self._send_cmd('START')
+        if self.samples_per_read is not None:
+            self._subscribe(self.samples_per_read, self._rows())
+        self._engine.start(self, self.stream)
 
     def read(self, num_samples):
         """
@@ -90,49 +182,79 @@ class _BaseTrignoDaq(object):
             Data read from the device. Each channel is a row and each column
             is a point in time.
         """
-        sock = socket.create_connection(
-            (self.host, self.data_port), self.timeout)
-        l_des = num_samples * self._min_recv_size
-        l = 0
-        packet = bytes()
-        while l < l_des:
-            packet += sock.recv(l_des-l)
-            l = len(packet)
-        data = numpy.asarray(struct.unpack('<'+'f'*self.total_channels*num_samples, packet))
-        data = numpy.transpose(data.reshape((-1, self.total_channels)))
+        return self._read(num_samples, slice(None))
 
-        return data
+    def _rows(self):
+        """Rows of the total channels returned by the reads."""
+        return slice(None)
+
+    def _read(self, num_samples, rows):
+        if self._read_format != (num_samples, rows):
+            self._subscribe(num_samples, rows)
+        try:
+            return self._queue.get(timeout=self.timeout)
+        except Empty:
+            raise socket.timeout(f"No data from the {self.stream} stream in {self.timeout} s.") from None
+
+    def _subscribe(self, num_samples, rows):
+        """Cut the frames of the stream into blocks of the rows and size of the following reads."""
+        client = self._engine.client
+        client.remove_chunk_callback(self._callback)
+        self._read_format = (num_samples, rows)
+        n_rows = len(range(self.total_channels)[rows])
+        # Blocks up to a frame long are views of the decoded frame, shared with the other consumers.
+        copy = num_samples <= client.topology.streams[self.stream].n_samples
+        queue = self._queue
+
+        def _deliver(data, first_sample):
+            if copy or data.dtype != self.dtype:
+                data = data.astype(self.dtype)
+            try:
+                queue.put_nowait(data)
+            except Full:
+                try:
+                    queue.get_nowait()
+                except Empty:
+                    pass
+                queue.put_nowait(data)
+        self._rechunker = Rechunker(n_rows, num_samples, _deliver, self.dtype)
+        with queue.mutex:
+            queue.queue.clear()
+        client.add_chunk_callback(self._callback)
+
+    def _on_chunk(self, name, data, first_sample):
+        if name == self.stream:
+            self._rechunker.push(data[self._read_format[1]], first_sample)
 
     def stop(self):
         """Tell the device to stop streaming data."""
-        self._send_cmd('STOP')
+        self._engine.client.remove_chunk_callback(self._callback)
+        self._read_format = None
+        self._engine.stop(self)
 
     def reset(self):
         """Restart the connection to the Trigno Control Utility server."""
+        self._close()
         self._initialize()
 
+    def _close(self):
+        if self._engine is None:
+            return
+        self.stop()
+        self._engine.detach(self)
+        self._engine = None
+
     def __del__(self):
         try:
-            self._comm_socket.close()
+            self._close()
         except:
             pass
 
-    def _send_cmd(self, command):
-        self._comm_socket.send(self._cmd(command))
-        resp = self._comm_socket.recv(128)
-        self._validate(resp)
-
     @staticmethod
     def _cmd(command):
         return bytes("{}{}".format(command, _BaseTrignoDaq.CMD_TERM),
                      encoding='ascii')
 
-    @staticmethod
-    def _validate(response):
-        s = str(response)
-        # if 'OK' not in s:
-        #     print("warning: TrignoDaq command failed: {}".format(s))
-
 
 class TrignoEMG(_BaseTrignoDaq):
     """
@@ -163,6 +285,8 @@ class TrignoEMG(_BaseTrignoDaq):
         configurable through the TCU graphical user interface.
     timeout : float, optional
         Number of seconds before socket returns a timeout exception.
+    dtype : numpy dtype, optional
+        Floating point type of the returned data, float32 by default.
 
     Attributes
     ----------
@@ -174,9 +298,10 @@ class TrignoEMG(_BaseTrignoDaq):
     """
 
     def __init__(self, channel_range, samples_per_read, units='V',
-                 host='127.0.0.1', cmd_port=50040,timeout=10.0, fast_mode=False):
+                 host='127.0.0.1', cmd_port=50040,timeout=10.0, fast_mode=False, dtype=numpy.float32):
         self.n_channels = 16
-        super(TrignoEMG, self).__init__(host=host, cmd_port=cmd_port, timeout=timeout, total_channels=16, data_port=50043, )
+        super(TrignoEMG, self).__init__(host=host, cmd_port=cmd_port, timeout=timeout, total_channels=16, data_port=50043,
+                                        dtype=dtype, fast_mode=fast_mode)
         self.channel_range = channel_range
         self.samples_per_read = samples_per_read
         # self.buffer_size = super(TrignoEMG, self).buffer_size(self.n_channels, samples_per_read)
@@ -215,7 +340,9 @@ class TrignoEMG(_BaseTrignoDaq):
         data = super(TrignoEMG, self).read(self.samples_per_read)
         # data = data[data !=0 ]
         # data = data[self.channel_range[0]:self.channel_range[1]+1, :]
-        return self.scaler * data
+        if self.scaler != 1.:
+            numpy.multiply(data, self.scaler, out=data)
+        return data
 
 
 class TrignoAccel(_BaseTrignoDaq):
@@ -242,12 +369,14 @@ class TrignoAccel(_BaseTrignoDaq):
         it is configurable through the TCU graphical user interface.
     timeout : float, optional
         Number of seconds before socket returns a timeout exception.
+    dtype : numpy dtype, optional
+        Floating point type of the returned data, float32 by default.
     """
     def __init__(self, channel_range, samples_per_read, host='localhost',
-                 cmd_port=50040, data_port=50042, timeout=10):
+                 cmd_port=50040, data_port=50042, timeout=10, dtype=numpy.float32):
         super(TrignoAccel, self).__init__(
             host=host, cmd_port=cmd_port, data_port=data_port,
-            total_channels=48, timeout=timeout)
+            total_channels=48, timeout=timeout, dtype=dtype)
 
         self.channel_range = channel_range
         self.samples_per_read = samples_per_read
@@ -267,9 +396,10 @@ class TrignoAccel(_BaseTrignoDaq):
             Data read from the device. Each channel is a row and each column
             is a point in time.
         """
-        data = super(TrignoAccel, self).read(self.samples_per_read)
-        data = data[self.channel_range[0]:self.channel_range[1]+1, :]
-        return data
+        return self._read(self.samples_per_read, self._rows())
+
+    def _rows(self):
+        return slice(self.channel_range[0], self.channel_range[1] + 1)
 
 
 class TrignoIM(_BaseTrignoDaq):
@@ -296,12 +426,14 @@ class TrignoIM(_BaseTrignoDaq):
         it is configurable through the TCU graphical user interface.
     timeout : float, optional
         Number of seconds before socket returns a timeout exception.
+    dtype : numpy dtype, optional
+        Floating point type of the returned data, float32 by default.
     """
     def __init__(self, channel_range, samples_per_read, host='localhost',
-                 cmd_port=50040, data_port=50044, timeout=10):
+                 cmd_port=50040, data_port=50044, timeout=10, dtype=numpy.float32):
         super(TrignoIM, self).__init__(
             host=host, cmd_port=cmd_port, data_port=data_port,
-            total_channels=144, timeout=timeout)
+            total_channels=144, timeout=timeout, dtype=dtype)
 
         self.channel_range = channel_range
         self.samples_per_read = samples_per_read
@@ -333,7 +465,8 @@ class TrignoIM(_BaseTrignoDaq):
             Data read from the device. Each channel is a row and each column
             is a point in time.
         """
-        data = super(TrignoIM, self).read(self.samples_per_read)
-        data = data[self.channel_range[0]:self.channel_range[1], :]
-        return data
+        return self._read(self.samples_per_read, self._rows())
+
+    def _rows(self):
+        return slice(self.channel_range[0], self.channel_range[1])
 
@@ -0,0 +1,220 @@
+from enum import Enum
+
+
+FRAME_INTERVAL = 0.0135
+N_SENSORS = 16
+STREAM_CHANNELS = {"avanti_emg": 16,
+                   "avanti_aux": 144,
+                   "legacy_emg": 16,
+                   "legacy_aux": 48,
+                   }
+
+
+class Type(Enum):
+    Avanti = 'O'
+    Legacy = 'A'
+    AvantiGogniometer = '23'
+    # Any other type code: the channels are passed through without interpretation.
+    Unknown = '?'
+
+    @classmethod
+    def _missing_(cls, value):
+        return cls.Unknown
+
+    @property
+    def family(self):
+        """
+        Prefix of the data streams carrying this type of sensor.
+        Only the original Trigno sensors use the legacy ports, so unknown types are read from the Avanti ones.
+        """
+        return "legacy" if self is Type.Legacy else "avanti"
+
+
+class SensorLayout:
+    """
+    Position of one sensor in the data streams.
+
+    Offsets are zero-based channel indices into the EMG and aux streams of the
+    sensor family, so the sensor data of a decoded chunk ``data`` of shape
+    (n_channels, n_samples) is ``data[layout.emg_slice]``.
+    """
+
+    def __init__(self, index, is_paired=False, type=None, mode=None, nb_emg_channels=0, nb_aux_channels=0,
+                 emg_offset=0, aux_offset=0, emg_samples=0, aux_samples=0):
+        self.index = index
+        self.is_paired = is_paired
+        self.type = type
+        self.mode = mode
+        self.nb_emg_channels = nb_emg_channels
+        self.nb_aux_channels = nb_aux_channels
+        self.emg_offset = emg_offset
+        self.aux_offset = aux_offset
+        self.emg_samples = emg_samples
+        self.aux_samples = aux_samples
+        self.emg_slice = slice(emg_offset, emg_offset + nb_emg_channels)
+        self.aux_slice = slice(aux_offset, aux_offset + nb_aux_channels)
+
+    @staticmethod
+    def queries(index):
+        """Command channel queries describing sensor ``index``, in the order expected by from_responses."""
+        return [f"SENSOR {index} PAIRED?",
+                f"SENSOR {index} TYPE?",
+                f"SENSOR {index} MODE?",
+                f"SENSOR {index} EMGCHANNELCOUNT?",
+                f"SENSOR {index} AUXCHANNELCOUNT?",
+                f"SENSOR {index} STARTINDEX?",
+                f"SENSOR {index} AUXSTARTINDEX?",
+                ]
+
+    @classmethod
+    def from_responses(cls, index, responses, emg_samples, aux_samples):
+        paired, type_code, mode, nb_emg, nb_aux, start, aux_start = responses
+        if paired != "YES":
+            return cls(index)
+        sensor_type = Type(type_code)
+        nb_emg_channels = int(nb_emg)
+        nb_aux_channels = int(nb_aux)
+        # The SDK reports one-based channel indices.
+        emg_offset = int(start) - 1
+        aux_offset = int(aux_start) - 1 if nb_aux_channels else 0
+        return cls(index, True, sensor_type, mode, nb_emg_channels, nb_aux_channels, emg_offset, aux_offset,
+                   emg_samples, aux_samples)
+
+    @classmethod
+    def discover(cls, trigno_box, index, emg_samples, aux_samples):
+        """Query the command channel for the layout of sensor ``index``."""
+        return cls.from_responses(index, trigno_box.send_commands(cls.queries(index)), emg_samples, aux_samples)
+
+    def __eq__(self, other):
+        if not isinstance(other, SensorLayout):
+            return NotImplemented
+        return vars(self) == vars(other)
+
+    @property
+    def emg_stream(self):
+        return f"{self.type.family}_emg" if self.is_paired else None
+
+    @property
+    def aux_stream(self):
+        return f"{self.type.family}_aux" if self.is_paired else None
+
+    @property
+    def emg_rate(self):
+        return self.emg_samples / FRAME_INTERVAL
+
+    @property
+    def aux_rate(self):
+        return self.aux_samples / FRAME_INTERVAL
+
+
+class StreamLayout:
+    """Shape of the chunks read from one data port."""
+
+    def __init__(self, name, n_channels, n_samples):
+        self.name = name
+        self.n_channels = n_channels
+        self.n_samples = n_samples
+        self.sensors = []
+
+    @property
+    def chunk_bytes(self):
+        return self.n_channels * self.n_samples * 4
+
+    @property
+    def rate(self):
+        return self.n_samples / FRAME_INTERVAL
+
+    @property
+    def is_used(self):
+        return len(self.sensors) > 0
+
+
+class Topology:
+    """
+    Layout of every sensor and data stream, computed once from a single discovery pass.
+
+    Buffers and demultiplexing slices are preallocated from it so the
+    acquisition threads never query the command channel.
+    """
+
+    def __init__(self, sensors, max_emg_samples, max_aux_samples):
+        self.sensors = sensors
+        self.max_emg_samples = max_emg_samples
+        self.max_aux_samples = max_aux_samples
+        self._index_streams()
+
+    def _index_streams(self):
+        self.streams = {name: StreamLayout(name, n_channels,
+                                           self.max_emg_samples if "emg" in name else self.max_aux_samples)
+                        for name, n_channels in STREAM_CHANNELS.items()}
+        for sensor in self.sensors:
+            if not sensor.is_paired:
+                continue
+            if sensor.nb_emg_channels:
+                self.streams[sensor.emg_stream].sensors.append(sensor)
+            if sensor.nb_aux_channels:
+                self.streams[sensor.aux_stream].sensors.append(sensor)
+        self.validate()
+
+    @staticmethod
+    def query_layouts(trigno_box, indices):
+        """
+        Query the layout of the sensors ``indices`` and the frame shape in one pipelined batch.
+        :return: (dict of SensorLayout by index, max EMG samples, max aux samples)
+        """
+        commands = ["MAX SAMPLES EMG", "MAX SAMPLES AUX"]
+        for index in indices:
+            commands += SensorLayout.queries(index)
+        responses = trigno_box.send_commands(commands)
+        max_emg_samples, max_aux_samples = int(responses[0]), int(responses[1])
+        n_queries = len(SensorLayout.queries(0))
+        layouts = {}
+        for i, index in enumerate(indices):
+            sensor_responses = responses[2 + i * n_queries:2 + (i + 1) * n_queries]
+            layouts[index] = SensorLayout.from_responses(index, sensor_responses, max_emg_samples, max_aux_samples)
+        return layouts, max_emg_samples, max_aux_samples
+
+    @classmethod
+    def discover(cls, trigno_box, n_sensors=N_SENSORS):
+        layouts, max_emg_samples, max_aux_samples = cls.query_layouts(trigno_box, range(1, n_sensors + 1))
+        return cls(list(layouts.values()), max_emg_samples, max_aux_samples)
+
+    def update(self, layouts):
+        """
+        Replace the layout of some sensors and validate the result.
+        :return: indices of the sensors whose layout actually changed
+        """
+        sensors = list(self.sensors)
+        changed = []
+        for layout in layouts:
+            if layout != sensors[layout.index - 1]:
+                sensors[layout.index - 1] = layout
+                changed.append(layout.index)
+        if changed:
+            previous = self.sensors
+            self.sensors = sensors
+            try:
+                self._index_streams()
+            except ValueError:
+                self.sensors = previous
+                self._index_streams()
+                raise
+        return changed
+
+    def validate(self):
+        """Raise a ValueError if a sensor is out of its streams or overlaps another one."""
+        for stream in self.streams.values():
+            used = [None] * stream.n_channels
+            for sensor in stream.sensors:
+                channels = sensor.emg_slice if "emg" in stream.name else sensor.aux_slice
+                if channels.start < 0 or channels.stop > stream.n_channels:
+                    raise ValueError(f"Sensor {sensor.index} channels {channels.start}:{channels.stop} "
+                                     f"are out of the {stream.n_channels} channels of {stream.name}.")
+                for channel in range(channels.start, channels.stop):
+                    if used[channel] is not None:
+                        raise ValueError(f"Sensors {used[channel]} and {sensor.index} share channel {channel} "
+                                         f"of {stream.name}.")
+                    used[channel] = sensor.index
+
+    def paired_sensors(self):
+        return [sensor for sensor in self.sensors if sensor.is_paired]
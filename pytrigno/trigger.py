@@ -0,0 +1,110 @@
+from collections import deque
+
+import numpy as np
+
+
+TRIGGER_EDGES = ("START", "STOP")
+
+
+class TriggerGate:
+    """
+    Trigger gated acquisition of one data stream.
+
+    While armed, incoming chunks are kept undecoded in a preallocated ring
+    holding the pre-trigger history. A start edge decodes that ring once into
+    ``pre_trigger`` and opens a recording window: chunks are then decoded and
+    dispatched as usual until a stop edge closes the window and the gate goes
+    back to armed.
+
+    Edges are applied on the next chunk boundary of the stream, so the sample
+    index stamped for an edge is the index of the first sample of the window
+    (start) or the first sample after it (stop), exactly as seen in the data.
+
+    Parameters
+    ----------
+    chunk_bytes : int
+        Size in bytes of one chunk of the stream.
+    n_channels : int
+        Number of channels of the stream.
+    n_samples : int
+        Number of samples per channel in one chunk.
+    pre_trigger_chunks : int
+        Number of chunks kept before a start edge.
+    dtype : numpy dtype
+        Floating point type of the decoded pre-trigger history.
+    channels : sequence of int, optional
+        Channels kept in the pre-trigger history, e.g. those of the subscribed
+        sensors; ``pre_trigger`` then has one row per kept channel, in this
+        order. Every channel if None.
+    """
+
+    ARMED = "armed"
+    RECORDING = "recording"
+
+    def __init__(self, chunk_bytes, n_channels, n_samples, pre_trigger_chunks, dtype=np.float32, channels=None):
+        self.n_channels = n_channels
+        self.n_samples = n_samples
+        self.dtype = np.dtype(dtype)
+        if chunk_bytes != n_samples * n_channels * 4:
+            raise ValueError(f"A chunk of {n_samples} samples of {n_channels} channels is not {chunk_bytes} bytes.")
+        self.channels = None if channels is None else np.asarray(channels, dtype=np.intp)
+        n_kept = n_channels if channels is None else len(self.channels)
+        self.state = TriggerGate.ARMED
+        # Raw words of the kept channels, decoded only when a start edge releases them
+        self._ring = np.empty((pre_trigger_chunks, n_samples, n_kept), dtype='<u4')
+        self._ring_starts = np.full(pre_trigger_chunks, -1, dtype=np.int64)
+        self._ring_index = 0
+        # Edges signalled from another thread, applied by the reader thread at the next chunk boundary
+        self._pending = deque()
+        self.edges = []
+        self.windows = []
+        self.pre_trigger = np.empty((n_kept, 0), dtype=self.dtype)
+        self.pre_trigger_start = None
+        self.n_skipped_chunks = 0
+
+    def signal(self, edge):
+        """Notify a 'START' or 'STOP' trigger edge."""
+        if edge not in TRIGGER_EDGES:
+            raise ValueError(f"Unknown trigger edge {edge!r}.")
+        self._pending.append(edge)
+
+    @property
+    def is_recording(self):
+        return self.state == TriggerGate.RECORDING
+
+    def admit(self, packet, count):
+        """
+        Apply pending edges at the boundary of the chunk starting at sample ``count``.
+        Return True if the chunk belongs to a recording window and must be decoded,
+        otherwise keep it raw in the pre-trigger ring and return False.
+        """
+        while self._pending:
+            edge = self._pending.popleft()
+            if edge == "START" and self.state == TriggerGate.ARMED:
+                self.state = TriggerGate.RECORDING
+                self.edges.append(("START", count))
+                self.windows.append([count, None])
+                self._release_pre_trigger()
+            elif edge == "STOP" and self.state == TriggerGate.RECORDING:
+                self.state = TriggerGate.ARMED
+                self.edges.append(("STOP", count))
+                self.windows[-1][1] = count
+        if self.state == TriggerGate.RECORDING:
+            return True
+        if len(self._ring):
+            words = np.frombuffer(packet, dtype='<u4').reshape((self.n_samples, self.n_channels))
+            self._ring[self._ring_index] = words if self.channels is None else words[:, self.channels]
+            self._ring_starts[self._ring_index] = count
+            self._ring_index = (self._ring_index + 1) % len(self._ring)
+        self.n_skipped_chunks += 1
+        return False
+
+    def _release_pre_trigger(self):
+        """Decode the pre-trigger ring, oldest chunk first, and empty it."""
+        order = np.roll(np.arange(len(self._ring)), -self._ring_index)
+        order = order[self._ring_starts[order] >= 0]
+        words = self._ring[order].view('<f4').astype(self.dtype)
+        self.pre_trigger = words.reshape((-1, self._ring.shape[2])).T
+        self.pre_trigger_start = int(self._ring_starts[order[0]]) if len(order) else None
+        self._ring_starts[:] = -1
+        self._ring_index = 0
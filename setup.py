@@ -20,5 +20,9 @@ setup(
     author_email='ixjlyons@gmail.com',
     license='MIT',
 
-    py_modules=['pytrigno']
+    packages=['pytrigno'],
+    install_requires=['numpy'],
+    entry_points={
+        'console_scripts': ['pytrigno = pytrigno.cli:main'],
+    },
 )
@@ -0,0 +1,106 @@
+import socket
+import threading
+
+import pytest
+
+from pytrigno.sdk_client import TrignoSDKClient, CMD_TERM
+
+
+# Paired sensors as answered by the TCU: two Avanti IMU sensors, a goniometer and a legacy sensor.
+SENSORS = {
+    1: {"TYPE": "O", "MODE": "40", "EMGCHANNELCOUNT": "1", "AUXCHANNELCOUNT": "9", "STARTINDEX": "1",
+        "AUXSTARTINDEX": "1"},
+    2: {"TYPE": "O", "MODE": "8", "EMGCHANNELCOUNT": "1", "AUXCHANNELCOUNT": "9", "STARTINDEX": "2",
+        "AUXSTARTINDEX": "10"},
+    4: {"TYPE": "23", "MODE": "362", "EMGCHANNELCOUNT": "2", "AUXCHANNELCOUNT": "6", "STARTINDEX": "4",
+        "AUXSTARTINDEX": "28"},
+    6: {"TYPE": "A", "MODE": "0", "EMGCHANNELCOUNT": "1", "AUXCHANNELCOUNT": "3", "STARTINDEX": "6",
+        "AUXSTARTINDEX": "16"},
+}
+
+
+def answer(command):
+    words = command.strip().upper().split()
+    if words[:2] == ["MAX", "SAMPLES"]:
+        return "27" if words[2] == "EMG" else "2"
+    if words[0] == "SENSOR":
+        sensor = SENSORS.get(int(words[1]))
+        if words[2] == "PAIRED?":
+            return "YES" if sensor else "NO"
+        if sensor is None:
+            return "INVALID"
+        return sensor.get(words[2].rstrip("?"), "OK")
+    return "OK"
+
+
+class CommandSocket:
+    """
+    Command socket of a TCU answering every command from SENSORS.
+
+    Answers are returned in pieces of at most ``segment`` bytes, and the commands
+    in ``mute`` are never answered.
+    """
+
+    def __init__(self, segment=4096):
+        self.segment = segment
+        self.mute = set()
+        self.sent = []
+        self.unread = b""
+        self._blocking = True
+
+    def sendall(self, payload):
+        for command in payload.decode('ascii').split(CMD_TERM)[:-1]:
+            self.sent.append(command)
+            if command not in self.mute:
+                self.unread += f"{answer(command)}{CMD_TERM}".encode('ascii')
+
+    def recv(self, n_bytes):
+        if not self.unread:
+            raise socket.timeout if self._blocking else BlockingIOError
+        n_bytes = min(n_bytes, self.segment)
+        data, self.unread = self.unread[:n_bytes], self.unread[n_bytes:]
+        return data
+
+    def setblocking(self, flag):
+        self._blocking = flag
+
+    def settimeout(self, timeout):
+        self._blocking = True
+
+    def close(self):
+        pass
+
+
+class OfflineClient(TrignoSDKClient):
+    """TrignoSDKClient talking to a CommandSocket, without any connection to a TCU."""
+
+    def _connect_command(self):
+        self._comm_socket = CommandSocket()
+
+    def initiate_data_connection(self):
+        self.all_socket = {}
+        self.all_events = {name: threading.Event() for name in self.topology.streams}
+        self._data_connected = True
+
+
+@pytest.fixture
+def make_client():
+    """Factory of OfflineClient, taking the options of TrignoSDKClient."""
+    return OfflineClient
+
+
+@pytest.fixture
+def client(make_client):
+    return make_client()
+
+
+@pytest.fixture
+def command_socket(client):
+    """The CommandSocket of ``client``."""
+    return client._comm_socket
+
+
+@pytest.fixture
+def sensors():
+    """SENSORS, to be changed with monkeypatch.setitem."""
+    return SENSORS
@@ -0,0 +1,108 @@
+import threading
+
+import numpy as np
+import pytest
+
+from pytrigno.archive import ArchiveWriter, ArchiveReader
+from pytrigno.clock import DriftEstimator
+from pytrigno.integrity import EMG_RANGE
+
+
+def _signal(n_channels, n_samples):
+    rng = np.random.default_rng(1)
+    return np.cumsum(rng.normal(0, 1e-4, (n_channels, n_samples)), axis=1).astype(np.float32)
+
+
+@pytest.mark.parametrize("codec", ["zlib", "lzma"])
+def test_float32_streams_round_trip_exactly(tmp_path, codec):
+    data = _signal(3, 1000)
+    with ArchiveWriter(tmp_path / "session.ptg", codec, chunk_samples=128) as writer:
+        writer.add_stream("sensor1_aux", 3, 148.148)
+        for block in np.array_split(data, 9, axis=1):
+            writer.write("sensor1_aux", block)
+
+    with ArchiveReader(tmp_path / "session.ptg") as reader:
+        assert reader.codec == codec
+        assert reader.streams["sensor1_aux"].n_samples == 1000
+        np.testing.assert_array_equal(reader.read("sensor1_aux"), data)
+        # A range across chunk boundaries, on some channels only
+        np.testing.assert_array_equal(reader.read("sensor1_aux", 100, 300, channels=[2, 0]), data[[2, 0], 100:300])
+        assert reader.read("sensor1_aux", 990, 2000).shape == (3, 10)
+
+
+def test_int16_streams_round_trip_within_a_quantization_step(tmp_path):
+    data = _signal(2, 500) * 10
+    data[0, 10] = 2 * EMG_RANGE
+    with ArchiveWriter(tmp_path / "session.ptg", chunk_samples=64) as writer:
+        info = writer.add_stream("sensor1_emg", 2, 2000, quantize=EMG_RANGE)
+        writer.write("sensor1_emg", data)
+
+    with ArchiveReader(tmp_path / "session.ptg") as reader:
+        decoded = reader.read("sensor1_emg")
+    assert decoded.dtype == np.float32
+    in_range = np.abs(data) <= EMG_RANGE
+    assert np.max(np.abs(decoded - data)[in_range]) <= info.scale / 2 * 1.01
+    # Out of range samples saturate at the full scale.
+    assert decoded[0, 10] == pytest.approx(EMG_RANGE)
+
+
+def test_reader_rejects_other_and_truncated_files(tmp_path):
+    (tmp_path / "other.bin").write_bytes(b"not an archive at all, not at all")
+    with pytest.raises(ValueError, match="not a pytrigno archive"):
+        ArchiveReader(tmp_path / "other.bin")
+
+    # Interrupted before close(): the chunks are on disk, not the index.
+    writer = ArchiveWriter(tmp_path / "session.ptg", chunk_samples=16)
+    writer.add_stream("sensor1_emg", 1, 2000)
+    writer.write("sensor1_emg", _signal(1, 100))
+    writer._file.close()
+    with pytest.raises(ValueError, match="truncated"):
+        ArchiveReader(tmp_path / "session.ptg")
+
+
+def test_a_closed_archive_refuses_writes(tmp_path):
+    writer = ArchiveWriter(tmp_path / "session.ptg")
+    writer.add_stream("sensor1_emg", 1, 2000.)
+    writer.close()
+    assert writer.closed
+    with pytest.raises(ValueError, match="closed"):
+        writer.write("sensor1_emg", _signal(1, 10))
+
+
+def test_record_archives_the_channels_of_every_paired_sensor(client, tmp_path):
+    # Created by the reader thread of the stream
+    client.clocks["avanti_emg"] = DriftEstimator(client.topology.streams["avanti_emg"].rate)
+    client.record(tmp_path / "session.ptg")
+    data = np.arange(16 * 27, dtype=np.float32).reshape((16, 27)) * 1e-6
+    for callback in client._chunk_callbacks:
+        callback("avanti_emg", data, 0)
+    client.stop_recording()
+
+    with ArchiveReader(tmp_path / "session.ptg") as reader:
+        assert sorted(reader.streams) == ["sensor1_aux", "sensor1_emg", "sensor2_aux", "sensor2_emg",
+                                          "sensor4_aux", "sensor4_emg", "sensor6_aux", "sensor6_emg"]
+        np.testing.assert_array_equal(reader.read("sensor4_emg"), data[3:5])
+        assert reader.streams["sensor6_emg"].n_samples == 0
+
+
+def test_chunks_written_after_stop_recording_are_dropped(client, tmp_path):
+    client.clocks["avanti_emg"] = DriftEstimator(client.topology.streams["avanti_emg"].rate)
+    writer = client.record(tmp_path / "session.ptg")
+    # The callback list a reader thread took before stop_recording
+    [callback] = client._chunk_callbacks
+    lock = client._recorder[2]
+    data = np.zeros((16, 27), dtype=np.float32)
+
+    # A chunk being written holds off stop_recording.
+    lock.acquire()
+    stopping = threading.Thread(target=client.stop_recording)
+    stopping.start()
+    stopping.join(0.1)
+    assert stopping.is_alive() and not writer.closed
+    lock.release()
+    stopping.join(5)
+    assert writer.closed
+
+    callback("avanti_emg", data, 0)
+    with ArchiveReader(tmp_path / "session.ptg") as reader:
+        assert reader.streams["sensor1_emg"].n_samples == 0
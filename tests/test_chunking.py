@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+
+from pytrigno.chunking import Rechunker, ChunkPolicy
+
+
+def _rechunker(batch_samples):
+    batches = []
+    rechunker = Rechunker(2, batch_samples, lambda data, first: batches.append((first, data.copy())))
+    return rechunker, batches
+
+
+def _block(first, n):
+    return np.tile(np.arange(first, first + n, dtype=np.float32), (2, 1))
+
+
+def test_large_frames_are_split_without_copy():
+    delivered = []
+    rechunker = Rechunker(2, 9, lambda data, first: delivered.append((first, data)))
+    frame = _block(0, 27)
+    rechunker.push(frame, 0)
+    assert [first for first, _ in delivered] == [0, 9, 18]
+    assert all(np.shares_memory(data, frame) for _, data in delivered)
+
+
+def test_small_frames_are_coalesced_across_batch_boundaries():
+    rechunker, batches = _rechunker(10)
+    for first in range(0, 27, 3):
+        rechunker.push(_block(first, 3), first)
+    assert [first for first, _ in batches] == [0, 10]
+    for first, data in batches:
+        np.testing.assert_array_equal(data, _block(first, 10))
+    rechunker.flush()
+    assert batches[-1][0] == 20
+    np.testing.assert_array_equal(batches[-1][1], _block(20, 7))
+
+
+def test_a_discontinuity_flushes_the_incomplete_batch():
+    rechunker, batches = _rechunker(10)
+    rechunker.push(_block(0, 6), 0)
+    rechunker.push(_block(100, 27), 100)
+    assert [(first, data.shape[1]) for first, data in batches] == [(0, 6), (100, 10), (110, 10)]
+    rechunker.flush()
+    assert batches[-1][0] == 120 and batches[-1][1].shape[1] == 7
+
+
+def test_a_policy_needs_exactly_one_target():
+    with pytest.raises(ValueError):
+        ChunkPolicy(print)
+    with pytest.raises(ValueError):
+        ChunkPolicy(print, batch_samples=10, latency=0.1)
+
+
+def test_latency_is_rounded_to_whole_frames(client):
+    avanti_emg = client.topology.streams["avanti_emg"]
+    assert ChunkPolicy(print, latency=0.001).samples_per_batch(avanti_emg) == 27
+    assert ChunkPolicy(print, latency=0.1).samples_per_batch(avanti_emg) == 7 * 27
+
+
+def test_callbacks_receive_batches_per_stream(client):
+    received = []
+    callback = lambda name, data, first: received.append((name, data.shape, first))
+    client.add_chunk_callback(callback, batch_samples=20)
+    [policy] = client._chunk_callbacks
+    policy("avanti_emg", np.zeros((16, 27), dtype=np.float32), 0)
+    policy("avanti_aux", np.zeros((144, 2), dtype=np.float32), 0)
+    assert received == [("avanti_emg", (16, 20), 0)]
+    client.remove_chunk_callback(callback)
+    assert client._chunk_callbacks == []
+    assert sorted(received[1:]) == [("avanti_aux", (144, 2), 0), ("avanti_emg", (16, 7), 20)]
@@ -0,0 +1,31 @@
+import numpy as np
+import pytest
+
+from pytrigno.clock import DriftEstimator
+
+
+def test_drift_is_estimated_from_the_earliest_arrivals():
+    rate, n_samples = 2000., 27
+    # The device clock runs 200 ppm slow, chunks arrive 1 to 30 ms late.
+    period = 1.0002 / rate
+    delays = np.random.default_rng(2).uniform(1e-3, 30e-3, 5000)
+    clock = DriftEstimator(rate)
+    for k, delay in enumerate(delays):
+        end = (k + 1) * n_samples
+        clock.add(end, 100. + end * period + delay)
+
+    assert clock.drift == pytest.approx(2e-4, abs=2e-5)
+    # Production times are recovered within the smallest delay, not the mean one.
+    assert float(clock.to_host_time(5000 * n_samples)) == pytest.approx(100. + 5000 * n_samples * period, abs=2e-3)
+
+
+def test_disarm_keeps_drift_estimators(client):
+    rate = client.topology.streams["avanti_emg"].rate
+    clock = client.clocks["avanti_emg"] = DriftEstimator(rate)
+    for k in range(100):
+        clock.add((k + 1) * 27, 10. + (k + 1) * 27 / rate)
+    client.arm_trigger(pre_trigger=0.1)
+    client.disarm_trigger()
+
+    assert client.clocks["avanti_emg"] is clock
+    assert abs(float(client.get_host_time("avanti_emg", 27)) - (10. + 27 / rate)) < 1e-3
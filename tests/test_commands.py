@@ -0,0 +1,31 @@
+import pytest
+
+
+def test_send_commands_splits_the_answers_of_a_batch(client, command_socket):
+    command_socket.segment = 7
+    responses = client.send_commands(["SENSOR 1 TYPE?", "SENSOR 4 MODE?", "SENSOR 3 PAIRED?", "MAX SAMPLES EMG"])
+    assert responses == ["O", "362", "NO", "27"]
+
+
+def test_an_unanswered_command_of_a_batch_is_none(client, command_socket):
+    command_socket.mute.add("BASE FIRMWARE?")
+    assert client.send_commands(["SENSOR 2 MODE?", "BASE FIRMWARE?"]) == ["8", None]
+
+
+def test_a_late_answer_is_drained_before_a_batch(client, command_socket):
+    command_socket.unread = b"OK\r\n\r\n"
+    assert client.send_commands(["SENSOR 6 TYPE?"]) == ["A"]
+
+
+def test_configure_updates_the_changed_sensors_only(client, command_socket, sensors, monkeypatch):
+    monkeypatch.setitem(sensors, 4, dict(sensors[4], MODE="363", AUXCHANNELCOUNT="4"))
+    assert client.configure(modes={4: 363}, pair=[6]) == [4]
+    first = command_socket.sent.index("SENSOR 6 PAIR")
+    assert command_socket.sent[first + 1] == "SENSOR 4 SETMODE 363"
+    assert client.topology.sensors[3].nb_aux_channels == 4
+    assert client.sensors[3].aux_buffer.shape[0] == 4
+
+
+def test_configure_rejects_a_mode_the_sensor_did_not_take(client):
+    with pytest.raises(RuntimeError, match="did not switch"):
+        client.configure(modes={4: 363})
@@ -0,0 +1,29 @@
+def test_configure_keeps_the_planned_buffers(make_client, sensors, monkeypatch, tmp_path):
+    client = make_client(history=2., spill=str(tmp_path))
+    client.subscribe(sensors=[1, 4], aux=False)
+    emg_chunks = client.sensors[3].emg_buffer.shape[2]
+    assert emg_chunks != client.buffer_size
+    untouched = client.sensors[0].emg_buffer
+
+    monkeypatch.setitem(sensors, 4, dict(sensors[4], MODE="363", AUXCHANNELCOUNT="4"))
+    assert client.configure(modes={4: 363}) == [4]
+
+    sensor = client.sensors[3]
+    assert sensor.nb_aux_channels == 4
+    assert sensor.emg_buffer.shape[2] == emg_chunks
+    assert sensor.aux_subscribed is False and sensor.aux_buffer.shape[2] == 0
+    assert sensor.emg_spill is not None
+    assert client.sensors[0].emg_buffer is untouched
+
+
+def test_configure_stays_within_the_memory_budget(make_client, sensors, monkeypatch):
+    client = make_client(memory_budget=2_000_000)
+    before = {sensor.index: sensor.aux_capacity for sensor in client.sensors}
+
+    monkeypatch.setitem(sensors, 4, dict(sensors[4], MODE="363", AUXCHANNELCOUNT="9"))
+    assert client.configure(modes={4: 363}) == [4]
+
+    assert client.sensors[3].nb_aux_channels == 9
+    assert client.get_memory_footprint()["bytes"] <= 2_000_000
+    # The other sensors gave up part of their share to the new channels.
+    assert client.sensors[0].aux_capacity < before[1]
@@ -0,0 +1,82 @@
+import numpy as np
+import pytest
+
+from pytrigno.history import plan_history, SpillFile, CHUNK_START_BYTES
+
+# (n_channels, samples per chunk, rate) of an Avanti EMG and an IMU aux signal
+BUFFERS = {"emg": (1, 27, 2000.), "aux": (9, 2, 148.)}
+
+
+def _nbytes(capacities, itemsize=4):
+    return sum((n_channels * n_samples * itemsize + CHUNK_START_BYTES) * capacities[key]
+               for key, (n_channels, n_samples, _) in BUFFERS.items())
+
+
+def test_default_capacity_without_history_or_budget():
+    assert plan_history(BUFFERS, 4, default_chunks=100) == {"emg": 100, "aux": 100}
+
+
+def test_history_is_covered_by_every_buffer():
+    capacities = plan_history(BUFFERS, 4, history=1.)
+    # 74.07 EMG chunks are rounded up, 74 aux chunks are exact
+    assert capacities == {"emg": 75, "aux": 74}
+
+
+@pytest.mark.parametrize("memory_budget", [10_000, 123_457, 2_000_000])
+def test_buffers_fit_in_the_budget(memory_budget):
+    capacities = plan_history(BUFFERS, 4, memory_budget=memory_budget)
+    assert _nbytes(capacities) <= memory_budget
+    # One more chunk of each buffer would exceed it
+    assert _nbytes({key: chunks + 1 for key, chunks in capacities.items()}) > memory_budget
+
+
+def test_the_budget_caps_the_history():
+    assert plan_history(BUFFERS, 4, history=1., memory_budget=10 ** 9) == {"emg": 75, "aux": 74}
+    assert plan_history(BUFFERS, 4, history=100., memory_budget=10_000) == plan_history(
+        BUFFERS, 4, memory_budget=10_000)
+
+
+def test_every_buffer_keeps_one_chunk():
+    assert plan_history(BUFFERS, 4, memory_budget=1) == {"emg": 1, "aux": 1}
+
+
+def test_client_buffers_fit_in_the_budget(make_client):
+    client = make_client(memory_budget=2_000_000)
+    footprint = client.get_memory_footprint()
+    assert 1_900_000 < footprint["bytes"] <= 2_000_000
+    seconds = {signal["seconds"] for sensor in footprint["sensors"].values() for signal in sensor.values()}
+    assert max(seconds) - min(seconds) < 0.1
+
+
+def test_evicted_chunks_are_spilled(make_client, tmp_path):
+    client = make_client(history=0.01, spill=str(tmp_path))
+    sensor = client.sensors[0]
+    assert sensor.emg_capacity == 1
+    for n_chunk in range(3):
+        sensor.update_emg_buffer(np.full((1, 27), n_chunk), n_chunk * 27)
+    spilled, frame_numbers = sensor.get_spilled_emg()
+    np.testing.assert_array_equal(spilled, np.repeat([[0., 1.]], 27, axis=1))
+    np.testing.assert_array_equal(frame_numbers, np.arange(54))
+    assert client.get_memory_footprint()["spilled_bytes"] == 54 * 4
+
+
+def test_empty_spill_files_are_removed(tmp_path):
+    spill = SpillFile(str(tmp_path / "spill.raw"), 2)
+    assert spill.read().shape == (2, 0)
+    spill.close()
+    assert not list(tmp_path.iterdir())
+
+
+def test_spill_files_are_never_overwritten(make_client, tmp_path):
+    client = make_client(history=0.01, spill=str(tmp_path))
+    sensor = client.sensors[0]
+    for n_chunk in range(2):
+        sensor.update_emg_buffer(np.full((1, 27), n_chunk), n_chunk * 27)
+    first = sensor.emg_spill.path
+    # Reallocating the buffers starts new files.
+    client.subscribe(sensors=[1])
+    sensor.update_emg_buffer(np.full((1, 27), 5.), 0)
+    sensor.update_emg_buffer(np.full((1, 27), 6.), 27)
+    assert sensor.emg_spill.path != first
+    np.testing.assert_array_equal(np.fromfile(first, dtype=np.float32), np.zeros(27))
+    np.testing.assert_array_equal(sensor.get_spilled_emg()[0], np.full((1, 27), 5.))
@@ -0,0 +1,97 @@
+import socket
+
+import numpy as np
+import pytest
+
+from pytrigno.integrity import FrameValidator, EMG_RANGE
+
+CHUNK_BYTES = 27 * 16 * 4
+
+
+def _frames(n_chunks, n_channels=16, n_samples=27):
+    rng = np.random.default_rng(0)
+    return rng.uniform(-EMG_RANGE, EMG_RANGE, (n_chunks * n_samples, n_channels)).astype('<f4')
+
+
+def test_device_frames_are_valid():
+    validator = FrameValidator(16, EMG_RANGE)
+    assert validator.is_valid(_frames(1).tobytes())
+    assert validator.stats["invalid_chunks"] == 0
+
+
+def test_corrupted_words_on_a_word_boundary_are_not_shifted():
+    validator = FrameValidator(16, EMG_RANGE)
+    frames = _frames(1)
+    frames[3, 5] = np.nan
+    frames[7, 2] = 1.
+    packet = frames.tobytes()
+    assert not validator.is_valid(packet)
+    assert validator.find_shift(packet) == 0
+    assert validator.stats["invalid_chunks"] == 1
+
+
+@pytest.mark.parametrize("shift", [1, 2, 3])
+def test_find_shift_drops_a_partial_word(shift):
+    validator = FrameValidator(16, EMG_RANGE)
+    packet = b"\x7f" * shift + _frames(1).tobytes()[:CHUNK_BYTES - shift]
+    assert not validator.is_valid(packet)
+    assert validator.find_shift(packet) == shift
+
+
+def test_read_realigns_a_shifted_stream(client):
+    validator = FrameValidator(16, EMG_RANGE, confirmations=3)
+    frames = _frames(4)
+    sender, receiver = socket.socketpair()
+    with sender, receiver:
+        sender.sendall(b"\x7f\x7f" + frames.tobytes())
+        chunks = [client.read(receiver, CHUNK_BYTES, 16, validator) for _ in range(4)]
+    # The third chunk shifted the same way confirms the shift.
+    np.testing.assert_array_equal(chunks[2], frames[54:81].T)
+    np.testing.assert_array_equal(chunks[3], frames[81:].T)
+    assert validator.stats["rejected_chunks"] == 2
+    assert validator.stats["misalignments"] == 1
+    assert validator.stats["dropped_bytes"] == 2
+
+
+def test_a_single_bad_chunk_does_not_realign(client):
+    validator = FrameValidator(16, EMG_RANGE)
+    validator.set_idle_channels(range(5))
+    frames = _frames(3)
+    frames[:, 5:] = 0
+    # A transient on an idle channel of the first chunk only
+    frames[10, 9] = 1e-3
+    sender, receiver = socket.socketpair()
+    with sender, receiver:
+        sender.sendall(frames.tobytes())
+        chunks = [client.read(receiver, CHUNK_BYTES, 16, validator) for _ in range(3)]
+    np.testing.assert_array_equal(np.hstack(chunks), frames.T)
+    assert validator.stats["invalid_chunks"] == 1
+    assert validator.stats["rejected_chunks"] == 1
+    assert validator.stats["misalignments"] == 0
+
+
+def test_shifts_must_agree_on_consecutive_chunks():
+    validator = FrameValidator(16, EMG_RANGE, confirmations=2)
+    assert not validator.confirm_shift(4)
+    assert not validator.confirm_shift(8)
+    assert validator.confirm_shift(8)
+    assert not validator.confirm_shift(0)
+    assert validator.stats["rejected_chunks"] == 3
+
+
+def test_whole_word_shift_is_found_from_the_idle_channels():
+    validator = FrameValidator(16, EMG_RANGE)
+    validator.set_idle_channels(range(5))
+    frames = _frames(2)
+    frames[:, 5:] = 0
+    assert validator.is_valid(frames.tobytes())
+    # Three words of the previous frame ahead of the chunk: the idle zeros land on channels 8 to 15 and 0 to 2.
+    packet = frames.tobytes()[CHUNK_BYTES - 12:2 * CHUNK_BYTES - 12]
+    assert not validator.is_valid(packet)
+    assert validator.find_shift(packet) == 12
+
+
+def test_every_channel_idle_has_no_pattern():
+    validator = FrameValidator(16, EMG_RANGE)
+    validator.set_idle_channels([])
+    assert validator.stats["idle_channels"] == 0
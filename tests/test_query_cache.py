@@ -0,0 +1,51 @@
+from pytrigno.query_cache import QueryCache
+
+
+def _cache(*queries):
+    cache = QueryCache()
+    for query in queries:
+        cache.store(query, "answer")
+    return cache
+
+
+def test_static_queries_are_answered_from_memory():
+    cache = _cache("SENSOR 1 TYPE?", "BASE SERIAL?", "SENSOR 1 SETMODE 40", "START")
+    assert cache.lookup("SENSOR 1 TYPE?") == "answer"
+    assert cache.lookup("SENSOR 1 SETMODE 40") is None
+    assert cache.lookup("START") is None
+    assert cache.stats == {"hits": 1, "misses": 0, "invalidations": 0, "entries": 2}
+
+
+def test_setmode_drops_the_sensor_start_indices_and_frame_shape():
+    cache = _cache("SENSOR 2 MODE?", "SENSOR 2 TYPE?", "SENSOR 3 STARTINDEX?", "SENSOR 3 AUXSTARTINDEX?",
+                   "SENSOR 3 TYPE?", "MAX SAMPLES EMG", "BASE SERIAL?")
+    assert cache.is_mutating("SENSOR 2 SETMODE 8")
+    cache.invalidate_for("SENSOR 2 SETMODE 8")
+    kept = [query for query in ("SENSOR 2 MODE?", "SENSOR 2 TYPE?", "SENSOR 3 STARTINDEX?",
+                                "SENSOR 3 AUXSTARTINDEX?", "SENSOR 3 TYPE?", "MAX SAMPLES EMG", "BASE SERIAL?")
+            if cache.lookup(query) is not None]
+    assert kept == ["SENSOR 3 TYPE?", "BASE SERIAL?"]
+    assert cache.invalidations == 5
+
+
+def test_settings_drop_their_own_query_and_dependents():
+    cache = _cache("UPSAMPLING?", "MAX SAMPLES AUX", "ENDIANNESS?", "TRIGGER?")
+    assert not cache.is_mutating("UPSAMPLING?")
+    cache.invalidate_for("UPSAMPLE ON")
+    assert cache.lookup("UPSAMPLING?") is None and cache.lookup("MAX SAMPLES AUX") is None
+    assert cache.lookup("ENDIANNESS?") == "answer" and cache.lookup("TRIGGER?") == "answer"
+
+
+def test_batches_only_send_the_missing_queries(client, command_socket):
+    command_socket.sent.clear()
+    assert client.send_commands(["SENSOR 1 TYPE?", "BASE SERIAL?", "SENSOR 4 MODE?"]) == ["O", "OK", "362"]
+    assert command_socket.sent == ["BASE SERIAL?"]
+
+
+def test_a_query_following_setmode_in_a_batch_is_sent(client, command_socket):
+    command_socket.sent.clear()
+    client.send_commands(["SENSOR 1 SETMODE 40", "SENSOR 1 MODE?", "SENSOR 2 MODE?"])
+    assert command_socket.sent == ["SENSOR 1 SETMODE 40", "SENSOR 1 MODE?", "SENSOR 2 MODE?"]
+    command_socket.sent.clear()
+    client.send_commands(["SENSOR 1 MODE?", "SENSOR 1 STARTINDEX?"])
+    assert command_socket.sent == ["SENSOR 1 STARTINDEX?"]
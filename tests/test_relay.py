@@ -0,0 +1,61 @@
+import json
+import socket
+import threading
+
+import numpy as np
+
+from pytrigno.relay import RelayServer, RelayClient, _Subscriber, pack_frame, HEADER, MAGIC, HELLO, EMG, AUX
+
+
+def test_frames_carry_the_block_after_a_fixed_header():
+    data = np.arange(6, dtype=np.float32).reshape((2, 3))
+    frame = pack_frame(AUX, 4, 2 ** 32 + 5, 1234, data)
+    assert HEADER.size == 22 and len(frame) == 22 + 24
+    assert HEADER.unpack(frame[:22]) == (MAGIC, AUX, 4, 5, 1234, 2, 24)
+    np.testing.assert_array_equal(np.frombuffer(frame[22:], '<f4').reshape((2, 3)), data)
+
+
+def test_subscribers_receive_the_description_then_every_sensor_block(client):
+    with RelayServer(client, ("127.0.0.1", 0)) as server:
+        with RelayClient(server.address, timeout=5) as subscriber:
+            assert [sensor["index"] for sensor in subscriber.sensors] == [1, 2, 4, 6]
+            data = np.arange(16 * 27, dtype=np.float32).reshape((16, 27))
+            server._broadcast("avanti_emg", data, 270)
+            frames = [subscriber.read() for _ in range(3)]
+            assert [frame[:3] for frame in frames] == [("emg", 1, 270), ("emg", 2, 270), ("emg", 4, 270)]
+            np.testing.assert_array_equal(frames[2][3], data[3:5])
+            assert subscriber.n_missed == 0
+    assert server.stats["frames"] == 3
+
+
+def test_a_subscriber_falling_behind_is_evicted(client):
+    server = RelayServer(client, ("127.0.0.1", 0), queue_size=2)
+    local, remote = socket.socketpair()
+    # Never started: nothing sends its frames, as if its connection was stalled.
+    stalled = _Subscriber(local, server.queue_size)
+    server.subscribers.append(stalled)
+    data = np.zeros((144, 2), dtype=np.float32)
+    for count in range(0, 6, 2):
+        server._broadcast("avanti_aux", data, count)
+    assert stalled.closed
+    assert server.stats == {"subscribers": 0, "frames": 9, "evicted": 1, "queued": []}
+    remote.close()
+
+
+def test_the_client_counts_missing_frames():
+    hello = json.dumps({"sensors": []}).encode('utf-8')
+    data = np.zeros((1, 27), dtype=np.float32)
+    listener = socket.create_server(("127.0.0.1", 0))
+
+    def serve():
+        connection, _ = listener.accept()
+        with connection:
+            connection.sendall(HEADER.pack(MAGIC, HELLO, 0, 0, 0, 0, len(hello)) + hello
+                               + b"".join(pack_frame(EMG, 1, sequence, sequence * 27, data) for sequence in (0, 1, 4)))
+
+    thread = threading.Thread(target=serve)
+    thread.start()
+    with listener, RelayClient(listener.getsockname(), timeout=5) as subscriber:
+        assert [first_sample for _, _, first_sample, _ in subscriber] == [0, 27, 108]
+        assert subscriber.n_missed == 2
+    thread.join()
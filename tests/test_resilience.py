@@ -0,0 +1,188 @@
+import socket
+import threading
+import time
+from queue import Queue
+
+import numpy as np
+import pytest
+
+from pytrigno import sdk_client
+
+
+class _FlakyConnector:
+    """_connect_to_socket failing a number of times before returning a connection."""
+
+    def __init__(self, n_failures):
+        self.n_failures = n_failures
+        self.ports = []
+
+    def __call__(self, port):
+        self.ports.append(port)
+        if len(self.ports) <= self.n_failures:
+            raise ConnectionRefusedError
+        return f"socket {len(self.ports)}"
+
+
+class _ScriptedSocket:
+    """Data socket replaying a script of payloads and exceptions, then calling ``on_end``."""
+
+    def __init__(self, script, on_end):
+        self.script = list(script)
+        self.on_end = on_end
+        self.pending = b""
+
+    def _next(self):
+        if not self.pending:
+            if not self.script:
+                self.on_end()
+                raise ConnectionResetError
+            step = self.script.pop(0)
+            if isinstance(step, Exception):
+                raise step
+            self.pending = step
+        return self.pending
+
+    def recv(self, n_bytes):
+        data = self._next()[:n_bytes]
+        self.pending = self.pending[len(data):]
+        return data
+
+    def recv_into(self, buffer, n_bytes=0):
+        data = self.recv(n_bytes or len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    delays = []
+    monkeypatch.setattr(sdk_client.time, "sleep", delays.append)
+    return delays
+
+
+def test_recover_stream_backs_off_until_reconnected(client, monkeypatch, sleeps):
+    connector = _FlakyConnector(n_failures=3)
+    monkeypatch.setattr(client, "_connect_to_socket", connector)
+    monkeypatch.setattr(client, "_recover_command", lambda session: False)
+    client.all_socket = {"avanti_emg": _ScriptedSocket([], None)}
+    client._session = session = object()
+
+    assert client._recover_stream("avanti_emg", session)
+
+    assert client.all_socket["avanti_emg"] == "socket 4"
+    assert connector.ports == [50043] * 4
+    assert sleeps == [0.1, 0.2, 0.4]
+    assert client.reconnections["avanti_emg"] == 1
+
+
+def test_recover_stream_gives_up_after_max_reconnect(client, monkeypatch, sleeps):
+    client.max_reconnect = 3
+    monkeypatch.setattr(client, "_connect_to_socket", _FlakyConnector(n_failures=10))
+    monkeypatch.setattr(client, "_recover_command", lambda session: False)
+    client.all_socket = {"legacy_aux": _ScriptedSocket([], None)}
+    client._session = session = object()
+
+    with pytest.raises(ConnectionRefusedError):
+        client._recover_stream("legacy_aux", session)
+    assert sleeps == [0.1, 0.2]
+    assert client.reconnections["legacy_aux"] == 0
+
+
+def test_recover_stream_stops_with_the_session(client, monkeypatch):
+    connector = _FlakyConnector(n_failures=10)
+    monkeypatch.setattr(client, "_connect_to_socket", connector)
+    monkeypatch.setattr(client, "_recover_command", lambda session: False)
+    client.all_socket = {"avanti_emg": _ScriptedSocket([], None)}
+    client._session = session = object()
+
+    def sleep(delay):
+        if len(connector.ports) == 2:
+            client._session = None
+
+    monkeypatch.setattr(sdk_client.time, "sleep", sleep)
+    assert not client._recover_stream("avanti_emg", session)
+    assert connector.ports == [50043] * 2
+    assert client.reconnections["avanti_emg"] == 0
+
+
+def test_a_connection_made_after_the_session_ended_is_closed(client, monkeypatch):
+    reconnected = _ScriptedSocket([], None)
+    reconnected.close = lambda: setattr(reconnected, "closed", True)
+
+    def connect(port):
+        # stop_streaming runs while the connection is being made.
+        client._session = None
+        return reconnected
+
+    monkeypatch.setattr(client, "_connect_to_socket", connect)
+    monkeypatch.setattr(client, "_recover_command", lambda session: False)
+    client.all_socket = {"avanti_emg": _ScriptedSocket([], None)}
+    client._session = session = object()
+
+    assert not client._recover_stream("avanti_emg", session)
+    assert reconnected.closed
+
+
+def test_the_command_socket_is_not_reopened_after_disconnect(client, monkeypatch):
+    session = client._session = object()
+    client.disconnect()
+    assert client._comm_socket is None
+    monkeypatch.setattr(client, "_connect_command", lambda: pytest.fail("reconnected"))
+    assert not client._recover_command(session)
+
+
+def test_a_stalled_stream_skips_the_lost_samples(client, monkeypatch):
+    name = "avanti_emg"
+    client.resilient = True
+    client._is_streaming = True
+    client._session = object()
+    chunk = np.arange(27 * 16, dtype='<f4').reshape((27, 16)) * 1e-6
+    chunk[:, client.validators[name].idle_channels] = 0
+    done = threading.Event()
+
+    def end():
+        client._is_streaming = False
+        client._session = None
+        done.set()
+
+    client.all_socket = {name: _ScriptedSocket([socket.timeout(), chunk.tobytes(), chunk.tobytes()], end)}
+    # The outage lasts at least 50 ms, i.e. 100 samples at 2 kHz.
+    monkeypatch.setattr(client, "_recover_stream", lambda name, session: time.sleep(0.05) or True)
+    monkeypatch.setattr(threading, "excepthook", lambda args: None)
+    data_queue = Queue()
+
+    client._launch_one_thread(name, data_queue, threading.Event())
+    assert done.wait(5)
+
+    [(first, n_lost)] = client.gaps[name]
+    assert first == 0 and n_lost >= 100
+    # Only the latest chunk is kept in the queue, it follows the first one after the gap.
+    assert data_queue.get_nowait()[1] == n_lost + 27
+
+
+def test_a_failing_callback_does_not_stop_the_reader(client):
+    name = "avanti_emg"
+    client._session = object()
+    chunk = np.zeros((27, 16), dtype='<f4')
+    done = threading.Event()
+
+    def end():
+        client._session = None
+        done.set()
+
+    def failing(name, data, count):
+        raise ValueError("consumer failure")
+
+    received = []
+    client.all_socket = {name: _ScriptedSocket([chunk.tobytes()] * 3, end)}
+    client.add_chunk_callback(failing)
+    client.add_chunk_callback(lambda name, data, count: received.append(count))
+    client._launch_one_thread(name, Queue(), threading.Event())
+    assert done.wait(5)
+
+    assert received == [0, 27, 54]
+    assert client.callback_errors[name] == 3
+    assert isinstance(client.last_callback_error, ValueError)
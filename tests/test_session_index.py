@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+from pytrigno.archive import ArchiveWriter, ArchiveReader
+
+RATE = 100.
+
+
+@pytest.fixture
+def reader(tmp_path):
+    """Stream recorded at 100 Hz from t=10 s, with device samples 100 to 299 lost."""
+    data = np.arange(400, dtype=np.float32).reshape((2, 200))
+    with ArchiveWriter(tmp_path / "session.ptg", chunk_samples=64) as writer:
+        writer.add_stream("sensor1_aux", 2, RATE)
+        # Declared but never fed, e.g. a sensor that sent no data
+        writer.add_stream("sensor2_aux", 3, RATE)
+        writer.write("sensor1_aux", data[:, :100], 0, 10.)
+        writer.write("sensor1_aux", data[:, 100:], 300, 13.)
+    with ArchiveReader(tmp_path / "session.ptg") as reader:
+        reader.data = data
+        yield reader
+
+
+def test_gaps_are_indexed(reader):
+    [gap] = reader.index.get_events("gap")
+    assert (gap["stream"], gap["archive_index"], gap["device_index"], gap["n_samples"]) == ("sensor1_aux", 100, 100,
+                                                                                            200)
+    assert gap["time"] == pytest.approx(11.)
+
+
+def test_query_by_time(reader):
+    window = reader.query("sensor1_aux", 10.5, 13.5)
+    assert (window.start, window.stop) == (50, 150)
+    np.testing.assert_array_equal(np.asarray(window), reader.data[:, 50:150])
+    np.testing.assert_allclose(window.times[[0, 49, 50]], [10.5, 10.99, 13.])
+    # A time inside the gap maps to the first sample after it.
+    assert reader.query("sensor1_aux", 12., None).start == 100
+    assert len(reader.query("sensor1_aux")) == 200
+
+
+def test_query_by_device_sample(reader):
+    window = reader.query_samples("sensor1_aux", 50, 350, channels=[1])
+    assert window.shape == (1, 100)
+    np.testing.assert_array_equal(window.sample_indices, np.r_[50:100, 300:350])
+    np.testing.assert_array_equal(window.load(), reader.data[[1], 50:150])
+    assert len(reader.query_samples("sensor1_aux", 150, 250)) == 0
+
+
+def test_a_stream_without_data_gives_empty_slices(reader):
+    for window in (reader.query("sensor2_aux", 10.5, 13.5), reader.query("sensor2_aux"),
+                   reader.query_samples("sensor2_aux", 50, 350)):
+        assert window.shape == (3, 0)
+        assert np.asarray(window).shape == (3, 0)
+        assert len(window.times) == 0 and len(window.sample_indices) == 0
+    assert reader.index.archive_index_of_device("sensor2_aux", 100) == 0
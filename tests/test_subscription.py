@@ -0,0 +1,48 @@
+import numpy as np
+
+from pytrigno.clock import DriftEstimator
+from pytrigno.sdk_client import TrignoSDKClient
+
+
+def test_sensors_are_bound_to_the_client(client):
+    sensor = client.sensors[0]
+    assert all(sensor.trigno_box is client for sensor in client.sensors)
+    client.clocks[sensor.layout.emg_stream] = DriftEstimator(sensor.layout.emg_rate)
+    sensor.update_emg_buffer(np.zeros((1, sensor.max_emg_samples)), 0)
+    assert sensor.get_emg_times().shape == (sensor.max_emg_samples,)
+
+
+def test_only_the_ports_of_subscribed_sensors_are_connected(client, monkeypatch):
+    ports = []
+    monkeypatch.setattr(client, "_connect_to_socket", lambda port: ports.append(port) or port)
+    client.subscribe(sensors=[6])
+    TrignoSDKClient.initiate_data_connection(client)
+    assert sorted(client.all_socket) == ["legacy_aux", "legacy_emg"]
+    assert sorted(ports) == [50041, 50042]
+    assert client.avanti_emg_socket is None
+
+
+def test_a_required_stream_without_reader_thread_is_not_running(client, monkeypatch):
+    monkeypatch.setattr(client, "_launch_one_thread", lambda name, data_queue, event: None)
+    client.subscribe(sensors=[1])
+    client.start_streaming()
+    try:
+        assert client.is_stream_running("avanti_emg")
+        client.require_streams("legacy_aux")
+        assert not client.is_stream_running("legacy_aux")
+    finally:
+        client.stop_streaming()
+    client.start_streaming()
+    try:
+        assert client.is_stream_running("legacy_aux")
+    finally:
+        client.stop_streaming()
+
+
+def test_unsubscribed_signals_have_no_last_chunk(client):
+    client.subscribe(sensors=[1], aux=False)
+    subscribed, unsubscribed = client.sensors[0], client.sensors[1]
+    assert subscribed.last_emg_chunck.shape == (1, subscribed.max_emg_samples)
+    assert subscribed.last_aux_chunck is None
+    assert unsubscribed.last_emg_chunck is None and unsubscribed.last_aux_chunck is None
+    assert client.sensors[2].last_emg_chunck is None
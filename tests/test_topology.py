@@ -0,0 +1,15 @@
+from pytrigno.topology import Type
+
+
+def test_unknown_sensor_types_are_opaque_avanti_channels(make_client, sensors, monkeypatch):
+    monkeypatch.setitem(sensors, 3, {"TYPE": "X", "MODE": "7", "EMGCHANNELCOUNT": "1", "AUXCHANNELCOUNT": "9",
+                                     "STARTINDEX": "3", "AUXSTARTINDEX": "19"})
+    client = make_client()
+    layout = client.topology.sensors[2]
+    assert layout.type is Type.Unknown
+    assert (layout.emg_stream, layout.emg_slice) == ("avanti_emg", slice(2, 3))
+    assert (layout.aux_stream, layout.aux_slice) == ("avanti_aux", slice(18, 27))
+    assert client.sensors[2].last_aux_chunck.shape == (9, 2)
+    # Its 9 aux channels are not taken for an IMU unless asked for.
+    assert client.enable_orientation().sensor_indices == [1, 2]
+    assert client.enable_orientation(sensors=[3]).sensor_indices == [3]
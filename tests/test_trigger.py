@@ -0,0 +1,63 @@
+import numpy as np
+
+from pytrigno.archive import ArchiveReader
+from pytrigno.clock import DriftEstimator
+
+
+def test_disarm_keeps_callbacks_and_recording(client, tmp_path):
+    def callback(name, data, count):
+        pass
+
+    client.add_chunk_callback(callback)
+    writer = client.record(tmp_path / "session.ptg")
+    client.arm_trigger(pre_trigger=0.1)
+    client.disarm_trigger()
+
+    assert client.trigger_gates == {}
+    assert callback in client._chunk_callbacks
+    assert client._recorder is not None and client._recorder[0] is writer
+    client.stop_recording()
+    with ArchiveReader(tmp_path / "session.ptg") as reader:
+        assert "sensor1_emg" in reader.streams
+
+
+def _feed(client, name, frames):
+    """Pass frames of a stream through its trigger gate and the chunk callbacks, as the reader thread does."""
+    stream = client.topology.streams[name]
+    gate = client.trigger_gates[name]
+    for frame in frames:
+        count = frame * stream.n_samples
+        packet = bytearray(np.full((stream.n_samples, stream.n_channels), 1e-3, dtype='<f4').tobytes())
+        client.clocks[name].add(count + stream.n_samples, 10. + (count + stream.n_samples) / stream.rate)
+        if gate.admit(packet, count):
+            data = client.decode(packet, stream.n_channels, client._decoded_channels[name])
+            for callback in client._chunk_callbacks:
+                callback(name, data, count)
+
+
+def test_stop_recording_indexes_edges_of_the_recording_only(client, tmp_path):
+    name = "avanti_emg"
+    client.clocks[name] = DriftEstimator(client.topology.streams[name].rate)
+    client.arm_trigger(pre_trigger=0.1)
+    # A trigger window before the recording starts
+    client.trigger_edge("START")
+    _feed(client, name, range(0, 5))
+    client.trigger_edge("STOP")
+    _feed(client, name, range(5, 10))
+
+    client.record(tmp_path / "session.ptg")
+    client.trigger_edge("START")
+    _feed(client, name, range(20, 25))
+    client.trigger_edge("STOP")
+    _feed(client, name, range(25, 30))
+    client.trigger_edge("START")
+    _feed(client, name, range(40, 45))
+    client.stop_recording()
+    client.disarm_trigger()
+
+    with ArchiveReader(tmp_path / "session.ptg") as reader:
+        edges = [(event["edge"], event["device_index"]) for event in reader.index.get_events("trigger", "sensor1_emg")]
+        assert edges == [("START", 20 * 27), ("STOP", 25 * 27), ("START", 40 * 27)]
+        # The idle span between the windows is not lost data.
+        assert reader.index.get_events("gap") == []
+        assert reader.streams["sensor1_emg"].n_samples == 10 * 27